@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+"""
+Linux Distro Downloader - Headless command line interface
+
+Downloads and verifies ISOs without a display. Progress is written to
+stdout as JSON lines so the tool can be driven from cron or Ansible. No
+GUI modules are imported.
+
+Usage:
+    python cli.py list
+    python cli.py fetch "Ubuntu" "Server (LTS)" --dest /srv/isos
+    python cli.py fetch --all --dest /srv/isos
+    python cli.py fetch --manifest isos.json --dest /srv/isos
+    python cli.py fetch --resume
+    python cli.py --limit 2M fetch --all --dest /srv/isos
+    python cli.py verify /srv/isos
+    python cli.py verify /srv/isos --repair
+    python cli.py delta "Ubuntu" "Server (LTS)" --from old.iso --dest /srv/isos
+    python cli.py blockmap /srv/isos/ubuntu.iso
+    python cli.py mirrors "openSUSE" "Leap"
+    python cli.py history
+    python cli.py sync /srv/isos --dry-run
+    python cli.py sync /srv/isos --prune
+    python cli.py serve --port 8780
+    python cli.py --mirror-server http://isobox:8780 fetch --all --dest /srv/isos
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.data_manager import DistroDataManager
+from utils.delta import DEFAULT_BLOCK_SIZE, create_block_map, delta_update, fetch_block_map
+from utils.download_queue import (DownloadQueue, QueueItem, COMPLETED, DEFAULT_MAX_CONCURRENT,
+                                  DEFAULT_PER_HOST_LIMIT)
+from utils.downloader import (DEFAULT_SEGMENTS, LOW_SPEED_LIMIT, LOW_SPEED_TIME, RETRY_BUDGET, DownloadJob,
+                              RetryPolicy, verify_checksum)
+from utils.http_client import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, configure, get_client
+from utils.iso_store import DEFAULT_STORE_DIR, DEFAULT_MAX_STORE_SIZE, ISOStore
+from utils.journal import DEFAULT_JOURNAL_FILE, HISTORY_LIMIT, DownloadJournal
+from utils.library import FAILED, MISMATCH, OK, verify_library
+from utils.manifests import ManifestStore
+from utils.mirror_ranking import MirrorRanker, estimated_time
+from utils.mirror_server import DEFAULT_BIND, DEFAULT_PORT, MirrorServer, mirror_url
+from utils.part_state import remove_partial
+from utils.rate_limiter import Schedule, format_rate, get_limiter, parse_rate
+from utils.sync import DEFAULT_SYNC_WORKERS, SyncState, execute_sync, plan_sync
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_FILE = Path(__file__).parent / 'distro_data.json'
+PROGRESS_INTERVAL = 1.0  # Seconds between progress events
+
+class EventWriter:
+    """Write machine-readable events to a stream as JSON lines"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields: Any):
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+def load_manifest(path: str) -> List[Tuple[str, str]]:
+    """Read a manifest: a JSON list of {"distro": ..., "edition": ...} objects"""
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError("Manifest must be a JSON list")
+    return [(entry['distro'], entry['edition']) for entry in entries]
+
+def resolve_targets(manager: DistroDataManager, args: argparse.Namespace) -> List[Tuple[str, str]]:
+    """Work out which (distro, edition) pairs a fetch command refers to"""
+    if args.all:
+        return [(distro, edition) for distro in manager.get_distributions()
+                for edition in manager.get_editions(distro)]
+    if args.manifest:
+        return load_manifest(args.manifest)
+    if args.distro and args.edition:
+        return [(args.distro, args.edition)]
+    if args.distro:
+        return [(args.distro, edition) for edition in manager.get_editions(args.distro)]
+    if getattr(args, 'resume', False):
+        return []
+    raise ValueError("Specify a distribution (and edition), --all or --manifest")
+
+def read_controls(stream, events: EventWriter):
+    """Apply ``limit RATE`` and ``schedule SPEC`` commands read line by line while downloads run"""
+    limiter = get_limiter()
+    for line in stream:
+        command, _, value = line.strip().partition(' ')
+        if not command:
+            continue
+        try:
+            if command == 'limit':
+                limiter.set_rate(parse_rate(value))
+            elif command == 'schedule':
+                limiter.set_schedule(Schedule.parse(value) if value.strip() else None)
+            else:
+                raise ValueError(f"Unknown command: {command!r}")
+        except ValueError as e:
+            events.emit('error', message=str(e))
+            continue
+        events.emit('limit', rate=limiter.base_rate, current=limiter.rate, schedule=limiter.schedule is not None)
+
+def report_progress(queue: DownloadQueue, events: EventWriter):
+    """Emit a progress event for every running download"""
+    for item in queue.active_items:
+        progress = item.progress
+        progress.sample()
+        events.emit('progress', id=item.id, distro=item.distro, edition=item.edition,
+                    downloaded=progress.downloaded, total=progress.total_size,
+                    percent=round(progress.progress_percent, 1), speed_mbps=round(progress.speed_mbps, 2),
+                    eta=round(progress.eta_seconds) if progress.eta_seconds is not None else None)
+
+def open_store(args: argparse.Namespace) -> Optional[ISOStore]:
+    """Open the ISO store unless disabled"""
+    if args.no_store:
+        return None
+    return ISOStore(args.store, max_size=int(args.store_max_gb * 1024 ** 3))
+
+def open_manifests(args: argparse.Namespace) -> Optional[ManifestStore]:
+    """Open the piece manifests kept next to the ISO store unless disabled"""
+    if args.no_piece_hashes:
+        return None
+    return ManifestStore(os.path.join(args.store, 'manifests'))
+
+def open_journal(args: argparse.Namespace) -> Optional[DownloadJournal]:
+    """Open the download journal unless disabled"""
+    if args.no_journal:
+        return None
+    try:
+        return DownloadJournal(args.journal)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        logger.warning(f"Not recording downloads, the journal {args.journal} cannot be opened: {e}")
+        return None
+
+def preferred_mirrors(args: argparse.Namespace, item: QueueItem) -> List[str]:
+    """Get the URL of an item's ISO on the mirror server given with --mirror-server, if any"""
+    return [mirror_url(args.mirror_server, item.checksum, item.filename)] if args.mirror_server else []
+
+def cmd_list(manager: DistroDataManager, args: argparse.Namespace, events: EventWriter) -> int:
+    """List every edition in the catalog"""
+    for distro in manager.get_distributions():
+        for edition in manager.get_editions(distro):
+            info = manager.get_download_info(distro, edition)
+            events.emit('edition', distro=distro, edition=edition, filename=info['filename'],
+                        url=info['url'], mirrors=info['mirrors'], checksum=info['checksum'])
+    return 0
+
+def cmd_fetch(manager: DistroDataManager, args: argparse.Namespace, events: EventWriter) -> int:
+    """Download and verify one or more editions"""
+    try:
+        targets = resolve_targets(manager, args)
+    except (ValueError, KeyError, OSError) as e:
+        events.emit('error', message=str(e))
+        return 2
+
+    dest = os.path.abspath(args.dest)
+    os.makedirs(dest, exist_ok=True)
+    store = open_store(args)
+    manifests = open_manifests(args)
+    journal = open_journal(args)
+    ranker = None if args.no_mirror_ranking else MirrorRanker()
+    if args.control:
+        threading.Thread(target=read_controls, args=(sys.stdin, events), daemon=True).start()
+
+    def run(item: QueueItem) -> bool:
+        events.emit('started', id=item.id, distro=item.distro, edition=item.edition, url=item.url)
+        # An identical ISO kept locally needs no network I/O at all
+        method = store.provision(item.filepath, item.checksum) if store else None
+        if method:
+            events.emit('provisioned', id=item.id, distro=item.distro, edition=item.edition,
+                        file=item.filepath, method=method)
+            return True
+
+        # Stalls, retries and failovers are reported as they happen
+        item.retry_policy = RetryPolicy(budget=args.retries, low_speed_limit=args.low_speed_limit * 1024,
+                                        low_speed_time=args.low_speed_time)
+        item.on_event = lambda event, fields: events.emit(event, id=item.id, **fields)
+        item.manifests = manifests
+        item.ranker = ranker
+        item.preferred = preferred_mirrors(args, item)
+        hasher = item.prepare()
+        # An existing copy with recorded piece hashes only has its bad pieces fetched again
+        if item.salvage():
+            if store:
+                store.add(item.filepath, item.checksum)
+            return True
+        if not item.download(hasher):
+            if not item.cancelled:
+                item.error = item.error or "Download failed"
+            return False
+        # Corrupt pieces are fetched again where the edition has piece hashes
+        if not item.verify(hasher):
+            item.error = "Checksum verification failed"
+            return False
+        if store:
+            store.add(item.filepath, item.checksum)
+        return True
+
+    announced = set()
+
+    def on_change(item: QueueItem):
+        if item.id not in announced:
+            announced.add(item.id)
+            events.emit('queued', id=item.id, distro=item.distro, edition=item.edition, file=item.filepath)
+        if item.finished:
+            events.emit(item.state, id=item.id, distro=item.distro, edition=item.edition,
+                        file=item.filepath, error=item.error or None)
+
+    queue = DownloadQueue(run, max_concurrent=args.concurrency, per_host_limit=args.per_host,
+                          on_change=on_change, journal=journal)
+
+    results = []
+    for distro, edition in targets:
+        info = manager.get_download_info(distro, edition)
+        if info is None:
+            events.emit('error', distro=distro, edition=edition, message="Unknown distribution or edition")
+            results.append(False)
+            continue
+
+        filepath = os.path.join(dest, info['filename'])
+        if args.skip_existing and os.path.exists(filepath) and (
+                store.file_matches(filepath, info['checksum']) if store else verify_checksum(filepath, info['checksum'])):
+            events.emit('skipped', distro=distro, edition=edition, file=filepath)
+            results.append(True)
+            continue
+
+        queue.add(distro, edition, dest, info, connections=args.segments)
+
+    if args.resume:
+        # Downloads in flight when an earlier run stopped go to where they were headed
+        for item in queue.restore():
+            events.emit('resumed', id=item.id, distro=item.distro, edition=item.edition, file=item.filepath)
+
+    def cancel_all(signum, frame):
+        for item in queue.items:
+            queue.cancel(item.id)
+
+    previous_handlers = {sig: signal.signal(sig, cancel_all) for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        # Progress is polled at a fixed rate rather than reported per chunk
+        while not queue.wait(max(args.progress_interval, 0.01)):
+            report_progress(queue, events)
+    finally:
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+
+    for item in queue.items:
+        if item.cancelled and not args.keep_partial:
+            remove_partial(item.filepath)
+        results.append(item.state == COMPLETED)
+    if journal:
+        journal.close()
+
+    events.emit('summary', succeeded=results.count(True), failed=results.count(False),
+                connections=get_client().stats.snapshot())
+    return 0 if all(results) else 1
+
+def cmd_verify(manager: DistroDataManager, args: argparse.Namespace, events: EventWriter) -> int:
+    """Check a directory of ISOs against the catalog"""
+    if not os.path.isdir(args.directory):
+        events.emit('error', message=f"Not a directory: {args.directory}")
+        return 2
+
+    manifests = open_manifests(args)
+    report = verify_library(args.directory, manager, store=open_store(args), workers=args.workers,
+                            recursive=args.recursive, on_result=lambda result: events.emit('verified', **result),
+                            manifests=manifests)
+    if args.repair and manifests:
+        for result in report.results:
+            if result['status'] == MISMATCH:
+                repair_file(manager, result, manifests, events)
+    events.emit('summary', **report.to_dict())
+    return 1 if report.count(MISMATCH) or report.count(FAILED) else 0
+
+def repair_file(manager: DistroDataManager, result: Dict[str, Any], manifests: ManifestStore,
+                events: EventWriter) -> bool:
+    """Fetch the bad pieces of a mismatched ISO again, given recorded piece hashes"""
+    info = manager.get_download_info(result['distro'], result['edition'])
+    pieces = manifests.load(info['checksum'])
+    if pieces is None:
+        events.emit('unrepairable', path=result['path'], message="No piece hashes recorded for this edition")
+        return False
+    job = DownloadJob(info['url'], result['path'], mirrors=info['mirrors'], checksum=info['checksum'],
+                      pieces=pieces, on_event=lambda event, fields: events.emit(event, path=result['path'], **fields))
+    if not job.salvage():
+        events.emit('unrepairable', path=result['path'], message="Could not repair the file from its piece hashes")
+        return False
+    result.update(status=OK, sha256=info['checksum'].lower(), repaired=True)
+    events.emit('repaired', path=result['path'], distro=result['distro'], edition=result['edition'])
+    return True
+
+def cmd_delta(manager: DistroDataManager, args: argparse.Namespace, events: EventWriter) -> int:
+    """Build an edition's ISO from an older one, fetching only the blocks that changed"""
+    info = manager.get_download_info(args.distro, args.edition)
+    if info is None:
+        events.emit('error', distro=args.distro, edition=args.edition, message="Unknown distribution or edition")
+        return 2
+    source = args.map or info['zsync']
+    if not source:
+        events.emit('error', message="The edition has no block map; pass --map")
+        return 2
+    if not os.path.isfile(args.old):
+        events.emit('error', message=f"Not a file: {args.old}")
+        return 2
+
+    block_map = fetch_block_map(source)
+    if block_map is None:
+        events.emit('error', message=f"Could not load block map {source}")
+        return 2
+    dest = os.path.abspath(args.dest)
+    os.makedirs(dest, exist_ok=True)
+    filepath = os.path.join(dest, info['filename'])
+    events.emit('started', distro=args.distro, edition=args.edition, url=info['url'], reuse=args.old)
+    report = delta_update(info['mirrors'], filepath, info['checksum'], args.old, block_map)
+    if report is None:
+        events.emit('failed', distro=args.distro, edition=args.edition, file=filepath,
+                    error="Delta update failed; use fetch for a full download")
+        return 1
+
+    store = open_store(args)
+    if store:
+        store.add(filepath, info['checksum'])
+    events.emit('completed', distro=args.distro, edition=args.edition, file=filepath, **report.to_dict())
+    return 0
+
+def cmd_mirrors(manager: DistroDataManager, args: argparse.Namespace, events: EventWriter) -> int:
+    """Rank the mirrors of an edition by probing them from here"""
+    info = manager.get_download_info(args.distro, args.edition)
+    if info is None:
+        events.emit('error', distro=args.distro, edition=args.edition, message="Unknown distribution or edition")
+        return 2
+    ranker = MirrorRanker()
+    ranked = ranker.rank(info['mirrors'], refresh=args.refresh)
+    probes = ranker.cached(ranked)
+    for rank, url in enumerate(ranked, 1):
+        probe = probes.get(url)
+        if probe and probe['ok']:
+            events.emit('mirror', rank=rank, url=url, rtt_ms=round(probe['rtt'] * 1000, 1),
+                        throughput_mbps=round(probe['throughput'] / (1024 * 1024), 2),
+                        estimated_seconds=round(estimated_time(probe), 2))
+        else:
+            events.emit('mirror', rank=rank, url=url, error=probe['error'] if probe else "No answer in time")
+    return 0
+
+def cmd_sync(manager: DistroDataManager, args: argparse.Namespace, events: EventWriter) -> int:
+    """Keep a directory holding the current ISO of every edition"""
+    directory = os.path.abspath(args.directory)
+    state = SyncState(directory) if os.path.isdir(directory) else None
+    reverify_after = args.reverify_days * 86400 if args.reverify_days is not None else None
+    plan = plan_sync(directory, manager, state, prune=args.prune, reverify_after=reverify_after)
+    if args.dry_run or not plan.changes:
+        for entry in plan.actions:
+            events.emit('plan', action=entry['action'], file=entry['path'], reason=entry['reason'],
+                        distro=entry.get('distro'), edition=entry.get('edition'))
+        events.emit('sync', dry_run=args.dry_run, **plan.to_dict())
+        return 0
+
+    os.makedirs(directory, exist_ok=True)
+    store = open_store(args)
+    manifests = open_manifests(args)
+    ranker = None if args.no_mirror_ranking else MirrorRanker()
+
+    def on_item(item: QueueItem):
+        item.retry_policy = RetryPolicy(budget=args.retries)
+        item.on_event = lambda event, fields: events.emit(event, file=item.filename, **fields)
+        item.manifests = manifests
+        item.ranker = ranker
+        item.preferred = preferred_mirrors(args, item)
+        events.emit('started', distro=item.distro, edition=item.edition, url=item.url)
+
+    def on_result(entry: Dict[str, Any]):
+        events.emit(entry['action'], file=entry['path'], status=entry['status'], reason=entry['reason'],
+                    distro=entry.get('distro'), edition=entry.get('edition'), error=entry.get('error'))
+
+    plan = execute_sync(plan, manager, state or SyncState(directory), store=store, workers=args.workers,
+                        connections=args.segments, on_item=on_item, on_result=on_result)
+    events.emit('sync', dry_run=False, **plan.to_dict())
+    return 0 if plan.ok else 1
+
+def cmd_serve(manager: DistroDataManager, args: argparse.Namespace, events: EventWriter) -> int:
+    """Serve the ISO store to other instances, fetching catalog ISOs it lacks from upstream"""
+    store = open_store(args)
+    if store is None:
+        events.emit('error', message="serve needs the ISO store; drop --no-store")
+        return 2
+    try:
+        server = MirrorServer(store, None if args.no_read_through else manager, (args.bind, args.port),
+                              retries=args.retries, on_event=lambda event, fields: events.emit(event, **fields))
+    except OSError as e:
+        events.emit('error', message=f"Cannot listen on {args.bind}:{args.port}: {e}")
+        return 2
+
+    stop = threading.Event()
+    previous_handlers = {sig: signal.signal(sig, lambda signum, frame: stop.set())
+                         for sig in (signal.SIGINT, signal.SIGTERM)}
+    server.start()
+    events.emit('serving', url=server.url, store=str(store.root), read_through=not args.no_read_through)
+    try:
+        while not stop.wait(1.0):
+            pass
+    finally:
+        server.stop()
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+    events.emit('stopped', url=server.url)
+    return 0
+
+def cmd_history(manager: DistroDataManager, args: argparse.Namespace, events: EventWriter) -> int:
+    """Show recent downloads and how fast their mirrors were"""
+    journal = open_journal(args)
+    if journal is None:
+        events.emit('error', message="The download journal is disabled or cannot be opened")
+        return 2
+    jobs = journal.history(args.count)
+    for job in jobs:
+        events.emit('job', id=job['id'], distro=job['distro'], edition=job['edition'], file=job['filepath'],
+                    state=job['state'], downloaded=job['downloaded'], total=job['size'],
+                    verified=job['verified'], error=job['error'], updated=round(job['updated'], 3))
+    urls = list(dict.fromkeys(url for job in jobs for url in job['info']['mirrors'] or [job['info']['url']]))
+    for url, stats in journal.mirror_stats(urls).items():
+        events.emit('mirror', url=url, bytes=stats['bytes'],
+                    throughput_mbps=round(stats['throughput'] / (1024 * 1024), 2), successes=stats['successes'], failures=stats['failures'])
+    journal.close()
+    return 0
+
+def cmd_blockmap(manager: DistroDataManager, args: argparse.Namespace, events: EventWriter) -> int:
+    """Generate the block map of an ISO for delta updates to it"""
+    output = args.output or args.file + '.blockmap.json'
+    try:
+        block_map = create_block_map(args.file, int(args.block_size * 1024))
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(block_map.to_dict(), f)
+    except (OSError, ValueError) as e:
+        events.emit('error', message=str(e))
+        return 2
+    events.emit('blockmap', file=args.file, output=output, blocks=len(block_map), sha256=block_map.sha256)
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser"""
+    parser = argparse.ArgumentParser(description="Download and verify Linux distribution ISOs without a GUI")
+    parser.add_argument('--data', default=str(DEFAULT_DATA_FILE), help="Distribution data file")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log details to stderr")
+    parser.add_argument('--store', default=str(DEFAULT_STORE_DIR), help="Local ISO store directory")
+    parser.add_argument('--no-store', action='store_true', help="Do not use the local ISO store")
+    parser.add_argument('--no-piece-hashes', action='store_true',
+                        help="Do not record piece hashes of verified ISOs or use them to repair corrupt ones")
+    parser.add_argument('--journal', default=str(DEFAULT_JOURNAL_FILE),
+                        help="SQLite journal of downloads, their outcomes and mirror statistics")
+    parser.add_argument('--no-journal', action='store_true', help="Do not record downloads in the journal")
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help="Connections kept alive per host")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="Network timeout in seconds")
+    parser.add_argument('--http2', action='store_true', help="Use HTTP/2 where available (needs httpx[http2])")
+    parser.add_argument('--limit', default='0', help="Total download rate, e.g. 500K or 2M (default: unlimited)")
+    parser.add_argument('--schedule', help="Rates by time of day, e.g. \"Mon-Fri 09:00-18:00=1M; 00:00-06:00=off\"")
+    parser.add_argument('--mirror-server', help="Base URL of another instance running serve, tried before "
+                        "any other mirror, e.g. http://isobox:8780")
+    parser.add_argument('--store-max-gb', type=float, default=DEFAULT_MAX_STORE_SIZE / 1024 ** 3,
+                        help="Evict least recently used ISOs beyond this size")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('list', help="List available editions")
+
+    fetch = subparsers.add_parser('fetch', help="Download and verify editions")
+    fetch.add_argument('distro', nargs='?', help="Distribution name")
+    fetch.add_argument('edition', nargs='?', help="Edition name (default: all editions of the distribution)")
+    fetch.add_argument('--all', action='store_true', help="Fetch every edition in the catalog")
+    fetch.add_argument('--manifest', help="JSON list of {\"distro\": ..., \"edition\": ...} to fetch")
+    fetch.add_argument('--dest', default='.', help="Download directory")
+    fetch.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS, help="Connections per download")
+    fetch.add_argument('--concurrency', type=int, default=DEFAULT_MAX_CONCURRENT, help="Simultaneous downloads")
+    fetch.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST_LIMIT, help="Connections per host")
+    fetch.add_argument('--retries', type=int, default=RETRY_BUDGET, help="Retries per download")
+    fetch.add_argument('--low-speed-limit', type=float, default=LOW_SPEED_LIMIT / 1024,
+                       help="KB/s below which a connection is dropped and retried (0 to disable)")
+    fetch.add_argument('--low-speed-time', type=float, default=LOW_SPEED_TIME,
+                       help="Seconds a connection may stay below the low-speed limit")
+    fetch.add_argument('--control', action='store_true',
+                       help="Read \"limit RATE\" and \"schedule SPEC\" commands from stdin while downloading")
+    fetch.add_argument('--no-mirror-ranking', action='store_true',
+                       help="Use mirrors in catalog order instead of probing for the fastest")
+    fetch.add_argument('--resume', action='store_true',
+                       help="Also resume downloads the journal recorded as unfinished")
+    fetch.add_argument('--skip-existing', action='store_true', help="Skip files that already verify")
+    fetch.add_argument('--keep-partial', action='store_true', help="Keep .part files of cancelled downloads for resume")
+    fetch.add_argument('--progress-interval', type=float, default=PROGRESS_INTERVAL,
+                       help="Seconds between progress events per download")
+
+    verify = subparsers.add_parser('verify', help="Check a directory of ISOs against the catalog")
+    verify.add_argument('directory', help="Directory holding the ISOs")
+    verify.add_argument('--workers', type=int, default=None, help="Files hashed in parallel (default: CPU count)")
+    verify.add_argument('--recursive', action='store_true', help="Include subdirectories")
+    verify.add_argument('--repair', action='store_true',
+                        help="Fetch just the corrupt pieces of mismatched ISOs whose piece hashes were recorded")
+
+    delta = subparsers.add_parser('delta', help="Update to an edition's ISO from an older one, fetching only changed blocks")
+    delta.add_argument('distro', help="Distribution name")
+    delta.add_argument('edition', help="Edition name")
+    delta.add_argument('--from', dest='old', required=True, help="Older ISO to reuse blocks of")
+    delta.add_argument('--map', help="Block map of the new ISO, a .zsync or generated one (default: the edition's \"zsync\")")
+    delta.add_argument('--dest', default='.', help="Download directory")
+
+    mirrors = subparsers.add_parser('mirrors', help="Rank an edition's mirrors by probing them from here")
+    mirrors.add_argument('distro', help="Distribution name")
+    mirrors.add_argument('edition', help="Edition name")
+    mirrors.add_argument('--refresh', action='store_true', help="Probe again even if a recent ranking is cached")
+
+    sync = subparsers.add_parser('sync', help="Keep a directory holding the current ISO of every edition")
+    sync.add_argument('directory', help="Directory to keep in sync with the catalog")
+    sync.add_argument('--dry-run', action='store_true', help="Show the plan without changing anything")
+    sync.add_argument('--prune', action='store_true', help="Remove disk images that belong to no edition")
+    sync.add_argument('--reverify-days', type=float,
+                      help="Hash files again once their last check is older than this")
+    sync.add_argument('--workers', type=int, default=DEFAULT_SYNC_WORKERS, help="Simultaneous downloads")
+    sync.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS, help="Connections per download")
+    sync.add_argument('--retries', type=int, default=RETRY_BUDGET, help="Retries per download")
+    sync.add_argument('--no-mirror-ranking', action='store_true',
+                      help="Use mirrors in catalog order instead of probing for the fastest")
+
+    serve = subparsers.add_parser('serve', help="Serve the ISO store over HTTP as a mirror for other instances")
+    serve.add_argument('--bind', default=DEFAULT_BIND, help="Address to listen on")
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port to listen on (0 picks a free one)")
+    serve.add_argument('--retries', type=int, default=RETRY_BUDGET, help="Retries per upstream download")
+    serve.add_argument('--no-read-through', action='store_true',
+                       help="Serve only ISOs already in the store instead of fetching catalog ISOs on request")
+
+    history = subparsers.add_parser('history', help="Show recent downloads from the journal")
+    history.add_argument('--count', type=int, default=HISTORY_LIMIT, help="Number of downloads to show")
+
+    blockmap = subparsers.add_parser('blockmap', help="Generate the block map of an ISO for delta updates")
+    blockmap.add_argument('file', help="ISO file")
+    blockmap.add_argument('--output', help="Block map file (default: FILE.blockmap.json)")
+    blockmap.add_argument('--block-size', type=float, default=DEFAULT_BLOCK_SIZE / 1024, help="Block size in KB")
+    return parser
+
+COMMANDS = {
+    'list': cmd_list,
+    'fetch': cmd_fetch,
+    'verify': cmd_verify,
+    'delta': cmd_delta,
+    'blockmap': cmd_blockmap,
+    'mirrors': cmd_mirrors,
+    'history': cmd_history,
+    'sync': cmd_sync,
+    'serve': cmd_serve,
+}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Main entry point"""
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        stream=sys.stderr
+    )
+
+    events = EventWriter()
+    configure(pool_size=max(1, args.pool_size), timeout=args.timeout, http2=args.http2)
+    try:
+        get_limiter().set_rate(parse_rate(args.limit))
+        get_limiter().set_schedule(Schedule.parse(args.schedule) if args.schedule else None)
+    except ValueError as e:
+        events.emit('error', message=str(e))
+        return 2
+    logger.info(f"Download rate limit: {format_rate(get_limiter().rate)}")
+    manager = DistroDataManager(args.data)
+    if not manager.data:
+        events.emit('error', message=f"Could not load distribution data from {args.data}")
+        return 2
+
+    return COMMANDS[args.command](manager, args, events)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,7 @@
                 info_text += f"Latest Version: {version_info['name']} ({version_info['status']})\n"
             
             info_text += f"Available editions: {', '.join(editions)}"
+            self.distro_info_text = info_text
             
             self.info_text.delete("1.0", "end")
             self.info_text.insert("1.0", info_text)
@@ -34,37 +35,140 @@
             self.update_server_info(distro_name, edition_name)
     
     def update_server_info(self, distro_name: str, edition_name: str):
-        """Update server information display"""
+        """Update server information display without blocking on DNS"""
         try:
-            edition_info = self.distro_data[distro_name]['editions'][edition_name]
-            url = edition_info['url']
+            url = self.distro_data[distro_name]['editions'][edition_name]['url']
+            self.server_info_url = url
             
-            # Get server information
-            server_info = self.get_server_info(url)
-            
-            # Format server information text
-            info_text = f"🌐 Domain: {server_info['domain']}\n"
-            info_text += f"🖥️  IP Address: {server_info['ip']}\n"
-            info_text += f"{server_info['flag']} Country: {server_info['country_name']}"
+            # Cached hosts render immediately; others are resolved in the background
+            server_info = self.server_lookup.lookup(
+                url, lambda info: self.root.after(0, self.show_server_info, url, info)
+            )
+            if server_info:
+                self.show_server_info(url, server_info)
+            else:
+                self.server_info_text.configure(text=f"🌐 Domain: {urlparse(url).hostname}\n🔄 Resolving...")
             
-            self.server_info_text.configure(text=info_text)
+            # Open a pooled connection and learn the file size before Download is pressed
+            metadata = self.prefetcher.prefetch(
+                url, lambda info: self.root.after(0, self.show_edition_metadata, url, info)
+            )
+            if metadata:
+                self.show_edition_metadata(url, metadata)
             
         except Exception as e:
             logger.warning(f"Failed to update server info: {e}")
             self.server_info_text.configure(text="Server information unavailable")
     
+    def show_edition_metadata(self, url: str, metadata: Dict[str, Any]):
+        """Show the exact file size and whether it fits, if still for the selected edition"""
+        if url != self.server_info_url or not metadata['size']:
+            return
+        
+        size = metadata['size']
+        info_text = self.distro_info_text
+        info_text += f"\n\nFile size: {DownloadProgress.format_size(size)}"
+        info_text += " (resumable)" if metadata['accepts_ranges'] else ""
+        free = free_space(self.download_dir.get())
+        if free is not None:
+            fits = "✅" if free >= size else "⚠️ not enough space"
+            info_text += f"\nFree space: {DownloadProgress.format_size(free)} {fits}"
+        
+        self.info_text.delete("1.0", "end")
+        self.info_text.insert("1.0", info_text)
+    
+    def show_server_info(self, url: str, server_info: Dict[str, str]):
+        """Render server information if it is still for the selected edition"""
+        if url != self.server_info_url:
+            return
+        
+        # Format server information text
+        info_text = f"🌐 Domain: {server_info['domain']}\n"
+        info_text += f"🖥️  IP Address: {server_info['ip']}\n"
+        info_text += f"{server_info['flag']} Country: {server_info['country_name']}"
+        
+        self.server_info_text.configure(text=info_text)
+    
+    def check_latest_versions(self):
+        """Query every version source concurrently without blocking the UI"""
+        self.update_status("🔄 Checking latest versions...")
+        
+        def run():
+            try:
+                # Conditional requests make re-checking unchanged sources cheap
+                results = self.version_checker.check_all(
+                    force=True, on_result=lambda distro, info: self.root.after(0, self.apply_version_info, {distro: info})
+                )
+                self.update_status(f"✅ Version check complete: {len(results)} of {len(self.distro_data)} distributions")
+            except Exception as e:
+                logger.error(f"Version check failed: {e}")
+                self.update_status("❌ Version check failed")
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def apply_version_info(self, results: Dict[str, Dict[str, Any]]):
+        """Show version results in the distribution selector (Tk thread only)"""
+        self.version_info.update(results)
+        values = [f"{name} (v{self.version_info[name]['version']})" if name in self.version_info else name
+                  for name in self.distro_data]
+        self.distro_combo.configure(values=values)
+        
+        selected = self.selected_distro.get().split(' (v')[0]
+        if selected in results:
+            self.selected_distro.set(values[list(self.distro_data).index(selected)])
+    
     def browse_directory(self):
         """Browse for download directory"""
         directory = filedialog.askdirectory(initialdir=self.download_dir.get())
         if directory:
             self.download_dir.set(directory)
     
-    def start_download(self):
-        """Start the download process"""
-        if self.is_downloading:
-            messagebox.showwarning("Warning", "Download already in progress!")
-            return
+    def create_queue_controls(self, parent):
+        """Create the download queue list with per-item controls"""
+        queue_frame = ctk.CTkFrame(parent)
+        queue_frame.pack(fill="x", padx=20, pady=(0, 10))
+        
+        self.queue_text = ctk.CTkTextbox(queue_frame, height=100)
+        self.queue_text.pack(fill="x", padx=10, pady=(10, 5))
         
+        controls = ctk.CTkFrame(queue_frame, fg_color="transparent")
+        controls.pack(fill="x", padx=10, pady=(0, 10))
+        
+        self.queue_combo = ctk.CTkComboBox(
+            controls, variable=self.selected_queue_item, values=[], state="readonly", width=320,
+            command=lambda _: self.update_queue_buttons()
+        )
+        self.queue_combo.pack(side="left", padx=(0, 10))
+        
+        ctk.CTkButton(controls, text="▲", width=40, command=lambda: self.move_queue_item(-1)).pack(side="left", padx=2)
+        ctk.CTkButton(controls, text="▼", width=40, command=lambda: self.move_queue_item(1)).pack(side="left", padx=2)
+        ctk.CTkButton(controls, text="Verify Library", width=120, command=self.verify_library).pack(side="right")
+        
+        # One limit for all downloads, applied to transfers already running
+        ctk.CTkButton(controls, text="Set Limit", width=80, command=self.apply_speed_limit).pack(side="right", padx=(2, 10))
+        self.limit_entry = ctk.CTkEntry(controls, width=110, placeholder_text="Limit, e.g. 2M")
+        self.limit_entry.pack(side="right", padx=2)
+        self.limit_entry.bind("<Return>", lambda _: self.apply_speed_limit())
+    
+    def apply_speed_limit(self):
+        """Limit the total download speed to the rate typed in the queue controls"""
+        try:
+            rate = parse_rate(self.limit_entry.get())
+        except ValueError as e:
+            messagebox.showerror("Invalid Speed Limit", f"{e}\n\nUse e.g. 500K or 2M, or leave empty for no limit.")
+            return
+        get_limiter().set_rate(rate)
+        self.update_status(f"Download speed limit: {format_rate(rate)}")
+    
+    def get_selected_queue_item(self) -> Optional[QueueItem]:
+        """Get the queue item chosen in the queue selector"""
+        selection = self.selected_queue_item.get()
+        if not selection.startswith('#'):
+            return None
+        return self.download_queue.get(int(selection[1:].split(' ', 1)[0]))
+    
+    def start_download(self):
+        """Add the selected edition to the download queue"""
         distro_display = self.selected_distro.get()
         edition = self.selected_edition.get()
         
@@ -83,224 +187,258 @@
                 messagebox.showerror("Error", f"Cannot create download directory:\n{e}")
                 return
         
-        # Reset download state
-        self.download_cancelled = False
-        self.download_paused = False
+        edition_data = self.distro_data[distro]['editions'][edition]
+        download_info = {
+            'url': edition_data['url'],
+            'mirrors': get_mirror_urls(edition_data),
+            'filename': edition_data['filename'],
+            'checksum': edition_data['checksum'],
+            # Probed when the edition was selected, so the download starts without a probe
+            'metadata': self.prefetcher.cached(edition_data['url'])
+        }
         
-        # Start download in separate thread
-        self.download_thread = threading.Thread(
-            target=self.download_iso,
-            args=(distro, edition, download_dir),
-            daemon=True
-        )
-        self.download_thread.start()
+        metadata = download_info['metadata']
+        free = free_space(download_dir)
+        if metadata and free is not None and free < metadata['size']:
+            if not messagebox.askyesno(
+                    "Not Enough Space",
+                    f"{edition_data['filename']} needs {DownloadProgress.format_size(metadata['size'])} but only "
+                    f"{DownloadProgress.format_size(free)} is free in {download_dir}.\n\nQueue it anyway?"):
+                return
+        
+        if self.download_queue.find(os.path.join(download_dir, edition_data['filename'])):
+            messagebox.showwarning("Warning", f"{distro} {edition} is already in the download queue!")
+            return
+        
+        item = self.download_queue.add(distro, edition, download_dir, download_info,
+                                       connections=self.segment_count)
+        self.selected_queue_item.set(f"#{item.id} {item.name}")
+        self.update_status(f"Queued {item.name}")
+    
+    def resume_unfinished(self):
+        """Queue the downloads the journal recorded as unfinished when the app last stopped"""
+        items = self.download_queue.restore()
+        if items:
+            self.update_status(f"Resuming {len(items)} unfinished download(s): "
+                               f"{', '.join(item.name for item in items)}")
     
     def pause_download(self):
-        """Pause or resume the download"""
-        if not self.is_downloading:
+        """Pause or resume the selected queue item"""
+        item = self.get_selected_queue_item()
+        if item is None or item.finished:
             return
         
-        if self.download_paused:
-            self.download_paused = False
-            self.pause_btn.configure(text="Pause")
-            self.update_status("Resuming download...")
+        if item.paused:
+            self.download_queue.resume(item.id)
+            self.update_status(f"Resuming {item.name}...")
         else:
-            self.download_paused = True
-            self.pause_btn.configure(text="Resume")
-            self.update_status("Download paused")
+            self.download_queue.pause(item.id)
+            self.update_status(f"{item.name} paused")
     
     def cancel_download(self):
-        """Cancel the current download"""
-        if not self.is_downloading:
+        """Cancel the selected queue item"""
+        item = self.get_selected_queue_item()
+        if item is None or item.finished:
             return
         
-        result = messagebox.askyesno("Cancel Download", "Are you sure you want to cancel the download?")
+        result = messagebox.askyesno("Cancel Download", f"Are you sure you want to cancel {item.name}?")
         if result:
-            self.download_cancelled = True
-            self.update_status("Cancelling download...")
-            
-            # Close current connections
-            if self.current_response:
-                try:
-                    self.current_response.close()
-                except:
-                    pass
-            
-            if self.current_file_handle:
-                try:
-                    self.current_file_handle.close()
-                except:
-                    pass
+            self.download_queue.cancel(item.id)
+            self.update_status(f"Cancelling {item.name}...")
+    
+    def move_queue_item(self, offset: int):
+        """Move the selected queue item up or down"""
+        item = self.get_selected_queue_item()
+        if item is not None:
+            self.download_queue.move(item.id, offset)
     
-    def download_iso(self, distro: str, edition: str, download_dir: str):
-        """Download and verify ISO file with pause/cancel support"""
-        self.is_downloading = True
-        self.download_btn.configure(text="Downloading...", state="disabled")
-        self.pause_btn.configure(state="normal")
-        self.cancel_btn.configure(state="normal")
+    def on_queue_change(self, item: QueueItem):
+        """Refresh the queue display after any queue change (called from any thread)"""
+        self.root.after(0, self.refresh_queue_view)
+    
+    def refresh_queue_view(self):
+        """Show every queued item with its progress"""
+        items = list(self.download_queue.items)
+        lines = []
+        for item in items:
+            progress = item.progress
+            line = f"#{item.id} {item.name} - {item.status_text}"
+            if progress.total_size:
+                line += (f" - {progress.format_size(progress.downloaded)} / "
+                         f"{progress.format_size(progress.total_size)} ({progress.progress_percent:.1f}%)")
+                if item.state == DOWNLOADING:
+                    line += f" {progress.speed_mbps:.1f} MB/s, ETA {progress.format_eta()}"
+            if item.error:
+                line += f" - {item.error}"
+            lines.append(line)
+        
+        self.queue_text.delete("1.0", "end")
+        self.queue_text.insert("1.0", "\n".join(lines))
+        self.queue_combo.configure(values=[f"#{item.id} {item.name}" for item in items])
+        
+        # The main progress bar shows all running downloads combined
+        active = [item for item in items if item.state == DOWNLOADING]
+        total = sum(item.progress.total_size for item in active)
+        done = sum(item.progress.downloaded for item in active)
+        self.progress_bar.set(done / total if total else 0)
+        self.progress_label.configure(
+            text=f"{len(active)} active, {sum(not item.finished for item in items) - len(active)} waiting" if items else ""
+        )
+        self.update_queue_buttons()
+    
+    def update_queue_buttons(self):
+        """Enable pause/cancel according to the selected queue item"""
+        item = self.get_selected_queue_item()
+        active = item is not None and not item.finished
+        self.pause_btn.configure(text="Resume" if active and item.paused else "Pause",
+                                 state="normal" if active else "disabled")
+        self.cancel_btn.configure(state="normal" if active else "disabled")
+    
+    def show_download_event(self, item: QueueItem, event: str, fields: dict):
+        """Show stalls, retries and mirror failovers of a download in the status bar"""
+        if event == 'stalled':
+            self.update_status(f"⚠️ {item.name}: slow connection dropped, resuming...")
+        elif event == 'retry':
+            self.update_status(f"🔄 {item.name}: retry {fields['attempt']} in {fields['delay']:.0f}s "
+                               f"({fields['error']})")
+        elif event == 'failover':
+            self.update_status(f"🔀 {item.name}: switching to {urlparse(fields['url']).hostname}")
+        elif event == 'mirror_disabled':
+            self.update_status(f"⚠️ {item.name}: giving up on {urlparse(fields['url']).hostname}")
+        elif event == 'mirrors_ranked':
+            self.update_status(f"⚡ {item.name}: fastest mirror is {urlparse(fields['best']).hostname}")
+        elif event == 'no_space':
+            self.update_status(f"💾 {item.name}: {fields['error']}")
+        elif event == 'repair':
+            self.update_status(f"🔧 {item.name}: re-fetching {fields['pieces']} corrupt pieces "
+                               f"({DownloadProgress.format_size(fields['bytes'])})")
+    
+    def download_iso(self, item: QueueItem) -> bool:
+        """Download and verify a queued ISO file with pause/cancel support"""
+        filepath = item.filepath
         
         try:
-            # Get download info
-            edition_data = self.distro_data[distro]['editions'][edition]
-            url = edition_data['url']
-            checksum = edition_data['checksum']
-            filename = edition_data['filename']
-            filepath = os.path.join(download_dir, filename)
+            # An identical ISO kept locally (or already in the target directory) needs no download
+            method = self.iso_store.provision(filepath, item.checksum)
+            if method:
+                self.update_status(f"✅ {item.name} provided from the local ISO store")
+                self.update_info(f"Already verified locally ({method}):\n{item.filename}\n\nLocation: {filepath}")
+                logger.info(f"Provided {filepath} from the ISO store ({method})")
+                return True
             
-            self.update_status(f"Starting download of {distro} {edition}...")
-            logger.info(f"Starting download: {distro} {edition} from {url}")
+            self.update_status(f"Starting download of {item.name}...")
+            logger.info(f"Starting download: {item.name} from {item.url}")
             
-            # Download file with pause/cancel support
-            success = self.download_file_with_controls(url, filepath)
+            # Download file with pause/cancel support, hashing as bytes arrive
+            item.on_event = lambda event, fields: self.show_download_event(item, event, fields)
+            item.manifests = self.manifests
+            item.ranker = self.mirror_ranker
+            hasher = item.prepare()
+            # An existing copy with recorded piece hashes only has its bad pieces fetched again
+            if item.salvage():
+                self.iso_store.add(filepath, item.checksum)
+                self.update_status(f"✅ {item.name} repaired and verified!")
+                self.update_info(f"Repaired the existing file:\n{item.filename}\n\nLocation: {filepath}")
+                return True
+            success = item.download(hasher)
             
-            if self.download_cancelled:
-                self.update_status("✖️ Download cancelled")
+            if item.cancelled:
+                self.update_status(f"✖️ Download cancelled: {item.name}")
                 self.cleanup_cancelled_download(filepath)
-                return
+                return False
             
             if success:
-                self.update_status("Download completed. Verifying checksum...")
+                self.update_status(f"{item.name} downloaded. Verifying checksum...")
                 logger.info(f"Download completed: {filepath}")
                 
-                # Verify checksum
-                if self.verify_checksum(filepath, checksum):
-                    self.update_status("✅ Download and verification successful!")
-                    self.update_info(f"Successfully downloaded and verified:\n{filename}\n\nLocation: {filepath}")
-                    messagebox.showinfo("Success", f"Successfully downloaded and verified {filename}!")
+                # Verify checksum (only bytes not hashed during the download are read);
+                # with piece hashes only corrupt pieces are fetched again
+                if item.verify(hasher):
+                    self.iso_store.add(filepath, item.checksum)
+                    self.update_status(f"✅ {item.name} downloaded and verified!")
+                    self.update_info(f"Successfully downloaded and verified:\n{item.filename}\n\nLocation: {filepath}")
                     logger.info(f"Verification successful: {filepath}")
-                else:
-                    self.update_status("❌ Checksum verification failed!")
-                    self.update_info(f"Download completed but checksum verification failed!\nFile: {filepath}\n\nPlease re-download or verify manually.")
-                    messagebox.showerror("Verification Failed", "Checksum verification failed! The file may be corrupted.")
-                    logger.error(f"Checksum verification failed: {filepath}")
+                    return True
+                
+                item.error = "Checksum verification failed"
+                self.update_status(f"❌ Checksum verification failed: {item.name}")
+                self.update_info(f"Download completed but checksum verification failed!\nFile: {filepath}\n\nPlease re-download or verify manually.")
+                messagebox.showerror("Verification Failed", f"Checksum verification failed for {item.filename}! The file may be corrupted.")
+                logger.error(f"Checksum verification failed: {filepath}")
             else:
-                if not self.download_cancelled:
-                    self.update_status("❌ Download failed")
-                    logger.error(f"Download failed: {filepath}")
+                item.error = item.error or "Download failed"
+                self.update_status(f"❌ Download failed: {item.name}")
+                logger.error(f"Download failed: {filepath}")
         
         except Exception as e:
-            if not self.download_cancelled:
+            if not item.cancelled:
                 error_msg = f"Error during download: {str(e)}"
+                item.error = error_msg
                 self.update_status(f"❌ {error_msg}")
                 self.update_info(error_msg)
-                messagebox.showerror("Error", error_msg)
                 logger.error(f"Download error: {e}")
         
-        finally:
-            self.is_downloading = False
-            self.download_paused = False
-            self.current_response = None
-            self.current_file_handle = None
-            self.download_btn.configure(text="Download ISO", state="normal")
-            self.pause_btn.configure(text="Pause", state="disabled")
-            self.cancel_btn.configure(state="disabled")
-            self.progress_bar.set(0)
-            self.progress_label.configure(text="")
+        return False
     
-    def download_file_with_controls(self, url: str, filepath: str) -> bool:
-        """Download file with pause/cancel controls"""
-        try:
-            # Check if partial file exists for resume capability
-            resume_pos = 0
-            if os.path.exists(filepath + ".part"):
-                resume_pos = os.path.getsize(filepath + ".part")
-                logger.info(f"Resuming download from position: {resume_pos}")
-            
-            headers = {}
-            if resume_pos > 0:
-                headers['Range'] = f'bytes={resume_pos}-'
-            
-            self.current_response = requests.get(url, stream=True, timeout=30, headers=headers)
-            self.current_response.raise_for_status()
-            
-            total_size = int(self.current_response.headers.get('content-length', 0))
-            if resume_pos > 0:
-                total_size += resume_pos
-            
-            downloaded = resume_pos
-            
-            # Open file in append mode if resuming, otherwise write mode
-            mode = 'ab' if resume_pos > 0 else 'wb'
-            self.current_file_handle = open(filepath + ".part", mode)
-            
+    def verify_library(self):
+        """Check every ISO in a chosen directory against the catalog in the background"""
+        directory = filedialog.askdirectory(initialdir=self.download_dir.get(), title="Select ISO library")
+        if not directory:
+            return
+        
+        def run():
             try:
-                for chunk in self.current_response.iter_content(chunk_size=8192):
-                    if self.download_cancelled:
-                        return False
-                    
-                    # Handle pause
-                    while self.download_paused and not self.download_cancelled:
-                        time.sleep(0.1)
-                    
-                    if self.download_cancelled:
-                        return False
-                    
-                    if chunk:
-                        self.current_file_handle.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        if total_size > 0:
-                            progress = downloaded / total_size
-                            self.progress_bar.set(progress)
-                            
-                            # Update progress info
-                            downloaded_mb = downloaded / (1024 * 1024)
-                            total_mb = total_size / (1024 * 1024)
-                            self.root.after(0, lambda: self.progress_label.configure(
-                                text=f"{downloaded_mb:.1f} MB / {total_mb:.1f} MB ({progress*100:.1f}%)"
-                            ))
-                
-                self.current_file_handle.close()
-                self.current_file_handle = None
+                manager = DistroDataManager(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'distro_data.json'))
+                checked = []
                 
-                # Rename completed file
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                os.rename(filepath + ".part", filepath)
-                
-                return True
+                def on_result(result):
+                    checked.append(result)
+                    self.update_status(f"Verifying library: {len(checked)} files checked...")
                 
-            finally:
-                if self.current_file_handle:
-                    self.current_file_handle.close()
-                    self.current_file_handle = None
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Network error during download: {e}")
-            return False
-        except IOError as e:
-            logger.error(f"File system error during download: {e}")
-            return False
+                report = verify_library(directory, manager, store=self.iso_store, on_result=on_result,
+                                        manifests=self.manifests)
+                icons = {'ok': '✅', 'mismatch': '❌', 'unknown': '❔', 'failed': '⚠️'}
+                lines = [f"{icons[r['status']]} {os.path.basename(r['path'])}"
+                         + (f" - {r['distro']} {r['edition']}" if r['distro'] else "")
+                         for r in report.results]
+                summary = report.to_dict()
+                self.update_status(f"Library verified: {summary['ok']} ok, {summary['mismatch']} mismatched, "
+                                   f"{summary['unknown']} unknown, {summary['failed']} failed ({summary['throughput_mbps']:.0f} MB/s)")
+                self.update_info("\n".join(lines) or f"No ISOs found in {directory}")
+            except Exception as e:
+                logger.error(f"Library verification failed: {e}")
+                self.update_status(f"❌ Library verification failed: {e}")
+        
+        self.update_status(f"Verifying ISOs in {directory}...")
+        threading.Thread(target=run, daemon=True).start()
     
+    def poll_progress(self):
+        """Sample download progress and redraw the queue at a fixed rate
+
+        Download workers only bump counters; all speed/ETA maths and widget
+        updates happen here on the Tk thread, at most 10 times a second.
+        """
+        try:
+            if self.download_queue.active_items:
+                for item in self.download_queue.active_items:
+                    item.progress.sample()
+                self.refresh_queue_view()
+        except Exception as e:
+            logger.warning(f"Failed to refresh download progress: {e}")
+        self.root.after(int(PROGRESS_POLL_INTERVAL * 1000), self.poll_progress)
+
     def cleanup_cancelled_download(self, filepath: str):
         """Clean up partial download files when cancelled"""
         try:
-            partial_file = filepath + ".part"
-            if os.path.exists(partial_file):
-                os.remove(partial_file)
-                logger.info(f"Cleaned up partial download: {partial_file}")
+            if os.path.exists(filepath + ".part"):
+                remove_partial(filepath)
+                logger.info(f"Cleaned up partial download: {filepath}.part")
         except Exception as e:
             logger.warning(f"Failed to clean up partial download: {e}")
     
     def verify_checksum(self, filepath: str, expected_checksum: str) -> bool:
         """Verify file checksum"""
-        try:
-            sha256_hash = hashlib.sha256()
-            with open(filepath, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(chunk)
-            
-            calculated_checksum = sha256_hash.hexdigest().lower()
-            expected_checksum = expected_checksum.lower()
-            
-            logger.info(f"Expected checksum: {expected_checksum}")
-            logger.info(f"Calculated checksum: {calculated_checksum}")
-            
-            return calculated_checksum == expected_checksum
-            
-        except Exception as e:
-            logger.error(f"Error calculating checksum: {e}")
-            return False
+        return verify_checksum(filepath, expected_checksum)
     
     def update_status(self, message: str):
         """Update status label from any thread"""
@@ -316,6 +454,10 @@
     def run(self):
         """Start the application"""
         logger.info("Starting Linux Distro Downloader GUI")
+        # Versions checked within the cache TTL show up without any network call
+        self.apply_version_info(self.version_checker.cached())
+        self.resume_unfinished()
+        self.poll_progress()
         self.root.mainloop()
 
 def main():
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Build the IP-to-country table for Linux Distro Downloader
+
+Reads Regional Internet Registry "delegated" statistics files (local paths
+or URLs) and writes the compact binary table used by utils/server_info.py.
+
+Usage:
+    python scripts/build_geoip.py \
+        https://ftp.ripe.net/pub/stats/ripencc/delegated-ripencc-extended-latest \
+        https://ftp.arin.net/pub/stats/arin/delegated-arin-extended-latest \
+        https://ftp.apnic.net/stats/apnic/delegated-apnic-extended-latest \
+        https://ftp.lacnic.net/pub/stats/lacnic/delegated-lacnic-extended-latest \
+        https://ftp.afrinic.net/pub/stats/afrinic/delegated-afrinic-extended-latest \
+        --names countries.csv
+"""
+
+import argparse
+import csv
+import ipaddress
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+# Add parent directory to path to import utils
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.server_info import DEFAULT_TABLE_PATH, write_table
+
+Range = Tuple[int, int, str]
+
+def read_lines(source: str) -> Iterable[str]:
+    """Read a local file or download a URL"""
+    if source.startswith(('http://', 'https://')):
+        import requests
+        response = requests.get(source, timeout=60)
+        response.raise_for_status()
+        return response.text.splitlines()
+    with open(source, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read().splitlines()
+
+def parse_delegated(lines: Iterable[str]) -> Tuple[List[Range], List[Range]]:
+    """Parse registry|cc|type|start|value|date|status records"""
+    ipv4, ipv6 = [], []
+    for line in lines:
+        if line.startswith('#'):
+            continue
+        fields = line.split('|')
+        if len(fields) < 7 or fields[6] not in ('allocated', 'assigned') or len(fields[1]) != 2:
+            continue
+        country, kind, start, value = fields[1].upper(), fields[2], fields[3], fields[4]
+        if kind == 'ipv4':
+            first = int(ipaddress.IPv4Address(start))
+            ipv4.append((first, first + int(value) - 1, country))
+        elif kind == 'ipv6':
+            prefix = int(value)
+            if prefix > 64:
+                continue
+            first = int(ipaddress.IPv6Address(start)) >> 64
+            ipv6.append((first, first + (1 << (64 - prefix)) - 1, country))
+    return ipv4, ipv6
+
+def merge(ranges: List[Range]) -> List[Range]:
+    """Sort ranges and join adjacent ones of the same country"""
+    merged: List[Range] = []
+    for start, end, country in sorted(ranges):
+        if merged and merged[-1][2] == country and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end), country)
+        elif merged and start <= merged[-1][1]:
+            continue  # Overlapping records from two registries: keep the first
+        else:
+            merged.append((start, end, country))
+    return merged
+
+def read_names(path: str) -> Dict[str, str]:
+    """Read a code,name CSV of country names"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return {row[0].strip().upper(): row[1].strip() for row in csv.reader(f) if len(row) >= 2}
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline IP-to-country table")
+    parser.add_argument('sources', nargs='+', help="RIR delegated statistics files or URLs")
+    parser.add_argument('--names', help="CSV of two-letter code,country name")
+    parser.add_argument('--output', default=str(DEFAULT_TABLE_PATH), help="Table to write")
+    args = parser.parse_args()
+
+    ipv4, ipv6 = [], []
+    for source in args.sources:
+        print(f"Reading {source}...")
+        v4, v6 = parse_delegated(read_lines(source))
+        ipv4.extend(v4)
+        ipv6.extend(v6)
+
+    ipv4, ipv6 = merge(ipv4), merge(ipv6)
+    names = read_names(args.names) if args.names else {}
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    write_table(args.output, ipv4, ipv6, names)
+    print(f"Wrote {len(ipv4)} IPv4 and {len(ipv6)} IPv6 ranges to {args.output} "
+          f"({Path(args.output).stat().st_size // 1024} KB)")
+
+if __name__ == "__main__":
+    main()
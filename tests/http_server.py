@@ -0,0 +1,140 @@
+"""
+Local HTTP server used by the download tests
+
+Serves in-memory payloads with optional byte-range support so the
+download engine can be exercised without network access.
+"""
+
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+
+class FileEntry:
+    """A payload served by the test server"""
+
+    def __init__(self, content: bytes, support_ranges: bool = True, chunk_delay: float = 0.0,
+                 etag: str = None, slow_requests: int = None, fail_requests: int = 0):
+        self.content = content
+        self.support_ranges = support_ranges
+        self.etag = etag  # Sent as ETag and checked against If-Range
+        self.chunk_delay = chunk_delay  # Seconds to sleep per 16 KB to simulate a slow mirror
+        self.slow_requests = slow_requests  # Only the first GETs are slow, if set
+        self.fail_requests = fail_requests  # The first GETs get a 503
+        self.gets = 0
+        self.requests = []
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serve registered payloads with GET/HEAD and byte ranges"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body: bool):
+        entry = self.server.files.get(self.path)
+        if entry is None:
+            self.send_error(404)
+            return
+
+        entry.requests.append((self.command, dict(self.headers)))
+        if send_body:
+            entry.gets += 1
+            if entry.gets <= entry.fail_requests:
+                self.send_response(503)
+                self.send_header('Retry-After', '0')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        slow = entry.chunk_delay and (entry.slow_requests is None or entry.gets <= entry.slow_requests)
+        content = entry.content
+        total = len(content)
+        start, end = 0, total - 1
+        status = 200
+
+        if entry.etag and self.headers.get('If-None-Match') == entry.etag:
+            self.send_response(304)
+            self.send_header('ETag', entry.etag)
+            self.end_headers()
+            return
+
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if if_range is not None and if_range != entry.etag:
+            range_header = None  # The client's copy is stale, send the whole file
+        if range_header and entry.support_ranges:
+            match = RANGE_PATTERN.match(range_header)
+            if match:
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = int(match.group(2)) if match.group(2) else total - 1
+                else:
+                    start = max(0, total - int(match.group(2)))
+                end = min(end, total - 1)
+                if start > end:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{total}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status = 206
+
+        body = content[start:end + 1]
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Content-Type', 'application/octet-stream')
+        if entry.support_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if entry.etag:
+            self.send_header('ETag', entry.etag)
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{total}')
+        self.end_headers()
+
+        if send_body:
+            try:
+                if slow:
+                    for offset in range(0, len(body), 16384):
+                        self.wfile.write(body[offset:offset + 16384])
+                        time.sleep(entry.chunk_delay)
+                else:
+                    self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+class LocalHTTPServer:
+    """Run a threaded HTTP server on localhost for the duration of a test"""
+
+    def __init__(self):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.files: Dict[str, FileEntry] = {}
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def add_file(self, path: str, content: bytes, **options) -> FileEntry:
+        """Register a payload and return its entry"""
+        entry = FileEntry(content, **options)
+        self.httpd.files[path] = entry
+        return entry
+
+    def url(self, path: str) -> str:
+        """Get the absolute URL of a registered path"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,65 @@
+"""
+Tests for atomic file writes
+"""
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from utils.atomic import atomic_write, temp_path_for, write_json
+
+class TestAtomicWrite(unittest.TestCase):
+    """Test cases for writing files through private temporary files"""
+
+    def setUp(self):
+        """Create a temporary directory"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'cache.json')
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def test_failed_write_keeps_file(self):
+        """Test a write that raises leaves the old file and no temporary file"""
+        write_json(self.path, {'version': 1})
+        with self.assertRaises(RuntimeError):
+            with atomic_write(self.path) as f:
+                f.write('{"trunc')
+                raise RuntimeError('interrupted')
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'version': 1})
+        self.assertEqual(os.listdir(self.temp_dir.name), ['cache.json'])
+
+    def test_concurrent_writes(self):
+        """Test threads writing the same file at once never leave it partial"""
+        errors = []
+
+        def save(index: int):
+            try:
+                for _ in range(20):
+                    write_json(self.path, {'writer': index, 'data': 'x' * 10000})
+            except OSError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        with open(self.path, encoding='utf-8') as f:
+            self.assertIn(json.load(f)['writer'], range(8))
+        self.assertEqual(os.listdir(self.temp_dir.name), ['cache.json'])
+
+    def test_temp_path_for(self):
+        """Test temporary paths are unused and next to their target"""
+        first, second = temp_path_for(self.path), temp_path_for(self.path)
+        self.assertNotEqual(first, second)
+        self.assertEqual(os.path.dirname(first), self.temp_dir.name)
+        self.assertFalse(os.path.exists(first))
+
+if __name__ == '__main__':
+    unittest.main()
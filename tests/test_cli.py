@@ -0,0 +1,245 @@
+"""
+Tests for the headless command line interface
+"""
+
+import unittest
+import tempfile
+import hashlib
+import json
+import io
+import os
+import subprocess
+import sys
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import cli
+from tests.http_server import LocalHTTPServer
+
+class TestCLI(unittest.TestCase):
+    """Test cases for the CLI"""
+    
+    def setUp(self):
+        """Serve two ISOs and write a catalog pointing at them"""
+        self.good = os.urandom(2 * 1024 * 1024 + 11)
+        self.bad = os.urandom(1024)
+        self.server = LocalHTTPServer()
+        self.server.add_file('/good.iso', self.good)
+        self.server.add_file('/bad.iso', self.bad)
+        self.server.start()
+        
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dest = os.path.join(self.temp_dir.name, 'isos')
+        self.store = os.path.join(self.temp_dir.name, 'store')
+        self.journal = os.path.join(self.temp_dir.name, 'journal.sqlite3')
+        self.data_file = os.path.join(self.temp_dir.name, 'distro_data.json')
+        data = {
+            "Test": {
+                "description": "Test distribution",
+                "editions": {
+                    "Good": {
+                        "filename": "good.iso",
+                        "url": self.server.url('/good.iso'),
+                        "checksum": hashlib.sha256(self.good).hexdigest()
+                    },
+                    "Bad": {
+                        "filename": "bad.iso",
+                        "url": self.server.url('/bad.iso'),
+                        "checksum": "0" * 64
+                    }
+                }
+            }
+        }
+        with open(self.data_file, 'w') as f:
+            json.dump(data, f)
+    
+    def tearDown(self):
+        """Stop the server and remove files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+    
+    def run_cli(self, *args):
+        """Run the CLI and return its exit code and events"""
+        output = io.StringIO()
+        with redirect_stdout(output):
+            code = cli.main(['--data', self.data_file, '--store', self.store, '--journal', self.journal]
+                            + list(args))
+        return code, [json.loads(line) for line in output.getvalue().splitlines()]
+    
+    def test_list(self):
+        """Test listing editions as JSON lines"""
+        code, events = self.run_cli('list')
+        self.assertEqual(code, 0)
+        self.assertEqual([e['edition'] for e in events], ['Good', 'Bad'])
+    
+    def test_fetch_edition(self):
+        """Test fetching and verifying a single edition"""
+        code, events = self.run_cli('fetch', 'Test', 'Good', '--dest', self.dest, '--progress-interval', '0')
+        self.assertEqual(code, 0)
+        kinds = [e['event'] for e in events]
+        self.assertEqual(kinds[:2], ['queued', 'started'])
+        self.assertIn('completed', kinds)
+        self.assertEqual(kinds[-1], 'summary')
+        with open(os.path.join(self.dest, 'good.iso'), 'rb') as f:
+            self.assertEqual(f.read(), self.good)
+    
+    def test_fetch_all_reports_failures(self):
+        """Test a checksum failure makes the batch fail"""
+        code, events = self.run_cli('fetch', '--all', '--dest', self.dest)
+        self.assertEqual(code, 1)
+        finished = {e['edition']: e for e in events if e['event'] in ('completed', 'failed')}
+        self.assertEqual(finished['Good']['event'], 'completed')
+        self.assertEqual(finished['Bad']['event'], 'failed')
+        self.assertEqual(finished['Bad']['error'], 'Checksum verification failed')
+        self.assertEqual(events[-1], dict(events[-1], succeeded=1, failed=1))
+    
+    def test_fetch_manifest_skip_existing(self):
+        """Test manifest mode and skipping files that already verify"""
+        manifest = os.path.join(self.temp_dir.name, 'manifest.json')
+        with open(manifest, 'w') as f:
+            json.dump([{"distro": "Test", "edition": "Good"}], f)
+        
+        self.assertEqual(self.run_cli('fetch', '--manifest', manifest, '--dest', self.dest)[0], 0)
+        code, events = self.run_cli('fetch', '--manifest', manifest, '--dest', self.dest, '--skip-existing')
+        self.assertEqual(code, 0)
+        self.assertEqual([e['event'] for e in events], ['skipped', 'summary'])
+    
+    def test_fetch_resume_and_history(self):
+        """Test an unfinished download recorded in the journal is resumed and shows in the history"""
+        from utils.download_queue import QueueItem
+        from utils.journal import DownloadJournal
+        
+        journal = DownloadJournal(self.journal)
+        info = {'url': self.server.url('/good.iso'), 'filename': 'good.iso',
+                'checksum': hashlib.sha256(self.good).hexdigest()}
+        journal.add_job(QueueItem(1, 'Test', 'Good', self.dest, info))
+        journal.close()
+        
+        code, events = self.run_cli('--no-store', 'fetch', '--resume')
+        self.assertEqual(code, 0)
+        self.assertEqual([e['file'] for e in events if e['event'] == 'resumed'],
+                         [os.path.join(self.dest, 'good.iso')])
+        self.assertEqual(events[-1], dict(events[-1], succeeded=1, failed=0))
+        
+        code, events = self.run_cli('history')
+        jobs = [e for e in events if e['event'] == 'job']
+        self.assertEqual([(job['edition'], job['state'], job['verified']) for job in jobs], [('Good', 'completed', True)])
+        self.assertEqual([e['url'] for e in events if e['event'] == 'mirror'], [info['url']])
+    
+    def test_fetch_from_store(self):
+        """Test a verified ISO is provided to another directory without downloading"""
+        self.assertEqual(self.run_cli('fetch', 'Test', 'Good', '--dest', self.dest)[0], 0)
+        requests_before = len(self.server.httpd.files['/good.iso'].requests)
+        
+        other = os.path.join(self.temp_dir.name, 'other')
+        code, events = self.run_cli('fetch', 'Test', 'Good', '--dest', other)
+        self.assertEqual(code, 0)
+        provisioned = [e for e in events if e['event'] == 'provisioned']
+        self.assertEqual(len(provisioned), 1)
+        self.assertEqual(len(self.server.httpd.files['/good.iso'].requests), requests_before)
+        with open(os.path.join(other, 'good.iso'), 'rb') as f:
+            self.assertEqual(f.read(), self.good)
+    
+    def test_verify_library(self):
+        """Test auditing a directory reports ok, mismatch and unknown files"""
+        os.makedirs(self.dest)
+        for name, content in (('good.iso', self.good), ('bad.iso', self.bad), ('other.iso', b'other')):
+            with open(os.path.join(self.dest, name), 'wb') as f:
+                f.write(content)
+        
+        code, events = self.run_cli('verify', self.dest, '--workers', '2')
+        self.assertEqual(code, 1)
+        statuses = {os.path.basename(e['path']): e['status'] for e in events if e['event'] == 'verified'}
+        self.assertEqual(statuses, {'good.iso': 'ok', 'bad.iso': 'mismatch', 'other.iso': 'unknown'})
+        self.assertEqual(events[-1]['event'], 'summary')
+        self.assertEqual((events[-1]['ok'], events[-1]['mismatch'], events[-1]['unknown']), (1, 1, 1))
+        
+        # Unchanged files come from the hash cache the second time
+        code, events = self.run_cli('verify', self.dest)
+        self.assertEqual(events[-1]['cached'], 3)
+        self.assertEqual(events[-1]['bytes_hashed'], 0)
+    
+    def test_verify_repair(self):
+        """Test a corrupted ISO is repaired from piece hashes recorded when it was fetched"""
+        self.assertEqual(self.run_cli('--no-store', 'fetch', 'Test', 'Good', '--dest', self.dest)[0], 0)
+        path = os.path.join(self.dest, 'good.iso')
+        with open(path, 'r+b') as f:
+            f.seek(1000)
+            f.write(b'corrupt')
+        
+        code, events = self.run_cli('--no-store', 'verify', self.dest, '--repair')
+        self.assertEqual(code, 0)
+        self.assertIn('repaired', [e['event'] for e in events])
+        self.assertEqual(events[-1]['mismatch'], 0)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.good)
+    
+    def test_delta_from_older_iso(self):
+        """Test an edition is built from an older ISO and a generated block map"""
+        source = os.path.join(self.temp_dir.name, 'good.iso')
+        old = os.path.join(self.temp_dir.name, 'old.iso')
+        with open(source, 'wb') as f:
+            f.write(self.good)
+        with open(old, 'wb') as f:
+            f.write(self.good[:1024 * 1024] + os.urandom(4096) + self.good[1024 * 1024 + 4096:])
+        
+        code, events = self.run_cli('blockmap', source)
+        self.assertEqual(code, 0)
+        code, events = self.run_cli('delta', 'Test', 'Good', '--from', old, '--dest', self.dest,
+                                    '--map', events[0]['output'])
+        self.assertEqual(code, 0)
+        completed = events[-1]
+        self.assertEqual(completed['event'], 'completed')
+        self.assertEqual(completed['reused'] + completed['fetched'], len(self.good))
+        self.assertLess(completed['fetched'], 512 * 1024)
+        with open(os.path.join(self.dest, 'good.iso'), 'rb') as f:
+            self.assertEqual(f.read(), self.good)
+    
+    def test_sync_directory(self):
+        """Test a dry run plans fetches, a sync fetches what verifies and a rerun keeps it"""
+        code, events = self.run_cli('sync', self.dest, '--dry-run')
+        self.assertEqual(code, 0)
+        self.assertEqual([e['action'] for e in events if e['event'] == 'plan'], ['fetch', 'fetch'])
+        self.assertFalse(os.path.exists(self.dest))
+        
+        code, events = self.run_cli('sync', self.dest)
+        self.assertEqual(code, 1)
+        self.assertEqual(events[-1]['event'], 'sync')
+        self.assertEqual(events[-1]['failed'], 1)
+        self.assertEqual(sorted(f for f in os.listdir(self.dest) if f.endswith('.iso')), ['good.iso'])
+        
+        code, events = self.run_cli('sync', self.dest, '--dry-run')
+        self.assertEqual({e['file']: e['action'] for e in events if e['event'] == 'plan'},
+                         {os.path.join(self.dest, 'good.iso'): 'keep', os.path.join(self.dest, 'bad.iso'): 'fetch'})
+    
+    def test_serve_as_mirror_server(self):
+        """Test another process serving its store is used as the preferred mirror and fetches upstream once"""
+        root = Path(__file__).parent.parent
+        server = subprocess.Popen([sys.executable, 'cli.py', '--data', self.data_file, '--no-journal',
+                                   '--store', os.path.join(self.temp_dir.name, 'lan-store'),
+                                   'serve', '--bind', '127.0.0.1', '--port', '0'],
+                                  cwd=root, stdout=subprocess.PIPE, text=True)
+        try:
+            serving = json.loads(server.stdout.readline())
+            self.assertEqual(serving['event'], 'serving')
+            for dest in ('first', 'second'):
+                code, events = self.run_cli('--no-store', '--mirror-server', serving['url'], 'fetch', 'Test', 'Good',
+                                            '--dest', os.path.join(self.temp_dir.name, dest), '--no-mirror-ranking')
+                self.assertEqual(code, 0)
+                with open(os.path.join(self.temp_dir.name, dest, 'good.iso'), 'rb') as f:
+                    self.assertEqual(f.read(), self.good)
+            self.assertEqual(self.server.httpd.files['/good.iso'].gets, 1)
+        finally:
+            server.terminate()
+            output = server.communicate(timeout=30)[0]
+        self.assertEqual(json.loads(output.splitlines()[-1])['event'], 'stopped')
+    
+    def test_no_gui_imports(self):
+        """Test the CLI never imports GUI toolkits"""
+        root = Path(__file__).parent.parent
+        code = "import sys, cli; print(any(m.split('.')[0] in ('customtkinter', 'tkinter') for m in sys.modules))"
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True)
+        self.assertEqual(result.stdout.strip(), 'False')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -71,6 +71,33 @@ class TestDistroDataManager(unittest.TestCase):
         info = self.manager.get_download_info('Ubuntu', 'NonExistent')
         self.assertIsNone(info)
     
+    def test_get_download_info_mirrors(self):
+        """Test mirror lists are returned with the primary URL first"""
+        edition = self.manager.data['Ubuntu']['editions']['Desktop']
+        edition['mirrors'] = ["https://mirror.example.com/ubuntu-22.04-desktop-amd64.iso", edition['url']]
+        
+        info = self.manager.get_download_info('Ubuntu', 'Desktop')
+        self.assertEqual(info['mirrors'], [edition['url'], edition['mirrors'][0]])
+        
+        del edition['mirrors']
+        info = self.manager.get_download_info('Ubuntu', 'Desktop')
+        self.assertEqual(info['mirrors'], [edition['url']])
+    
+    def test_validate_mirrors(self):
+        """Test validation of edition mirror lists"""
+        edition = dict(self.test_data['Ubuntu']['editions']['Desktop'])
+        edition['mirrors'] = ["https://mirror.example.com/ubuntu.iso"]
+        self.assertTrue(self.manager.validate_edition('Ubuntu', 'Desktop', edition))
+        
+        edition['mirrors'] = ["file:///srv/mirror/ubuntu.iso"]
+        self.assertTrue(self.manager.validate_edition('Ubuntu', 'Desktop', edition))
+        
+        edition['mirrors'] = ["ftp://mirror.example.com/ubuntu.iso"]
+        self.assertFalse(self.manager.validate_edition('Ubuntu', 'Desktop', edition))
+        
+        edition['mirrors'] = "https://mirror.example.com/ubuntu.iso"
+        self.assertFalse(self.manager.validate_edition('Ubuntu', 'Desktop', edition))
+    
     def test_validate_data(self):
         """Test data validation"""
         self.assertTrue(self.manager.validate_data())
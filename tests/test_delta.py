@@ -0,0 +1,136 @@
+"""
+Tests for delta updates from an older ISO
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+
+from utils.delta import ISO_SECTOR, BlockMap, create_block_map, delta_update, fetch_block_map, rsum, strong_digest
+from tests.http_server import LocalHTTPServer
+
+BLOCK_SIZE = 8 * 1024
+
+def md4_available() -> bool:
+    try:
+        strong_digest('md4')
+        return True
+    except ValueError:
+        return False
+
+def zsync(content: bytes, block_size: int, rsum_bytes: int = 3, checksum_bytes: int = 8) -> bytes:
+    """Write a .zsync file the way zsyncmake does"""
+    digest = strong_digest('md4')
+    entries = b''
+    for offset in range(0, len(content), block_size):
+        block = content[offset:offset + block_size].ljust(block_size, b'\0')
+        entries += rsum(block)[4 - rsum_bytes:] + digest(block)[:checksum_bytes]
+    header = (f"zsync: 0.6.2\nFilename: new.iso\nBlocksize: {block_size}\nLength: {len(content)}\n"
+              f"Hash-Lengths: 2,{rsum_bytes},{checksum_bytes}\nURL: new.iso\n"
+              f"SHA-1: {hashlib.sha1(content).hexdigest()}\n\n")
+    return header.encode() + entries
+
+class TestDelta(unittest.TestCase):
+    """Test cases for block maps and delta updates"""
+
+    def setUp(self):
+        """Serve a new ISO that shares most sectors with an old one on disk"""
+        sectors = [os.urandom(ISO_SECTOR) for _ in range(400)]
+        self.old = b''.join(sectors)
+        # Changed sectors, sectors inserted (shifting the rest) and a shorter tail
+        sectors[10] = os.urandom(ISO_SECTOR)
+        sectors[200:200] = [os.urandom(ISO_SECTOR) for _ in range(3)]
+        self.new = b''.join(sectors)[:-1000]
+        self.checksum = hashlib.sha256(self.new).hexdigest()
+
+        self.server = LocalHTTPServer()
+        self.entry = self.server.add_file('/new.iso', self.new)
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.old_path = self.write('old.iso', self.old)
+        self.new_path = self.write('new-source.iso', self.new)
+        self.filepath = os.path.join(self.temp_dir.name, 'new.iso')
+
+    def tearDown(self):
+        """Stop the server and remove files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def write(self, name: str, content: bytes) -> str:
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def fetched_bytes(self) -> int:
+        total = 0
+        for _, headers in self.entry.requests:
+            start, end = headers['Range'][len('bytes='):].split('-')
+            total += int(end) - int(start) + 1
+        return total
+
+    def test_rsum(self):
+        """Test the rolling checksum matches its definition"""
+        block = os.urandom(1000)
+        a = sum(block) % 65536
+        b = sum((len(block) - i) * byte for i, byte in enumerate(block)) % 65536
+        self.assertEqual(rsum(block), a.to_bytes(2, 'big') + b.to_bytes(2, 'big'))
+
+    def test_block_map_round_trip(self):
+        """Test a generated block map survives saving and loading"""
+        block_map = create_block_map(self.new_path, BLOCK_SIZE)
+        self.assertEqual(block_map.sha256, self.checksum)
+        self.assertEqual(len(block_map), (len(self.new) + BLOCK_SIZE - 1) // BLOCK_SIZE)
+        path = self.write('new.iso.blockmap.json', json.dumps(block_map.to_dict()).encode())
+        loaded = fetch_block_map(path)
+        self.assertEqual(loaded.entries, block_map.entries)
+        self.assertEqual(loaded.length, len(self.new))
+        with self.assertRaises(ValueError):
+            BlockMap.parse(b'<html></html>')
+
+    def test_delta_update(self):
+        """Test only changed blocks are fetched and the result matches the catalog checksum"""
+        block_map = create_block_map(self.new_path, BLOCK_SIZE)
+        report = delta_update([self.server.url('/new.iso')], self.filepath, self.checksum, self.old_path, block_map)
+        self.assertIsNotNone(report)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.new)
+        self.assertEqual(report.reused + report.fetched, len(self.new))
+        self.assertEqual(report.fetched, self.fetched_bytes())
+        # The changed sector and the inserted ones spoil a few blocks; everything else is reused
+        self.assertLess(report.fetched, len(self.new) // 4)
+        self.assertFalse(os.path.exists(self.filepath + '.delta'))
+
+    def test_wrong_checksum_discarded(self):
+        """Test an assembled file that does not match is not kept"""
+        block_map = create_block_map(self.new_path, BLOCK_SIZE)
+        block_map.sha256 = None
+        self.assertIsNone(delta_update([self.server.url('/new.iso')], self.filepath, '0' * 64,
+                                       self.old_path, block_map))
+        self.assertFalse(os.path.exists(self.filepath))
+        self.assertFalse(os.path.exists(self.filepath + '.delta'))
+
+    def test_parse_zsync_header(self):
+        """Test the fields of a .zsync header are read"""
+        entries = b'\1' * 11 * 3
+        content = b"zsync: 0.6.2\nBlocksize: 2048\nLength: 5000\nHash-Lengths: 2,3,8\n\n" + entries
+        block_map = BlockMap.parse(content)
+        self.assertEqual((block_map.block_size, block_map.length, len(block_map)), (2048, 5000, 3))
+        self.assertEqual((block_map.hash_type, block_map.weak_type, block_map.weak_bytes), ('md4', 'rsum', 3))
+        with self.assertRaises(ValueError):
+            BlockMap.parse(content[:-1])
+
+    @unittest.skipUnless(md4_available(), "MD4 is not available")
+    def test_delta_update_from_zsync(self):
+        """Test a .zsync file drives a delta update"""
+        path = self.write('new.iso.zsync', zsync(self.new, ISO_SECTOR))
+        report = delta_update([self.server.url('/new.iso')], self.filepath, self.checksum, self.old_path,
+                              fetch_block_map(path))
+        self.assertIsNotNone(report)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.new)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+"""
+Tests for the download queue
+"""
+
+import hashlib
+import os
+import tempfile
+import unittest
+import threading
+
+from utils.download_queue import DownloadQueue, QueueItem, QUEUED, DOWNLOADING, COMPLETED, FAILED, CANCELLED
+from utils.downloader import StreamingHasher
+from utils.part_state import PartState
+from tests.http_server import LocalHTTPServer
+
+def download_info(host: str, name: str) -> dict:
+    """Build download information for a fake edition"""
+    return {
+        'url': f"https://{host}/{name}.iso",
+        'filename': f"{name}.iso",
+        'checksum': "0" * 64
+    }
+
+class TestDownloadQueue(unittest.TestCase):
+    """Test cases for DownloadQueue"""
+    
+    def setUp(self):
+        """Create a queue whose downloads block until released"""
+        self.started = []
+        self.release = {}
+        self.lock = threading.Lock()
+        self.closing = False
+        self.queue = DownloadQueue(self.fake_download, max_concurrent=2, per_host_limit=1)
+    
+    def tearDown(self):
+        """Let any blocked download finish"""
+        with self.lock:
+            self.closing = True
+            for event in self.release.values():
+                event.set()
+        self.queue.wait(5)
+    
+    def fake_download(self, item) -> bool:
+        """Block until the test releases the item"""
+        with self.lock:
+            self.started.append(item.filename)
+            event = self.release.setdefault(item.filename, threading.Event())
+            if self.closing:
+                event.set()
+        while not event.wait(0.01):
+            if item.cancelled:
+                return False
+        return item.filename != "bad.iso"
+    
+    def finish(self, filename: str):
+        """Release a blocked download and wait for the queue to react"""
+        with self.lock:
+            self.release.setdefault(filename, threading.Event()).set()
+    
+    def wait_for(self, condition, timeout: float = 5.0):
+        """Poll until condition is true"""
+        event = threading.Event()
+        for _ in range(int(timeout / 0.01)):
+            if condition():
+                return
+            event.wait(0.01)
+        self.fail("Condition not reached")
+    
+    def test_concurrency_and_host_limits(self):
+        """Test the global limit and the per-host cap"""
+        a1 = self.queue.add("A", "1", "/tmp", download_info("a.example", "a1"))
+        a2 = self.queue.add("A", "2", "/tmp", download_info("a.example", "a2"))
+        b1 = self.queue.add("B", "1", "/tmp", download_info("b.example", "b1"))
+        c1 = self.queue.add("C", "1", "/tmp", download_info("c.example", "c1"))
+        
+        # a2 waits for its host, so b1 starts ahead of it; c1 waits for a free slot
+        self.wait_for(lambda: len(self.started) == 2)
+        self.assertEqual(sorted(self.started), ["a1.iso", "b1.iso"])
+        self.assertEqual(a2.state, QUEUED)
+        self.assertEqual(c1.state, QUEUED)
+        
+        self.finish("a1.iso")
+        self.wait_for(lambda: len(self.started) == 3)
+        self.assertEqual(self.started[2], "a2.iso")
+        self.assertEqual(a1.state, COMPLETED)
+        
+        for name in ("a2.iso", "b1.iso", "c1.iso"):
+            self.finish(name)
+        self.assertTrue(self.queue.wait(5))
+        self.assertEqual([a2.state, b1.state, c1.state], [COMPLETED] * 3)
+    
+    def test_shared_fallback_mirror(self):
+        """Test items sharing only a fallback mirror run together"""
+        first = dict(download_info("a.example", "first"), mirrors=["https://a.example/first.iso",
+                                                                   "https://fallback.example/first.iso"])
+        second = dict(download_info("b.example", "second"), mirrors=["https://b.example/second.iso",
+                                                                     "https://fallback.example/second.iso"])
+        self.queue.add("A", "1", "/tmp", first)
+        self.queue.add("B", "1", "/tmp", second)
+        self.wait_for(lambda: len(self.started) == 2)
+        self.assertEqual(sorted(self.started), ["first.iso", "second.iso"])
+
+    def test_reorder(self):
+        """Test moving an item changes the start order"""
+        self.queue.set_limits(max_concurrent=1)
+        first = self.queue.add("A", "1", "/tmp", download_info("a.example", "first"))
+        second = self.queue.add("B", "1", "/tmp", download_info("b.example", "second"))
+        third = self.queue.add("C", "1", "/tmp", download_info("c.example", "third"))
+        
+        self.queue.move(third.id, -1)
+        self.assertEqual([item.id for item in self.queue.items], [first.id, third.id, second.id])
+        
+        self.finish("first.iso")
+        self.wait_for(lambda: len(self.started) == 2)
+        self.assertEqual(self.started[1], "third.iso")
+    
+    def test_pause_and_cancel(self):
+        """Test paused items are not started and cancelled items stop"""
+        self.queue.set_limits(max_concurrent=1)
+        running = self.queue.add("A", "1", "/tmp", download_info("a.example", "running"))
+        paused = self.queue.add("B", "1", "/tmp", download_info("b.example", "paused"))
+        waiting = self.queue.add("C", "1", "/tmp", download_info("c.example", "waiting"))
+        
+        self.queue.pause(paused.id)
+        self.queue.cancel(waiting.id)
+        self.assertEqual(waiting.state, CANCELLED)
+        
+        self.wait_for(lambda: running.state == DOWNLOADING)
+        self.queue.cancel(running.id)
+        self.wait_for(lambda: running.state == CANCELLED)
+        self.assertEqual(paused.state, QUEUED)
+        
+        self.queue.resume(paused.id)
+        self.wait_for(lambda: paused.state == DOWNLOADING)
+        self.finish("paused.iso")
+        self.assertTrue(self.queue.wait(5))
+        self.assertEqual(self.started, ["running.iso", "paused.iso"])
+    
+    def test_failed_item(self):
+        """Test a failing download is reported as failed"""
+        item = self.queue.add("A", "1", "/tmp", download_info("a.example", "bad"))
+        self.finish("bad.iso")
+        self.assertTrue(self.queue.wait(5))
+        self.assertEqual(item.state, FAILED)
+
+class TestResume(unittest.TestCase):
+    """Test cases for resuming single-stream downloads from a .part file"""
+    
+    def setUp(self):
+        """Start a local server and create a download directory"""
+        self.content = os.urandom(300 * 1024)
+        self.server = LocalHTTPServer()
+        self.entry = self.server.add_file('/file.iso', self.content, etag='"v1"')
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.item = QueueItem(1, 'Test', 'Edition', self.temp_dir.name, {
+            'url': self.server.url('/file.iso'),
+            'filename': 'file.iso',
+            'checksum': hashlib.sha256(self.content).hexdigest()
+        })
+        self.part_path = self.item.filepath + '.part'
+    
+    def tearDown(self):
+        """Stop the server and remove downloaded files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+    
+    def write_partial(self, data: bytes, etag: str = '"v1"'):
+        """Create a .part file with a sidecar recording its origin"""
+        with open(self.part_path, 'wb') as f:
+            f.write(data)
+        PartState(self.item.url, len(self.content), etag, ranges=[(0, len(data))]).save(self.part_path)
+    
+    def download(self) -> bool:
+        hasher = StreamingHasher()
+        ok = self.item.download(hasher)
+        return ok and hasher.verify(self.item.filepath, self.item.checksum)
+    
+    def test_resume_with_if_range(self):
+        """Test an unchanged file resumes with a range request validated by ETag"""
+        self.write_partial(self.content[:100000])
+        self.assertTrue(self.download())
+        method, headers = self.entry.requests[-1]
+        self.assertEqual(headers['Range'], 'bytes=100000-')
+        self.assertEqual(headers['If-Range'], '"v1"')
+        self.assertFalse(os.path.exists(self.part_path + '.json'))
+    
+    def test_changed_file_restarts(self):
+        """Test a partial of an older file is replaced, not appended to"""
+        self.write_partial(os.urandom(100000), etag='"v0"')
+        self.assertTrue(self.download())
+        with open(self.item.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+    
+    def test_ignored_range_keeps_partial(self):
+        """Test a 200 reply to a range request skips the bytes already on disk"""
+        self.entry.support_ranges = False
+        self.write_partial(self.content[:100000])
+        self.assertTrue(self.download())
+        with open(self.item.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+    
+    def test_failed_download_keeps_state(self):
+        """Test an interrupted download leaves a resumable sidecar"""
+        self.item.cancel()
+        self.assertFalse(self.item.download())
+        state = PartState.load(self.part_path)
+        self.assertEqual(state.etag, '"v1"')
+        self.assertEqual(state.size, len(self.content))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,10 +4,21 @@ Tests for download functionality
 
 import unittest
 import tempfile
+import hashlib
 import os
+import threading
+import time
+from pathlib import Path
 from unittest.mock import patch, MagicMock
 
-from utils.downloader import DownloadProgress, calculate_sha256, verify_checksum
+import requests
+
+from utils.downloader import (MAX_READ_SIZE, MIN_READ_SIZE, ByteRange, BufferedFileWriter, DownloadProgress,
+                              StreamingHasher, calculate_sha256, verify_checksum, probe_download, split_ranges,
+                              download_segmented, copy_stream, next_read_size, DownloadJob, FileTransport,
+                              JobControl, RetryPolicy, Urllib3Transport, is_retryable, preallocate)
+from utils.part_state import PartState
+from tests.http_server import LocalHTTPServer
 
 class TestDownloadProgress(unittest.TestCase):
     """Test cases for DownloadProgress"""
@@ -35,6 +46,31 @@ class TestDownloadProgress(unittest.TestCase):
             self.assertGreater(self.progress.speed_mbps, 0.9)
             self.assertLess(self.progress.speed_mbps, 1.1)
     
+    def test_worker_slots(self):
+        """Test updates from several worker slots are combined"""
+        self.progress.update(256 * 1024, 0)
+        self.progress.update(256 * 1024, 1)
+        self.progress.update(512 * 1024, 2)
+        self.assertEqual(self.progress.downloaded, 1024 * 1024)
+        self.assertEqual(self.progress.progress_percent, 100.0)
+    
+    def test_sampled_speed_and_eta(self):
+        """Test the smoothed speed and ETA computed by sampling"""
+        progress = DownloadProgress(total_size=10 * 1024 * 1024)
+        start = progress.start_time
+        
+        progress.update(1024 * 1024)
+        progress.sample(start + 1)
+        self.assertAlmostEqual(progress.speed_mbps, 1.0)
+        self.assertAlmostEqual(progress.eta_seconds, 9.0)
+        
+        # A burst is smoothed rather than taken at face value
+        progress.update(3 * 1024 * 1024)
+        progress.sample(start + 2)
+        self.assertGreater(progress.speed_mbps, 1.0)
+        self.assertLess(progress.speed_mbps, 3.0)
+        self.assertEqual(progress.format_eta(), "00:03")
+    
     def test_format_size(self):
         """Test file size formatting"""
         self.assertEqual(self.progress.format_size(1024), "1.0 KB")
@@ -81,5 +117,451 @@ class TestChecksumFunctions(unittest.TestCase):
         finally:
             os.unlink(temp_path)
 
+class TestStreamingHasher(unittest.TestCase):
+    """Test cases for StreamingHasher"""
+    
+    def setUp(self):
+        """Create a file written in two halves"""
+        self.content = os.urandom(300000)
+        self.expected = hashlib.sha256(self.content).hexdigest()
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(self.content)
+            self.temp_path = f.name
+    
+    def tearDown(self):
+        """Remove the temporary file"""
+        os.unlink(self.temp_path)
+    
+    def test_inline_hashing(self):
+        """Test in-order data is hashed without reading the file"""
+        hasher = StreamingHasher()
+        self.assertTrue(hasher.update(0, self.content[:1000]))
+        self.assertTrue(hasher.update(1000, self.content[1000:]))
+        self.assertEqual(hasher.position, len(self.content))
+        self.assertEqual(hasher.hexdigest(), self.expected)
+    
+    def test_out_of_order_data(self):
+        """Test data beyond the hashed prefix is read back from disk"""
+        hasher = StreamingHasher()
+        self.assertFalse(hasher.update(1000, self.content[1000:2000]))
+        hasher.advance(self.temp_path, 1500)
+        self.assertEqual(hasher.position, 1500)
+        self.assertTrue(hasher.update(1500, self.content[1500:2000]))
+        self.assertTrue(hasher.verify(self.temp_path, self.expected))
+    
+    def test_resumed_prefix(self):
+        """Test a resumed download only hashes its existing prefix once"""
+        hasher = StreamingHasher()
+        hasher.advance(self.temp_path, 100000)
+        hasher.update(100000, self.content[100000:])
+        self.assertTrue(hasher.verify(self.temp_path, self.expected))
+        self.assertFalse(hasher.verify(self.temp_path, "0" * 64))
+
+class TestSegmentedDownload(unittest.TestCase):
+    """Test cases for multi-connection segmented downloads"""
+    
+    def setUp(self):
+        """Start a local server and create a download directory"""
+        self.content = os.urandom(3 * 1024 * 1024 + 123)
+        self.server = LocalHTTPServer()
+        self.server.add_file('/ranged.iso', self.content)
+        self.server.add_file('/plain.iso', self.content, support_ranges=False)
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.temp_dir.name, 'test.iso')
+    
+    def tearDown(self):
+        """Stop the server and remove downloaded files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+    
+    def test_split_ranges(self):
+        """Test ranges cover the whole file without overlap"""
+        ranges = split_ranges(len(self.content), 4)
+        self.assertEqual(len(ranges), 3)  # Limited by the minimum segment size
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(self.content) - 1)
+        for previous, current in zip(ranges, ranges[1:]):
+            self.assertEqual(previous[1] + 1, current[0])
+    
+    def test_probe_download(self):
+        """Test detection of byte range support"""
+        info = probe_download(self.server.url('/ranged.iso'))
+        self.assertTrue(info['accepts_ranges'])
+        self.assertEqual(info['size'], len(self.content))
+        
+        info = probe_download(self.server.url('/plain.iso'))
+        self.assertFalse(info['accepts_ranges'])
+        self.assertEqual(info['size'], len(self.content))
+    
+    def test_download_segmented(self):
+        """Test segments are reassembled into the original file"""
+        progress = DownloadProgress()
+        ok = download_segmented(self.server.url('/ranged.iso'), self.filepath, len(self.content),
+                                segments=3, progress=progress)
+        self.assertTrue(ok)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(os.path.exists(self.filepath + '.part'))
+        self.assertEqual(progress.total_size, len(self.content))
+        self.assertEqual(progress.downloaded, len(self.content))
+    
+    def test_download_segmented_hashing(self):
+        """Test the checksum is computed while segments arrive"""
+        hasher = StreamingHasher()
+        ok = download_segmented(self.server.url('/ranged.iso'), self.filepath, len(self.content),
+                                segments=3, hasher=hasher)
+        self.assertTrue(ok)
+        self.assertTrue(hasher.verify(self.filepath, hashlib.sha256(self.content).hexdigest()))
+    
+    def test_download_segmented_cancelled(self):
+        """Test cancellation stops every segment and keeps the partial for resume"""
+        control = JobControl()
+        control.cancel()
+        ok = download_segmented(self.server.url('/ranged.iso'), self.filepath, len(self.content),
+                                segments=3, control=control)
+        self.assertFalse(ok)
+        self.assertFalse(os.path.exists(self.filepath))
+        state = PartState.load(self.filepath + '.part')
+        self.assertEqual(state.size, len(self.content))
+        self.assertEqual(state.completed_bytes, 0)
+    
+    def test_download_segmented_resume(self):
+        """Test only the missing ranges of a partial are fetched"""
+        url = self.server.url('/ranged.iso')
+        done = 1024 * 1024
+        with open(self.filepath + '.part', 'wb') as f:
+            f.write(self.content[:done])
+        state = PartState(url, len(self.content), ranges=[(0, done)])
+        
+        progress = DownloadProgress()
+        hasher = StreamingHasher()
+        ok = download_segmented(url, self.filepath, len(self.content), segments=2, progress=progress,
+                                hasher=hasher, state=state)
+        self.assertTrue(ok)
+        self.assertTrue(hasher.verify(self.filepath, hashlib.sha256(self.content).hexdigest()))
+        self.assertFalse(os.path.exists(self.filepath + '.part.json'))
+        requested = [headers['Range'] for _, headers in self.server.httpd.files['/ranged.iso'].requests]
+        self.assertTrue(all(int(r.split('=')[1].split('-')[0]) >= done for r in requested))
+        self.assertEqual(progress.downloaded, len(self.content))
+
+class TestStreamingWriter(unittest.TestCase):
+    """Test cases for the buffered readinto transfer loop"""
+    
+    def setUp(self):
+        """Start a local server and create a target file"""
+        self.content = os.urandom(2 * 1024 * 1024 + 77)
+        self.server = LocalHTTPServer()
+        self.server.add_file('/file.iso', self.content)
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.temp_dir.name, 'test.iso')
+    
+    def tearDown(self):
+        """Stop the server and remove downloaded files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+    
+    def test_copy_stream(self):
+        """Test a whole body is written with every byte reported once"""
+        hasher = StreamingHasher()
+        reported = []
+        
+        def written(offset, data):
+            hasher.update(offset, data)
+            reported.append((offset, len(data)))
+        
+        response = requests.get(self.server.url('/file.iso'), stream=True)
+        byte_range = ByteRange(0)
+        with open(self.filepath, 'wb', buffering=0) as f:
+            self.assertTrue(copy_stream(response, f, byte_range, JobControl(), written))
+        response.close()
+        
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(byte_range.pos, len(self.content))
+        self.assertEqual(sum(length for _, length in reported), len(self.content))
+        self.assertEqual(hasher.hexdigest(), hashlib.sha256(self.content).hexdigest())
+    
+    def test_copy_stream_shrunk_range(self):
+        """Test bytes past the end of a range are dropped"""
+        response = requests.get(self.server.url('/file.iso'), stream=True,
+                                headers={'Range': 'bytes=1000-'})
+        byte_range = ByteRange(1000, 1000 + 200 * 1024 - 1)
+        with open(self.filepath, 'wb', buffering=0) as f:
+            f.truncate(len(self.content))
+            self.assertTrue(copy_stream(response, f, byte_range, JobControl()))
+        response.close()
+        
+        with open(self.filepath, 'rb') as f:
+            f.seek(1000)
+            self.assertEqual(f.read(200 * 1024), self.content[1000:1000 + 200 * 1024])
+        self.assertEqual(byte_range.remaining, 0)
+    
+    def test_copy_stream_cancelled(self):
+        """Test a closed response is not mistaken for a complete one"""
+        response = requests.get(self.server.url('/file.iso'), stream=True)
+        response.close()
+        control = JobControl()
+        control.cancel()
+        with open(self.filepath, 'wb', buffering=0) as f:
+            self.assertFalse(copy_stream(response, f, ByteRange(0), control))
+    
+    def test_buffer_pool_is_bounded(self):
+        """Test the writer never allocates more buffers than its depth"""
+        with open(self.filepath, 'wb', buffering=0) as f:
+            writer = BufferedFileWriter(f, depth=2)
+            buffers = set()
+            for index in range(10):
+                buffer = writer.acquire(16)
+                buffers.add(id(buffer))
+                buffer[:] = bytes([index]) * 16
+                writer.submit(buffer, index * 16, 16)
+            writer.close()
+        self.assertLessEqual(len(buffers), 2)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b''.join(bytes([index]) * 16 for index in range(10)))
+    
+    def test_next_read_size(self):
+        """Test the read size follows throughput within its limits"""
+        self.assertEqual(next_read_size(MIN_READ_SIZE, MIN_READ_SIZE, 0.0001), 2 * MIN_READ_SIZE)
+        self.assertEqual(next_read_size(MAX_READ_SIZE, MAX_READ_SIZE, 0.0001), MAX_READ_SIZE)
+        self.assertEqual(next_read_size(4 * MIN_READ_SIZE, 4 * MIN_READ_SIZE, 10), 2 * MIN_READ_SIZE)
+        self.assertEqual(next_read_size(MIN_READ_SIZE, MIN_READ_SIZE, 10), MIN_READ_SIZE)
+        # Short reads (end of body) say nothing about throughput
+        self.assertEqual(next_read_size(MIN_READ_SIZE, 10, 0.0001), MIN_READ_SIZE)
+
+class TestDownloadJob(unittest.TestCase):
+    """Test cases for DownloadJob and the transports"""
+    
+    def setUp(self):
+        """Start a local server and write a local copy of its file"""
+        self.content = os.urandom(3 * 1024 * 1024 + 321)
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+        self.server = LocalHTTPServer()
+        self.entry = self.server.add_file('/file.iso', self.content)
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.temp_dir.name, 'source.iso')
+        with open(self.source, 'wb') as f:
+            f.write(self.content)
+        self.filepath = os.path.join(self.temp_dir.name, 'test.iso')
+    
+    def tearDown(self):
+        """Stop the server and remove downloaded files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+    
+    def assert_downloaded(self):
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(os.path.exists(self.filepath + '.part'))
+    
+    def test_file_url(self):
+        """Test file:// URLs download segmented and verified through the same engine"""
+        reports = []
+        job = DownloadJob(Path(self.source).as_uri(), self.filepath, checksum=self.checksum, connections=3,
+                          on_progress=lambda job: reports.append(job.progress.downloaded))
+        self.assertTrue(job.run())
+        self.assert_downloaded()
+        self.assertEqual(reports[-1], len(self.content))
+    
+    def test_file_transport_ranges(self):
+        """Test the file transport answers ranges and If-Range like a server"""
+        transport = FileTransport()
+        url = Path(self.source).as_uri()
+        etag = transport.head(url).headers['etag']
+        
+        response = transport.get(url, headers={'Range': 'bytes=10-19', 'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['content-range'], f'bytes 10-19/{len(self.content)}')
+        buffer = bytearray(100)
+        self.assertEqual(response.raw.readinto(buffer), 10)
+        self.assertEqual(bytes(buffer[:10]), self.content[10:20])
+        response.close()
+        
+        response = transport.get(url, headers={'Range': 'bytes=10-19', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(transport.get(url + '.missing').status_code, 404)
+    
+    def test_urllib3_transport(self):
+        """Test a segmented download over a bare urllib3 pool"""
+        transport = Urllib3Transport()
+        job = DownloadJob(self.server.url('/file.iso'), self.filepath, checksum=self.checksum,
+                          connections=2, transport=transport)
+        self.assertTrue(job.run())
+        self.assert_downloaded()
+        transport.close()
+    
+    def test_pause_releases_connection(self):
+        """Test a paused job closes its connection and resumes with a range request"""
+        self.entry.chunk_delay = 0.002
+        job = DownloadJob(self.server.url('/file.iso'), self.filepath, checksum=self.checksum).start()
+        deadline = time.monotonic() + 5
+        while job.progress.downloaded < 256 * 1024 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        job.pause()
+        time.sleep(0.3)
+        paused_at = job.progress.downloaded
+        time.sleep(0.2)
+        self.assertEqual(job.progress.downloaded, paused_at)
+        self.assertIsNone(job.result)
+        
+        self.entry.chunk_delay = 0
+        job.resume()
+        self.assertTrue(job.wait(10))
+        self.assert_downloaded()
+        method, headers = self.entry.requests[-1]
+        self.assertTrue(headers['Range'].startswith('bytes='))
+    
+    def test_preallocated_single_stream(self):
+        """Test a single-stream download writes into a .part file of the final size"""
+        self.entry.chunk_delay = 0.002
+        job = DownloadJob(self.server.url('/file.iso'), self.filepath, checksum=self.checksum).start()
+        deadline = time.monotonic() + 5
+        while job.progress.downloaded < 256 * 1024 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        job.pause()
+        time.sleep(0.3)
+        self.assertEqual(os.path.getsize(self.filepath + '.part'), len(self.content))
+        state = PartState.load(self.filepath + '.part')
+        self.assertEqual(state.contiguous_prefix, job.progress.downloaded)
+        
+        self.entry.chunk_delay = 0
+        job.resume()
+        self.assertTrue(job.wait(10))
+        self.assert_downloaded()
+    
+    def test_preallocate_keeps_data(self):
+        """Test preallocating an existing file keeps its bytes and trims a longer one"""
+        with open(self.filepath, 'wb') as f:
+            f.write(b'x' * 1000)
+        preallocate(self.filepath, 5000)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'x' * 1000 + bytes(4000))
+        preallocate(self.filepath, 10)
+        self.assertEqual(os.path.getsize(self.filepath), 10)
+    
+    def test_insufficient_space(self):
+        """Test a download that cannot fit fails before transferring anything, without failing over"""
+        events = []
+        mirror = self.server.url('/mirror/file.iso')
+        self.server.add_file('/mirror/file.iso', self.content)
+        job = DownloadJob(self.server.url('/file.iso'), self.filepath, mirrors=[self.server.url('/file.iso')],
+                          checksum=self.checksum, connections=2,
+                          on_event=lambda event, fields: events.append(event))
+        job.mirrors.append(mirror)
+        with patch('utils.downloader.free_space', return_value=len(self.content) // 2):
+            self.assertFalse(job.run())
+        self.assertTrue(job.error.startswith("Not enough disk space for test.iso.part"))
+        self.assertEqual(events, ['no_space'])
+        self.assertEqual([method for method, _ in self.entry.requests], ['HEAD'])
+        self.assertEqual(job.progress.downloaded, 0)
+    
+    def test_cancel_wakes_paused_job(self):
+        """Test cancelling a paused job ends it without resuming"""
+        control = JobControl()
+        attempt = JobControl(control)
+        control.pause()
+        self.assertTrue(attempt.is_paused())
+        waiter = threading.Thread(target=attempt.wait_if_paused)
+        waiter.start()
+        attempt.cancel()
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+        self.assertFalse(control.is_cancelled())
+        self.assertFalse(attempt.wait_if_paused())
+
+class TestRetry(unittest.TestCase):
+    """Test cases for the stall watchdog, retries and mirror failover"""
+    
+    def setUp(self):
+        """Start a local server"""
+        self.content = os.urandom(1024 * 1024 + 123)
+        self.server = LocalHTTPServer()
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.temp_dir.name, 'test.iso')
+        self.events = []
+    
+    def tearDown(self):
+        """Stop the server and remove downloaded files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+    
+    def job(self, url, **options) -> DownloadJob:
+        policy = RetryPolicy(budget=options.pop('budget', 4), base_delay=0.01, low_speed_limit=1024 * 1024,
+                             low_speed_time=1)
+        return DownloadJob(url, self.filepath, retry_policy=policy,
+                           on_event=lambda event, fields: self.events.append((event, fields)), **options)
+    
+    def event_names(self):
+        return [event for event, _ in self.events]
+    
+    def assert_downloaded(self):
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+    
+    def test_stalled_connection_resumed(self):
+        """Test a trickling connection is dropped and the rest fetched with a range"""
+        entry = self.server.add_file('/file.iso', self.content, chunk_delay=0.2, slow_requests=1)
+        job = self.job(self.server.url('/file.iso'))
+        self.assertTrue(job.run())
+        self.assert_downloaded()
+        self.assertEqual(self.event_names()[:2], ['stalled', 'retry'])
+        resumed = entry.requests[-1][1]['Range']
+        self.assertRegex(resumed, r'bytes=[1-9]\d*-$')
+    
+    def test_stalled_segment_resumed(self):
+        """Test a stalled segment is retried from where it stopped"""
+        self.content = os.urandom(3 * 1024 * 1024)
+        self.server.add_file('/file.iso', self.content, chunk_delay=0.2, slow_requests=1)
+        job = self.job(self.server.url('/file.iso'), connections=3)
+        self.assertTrue(job.run())
+        self.assert_downloaded()
+        self.assertIn('stalled', self.event_names())
+    
+    def test_retry_after_server_error(self):
+        """Test server errors are retried with backoff"""
+        self.server.add_file('/file.iso', self.content, fail_requests=2)
+        job = self.job(self.server.url('/file.iso'))
+        self.assertTrue(job.run())
+        self.assert_downloaded()
+        self.assertEqual(self.event_names(), ['retry', 'retry'])
+        self.assertEqual(job.retry_policy.remaining, 2)
+    
+    def test_retry_budget(self):
+        """Test a download gives up once its retry budget is spent"""
+        entry = self.server.add_file('/file.iso', self.content, fail_requests=10)
+        job = self.job(self.server.url('/file.iso'), budget=2)
+        self.assertFalse(job.run())
+        self.assertEqual(self.event_names(), ['retry', 'retry', 'retries_exhausted'])
+        self.assertEqual(entry.gets, 3)
+        self.assertIn('503', job.error)
+    
+    def test_failover_to_next_mirror(self):
+        """Test a URL failing outright hands over to the next mirror"""
+        self.server.add_file('/plain.iso', self.content, support_ranges=False)
+        job = self.job(self.server.url('/missing.iso'),
+                       mirrors=[self.server.url('/missing.iso'), self.server.url('/plain.iso')])
+        self.assertTrue(job.run())
+        self.assert_downloaded()
+        self.assertEqual(self.event_names(), ['failover'])
+        self.assertEqual(self.events[0][1]['url'], self.server.url('/plain.iso'))
+        self.assertEqual(job.error, '')
+    
+    def test_backoff(self):
+        """Test delays grow exponentially, stay jittered below the bound and honour Retry-After"""
+        policy = RetryPolicy(base_delay=1, max_delay=10)
+        for attempt, bound in enumerate([1, 2, 4, 8, 10, 10]):
+            self.assertTrue(all(0 <= policy.delay(attempt) <= bound for _ in range(20)))
+        response = MagicMock(status_code=503, headers={'retry-after': '5'})
+        error = requests.exceptions.HTTPError(response=response)
+        self.assertGreaterEqual(policy.delay(0, error), 5)
+        self.assertTrue(is_retryable(error))
+        self.assertFalse(is_retryable(requests.exceptions.HTTPError(response=MagicMock(status_code=404))))
+        self.assertFalse(is_retryable(OSError(28, "No space left on device")))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
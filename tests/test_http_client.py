@@ -0,0 +1,89 @@
+"""
+Tests for the shared HTTP client
+"""
+
+import importlib.util
+import os
+import unittest
+
+from utils.downloader import body_stream
+from utils.http_client import HTTP2Client, HTTPClient, IteratorBody, close_response, create_client
+from tests.http_server import LocalHTTPServer
+
+class TestHTTPClient(unittest.TestCase):
+    """Test cases for connection reuse and its statistics"""
+
+    def setUp(self):
+        """Start a local server and create a client"""
+        self.content = os.urandom(512 * 1024)
+        self.server = LocalHTTPServer()
+        self.server.add_file('/file.iso', self.content)
+        self.server.start()
+        self.client = HTTPClient(pool_size=2, timeout=5)
+
+    def tearDown(self):
+        """Close the client and stop the server"""
+        self.client.close()
+        self.server.stop()
+
+    def read_body(self, response, limit=None) -> int:
+        stream = body_stream(response)
+        buffer = bytearray(64 * 1024)
+        total = 0
+        while limit is None or total < limit:
+            count = stream.readinto(buffer)
+            if not count:
+                break
+            total += count
+        return total
+
+    def stats(self) -> dict:
+        return self.client.stats.snapshot()['127.0.0.1']
+
+    def test_connection_reused(self):
+        """Test consecutive requests to a host share one kept-alive connection"""
+        for _ in range(3):
+            self.client.head(self.server.url('/file.iso'))
+        stats = self.stats()
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['reused'], 2)
+        self.assertIsNotNone(stats['ttfb_avg_ms'])
+
+    def test_streamed_body_keeps_connection(self):
+        """Test a body read to the end through http.client does not cost a new connection"""
+        for _ in range(2):
+            response = self.client.get(self.server.url('/file.iso'), stream=True)
+            self.assertEqual(self.read_body(response), len(self.content))
+            close_response(response)
+        self.assertEqual(self.stats()['connections'], 1)
+
+    def test_unread_body_closes_connection(self):
+        """Test a response closed part way through is not returned to the pool"""
+        response = self.client.get(self.server.url('/file.iso'), stream=True)
+        self.read_body(response, limit=64 * 1024)
+        close_response(response)
+        response = self.client.get(self.server.url('/file.iso'), stream=True)
+        self.assertEqual(self.read_body(response), len(self.content))
+        close_response(response)
+        self.assertEqual(self.stats()['connections'], 2)
+
+    def test_iterator_body(self):
+        """Test chunks are copied into buffers of any size"""
+        body = IteratorBody(iter([b'abc', b'', b'defgh']))
+        buffer = bytearray(4)
+        self.assertEqual(body.readinto(buffer), 3)
+        self.assertEqual(body.readinto(buffer), 4)
+        self.assertEqual(bytes(buffer), b'defg')
+        self.assertEqual(body.readinto(buffer), 1)
+        self.assertEqual(body.readinto(buffer), 0)
+
+    def test_http2_fallback(self):
+        """Test HTTP/2 is only used where httpx with h2 is installed"""
+        client = create_client(http2=True)
+        available = importlib.util.find_spec('httpx') and importlib.util.find_spec('h2')
+        self.assertIsInstance(client, HTTP2Client if available else HTTPClient)
+        client.close()
+
+if __name__ == '__main__':
+    unittest.main()
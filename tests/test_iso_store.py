@@ -0,0 +1,116 @@
+"""
+Tests for the content-addressed ISO store
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from utils.iso_store import ISOStore, clone_file
+
+class TestISOStore(unittest.TestCase):
+    """Test cases for ISOStore"""
+    
+    def setUp(self):
+        """Create a store and a verified ISO"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.temp_dir.name, 'store')
+        self.store = ISOStore(self.root, max_size=10 * 1024)
+        self.content = os.urandom(4096)
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+        self.filepath = self.write_file('downloads/test.iso', self.content)
+    
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+    
+    def write_file(self, name: str, content: bytes) -> str:
+        path = os.path.join(self.temp_dir.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+    
+    def test_add_and_provision(self):
+        """Test a stored ISO is provided to another directory"""
+        self.assertIsNotNone(self.store.add(self.filepath, self.checksum))
+        self.assertTrue(self.store.contains(self.checksum))
+        
+        target = os.path.join(self.temp_dir.name, 'elsewhere.iso')
+        self.assertIn(self.store.provision(target, self.checksum), ('reflink', 'hardlink', 'copy'))
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+    
+    def test_provision_miss(self):
+        """Test an unknown checksum needs a download"""
+        target = os.path.join(self.temp_dir.name, 'missing.iso')
+        self.assertIsNone(self.store.provision(target, "0" * 64))
+        self.assertFalse(os.path.exists(target))
+    
+    def test_existing_file_uses_hash_cache(self):
+        """Test a verified file is not hashed again until it changes"""
+        self.assertEqual(self.store.provision(self.filepath, self.checksum), 'existing')
+        
+        reopened = ISOStore(self.root, max_size=10 * 1024)
+        with patch('utils.iso_store.calculate_sha256') as calculate:
+            self.assertEqual(reopened.provision(self.filepath, self.checksum), 'existing')
+            calculate.assert_not_called()
+        
+        # A modified file is hashed again and no longer matches
+        with open(self.filepath, 'ab') as f:
+            f.write(b'x')
+        os.utime(self.filepath, ns=(time.time_ns(), time.time_ns() + 1000))
+        self.assertFalse(reopened.file_matches(self.filepath, self.checksum))
+    
+    def test_concurrent_saves(self):
+        """Test threads saving the index at once neither fail nor leave temp files"""
+        errors = []
+
+        def save():
+            for _ in range(100):
+                try:
+                    self.store.record_hash(self.filepath, self.checksum)
+                    self.store.save_index()
+                except OSError as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=save) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.root), ['index.json'])
+        self.assertEqual(ISOStore(self.root).cached_hash(self.filepath), self.checksum)
+    
+    def test_lru_eviction(self):
+        """Test the least recently used ISOs are evicted beyond the size limit"""
+        checksums = []
+        for index in range(3):
+            content = os.urandom(4096)
+            path = self.write_file(f'downloads/{index}.iso', content)
+            checksums.append(hashlib.sha256(content).hexdigest())
+            self.store.add(path, checksums[-1])
+            time.sleep(0.01)
+        
+        self.assertFalse(self.store.contains(checksums[0]))
+        self.assertTrue(self.store.contains(checksums[1]))
+        self.assertTrue(self.store.contains(checksums[2]))
+        self.assertLessEqual(self.store.total_size, 10 * 1024)
+    
+    def test_clone_without_copy(self):
+        """Test copies can be refused when links are impossible"""
+        target = os.path.join(self.temp_dir.name, 'clone.iso')
+        with patch('utils.iso_store.reflink', return_value=False), \
+                patch('os.link', side_effect=OSError("cross-device link")):
+            self.assertIsNone(clone_file(self.filepath, target, allow_copy=False))
+            self.assertEqual(clone_file(self.filepath, target), 'copy')
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+if __name__ == '__main__':
+    unittest.main()
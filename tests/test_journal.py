@@ -0,0 +1,107 @@
+"""
+Tests for the download journal
+"""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from utils.download_queue import COMPLETED, DownloadQueue, QueueItem
+from utils.journal import DownloadJournal
+from utils.part_state import PartState
+from tests.http_server import LocalHTTPServer
+
+class TestJournal(unittest.TestCase):
+    """Test cases for DownloadJournal and its use by the download queue"""
+
+    def setUp(self):
+        """Serve an ISO from two mirrors and open a journal"""
+        self.content = os.urandom(512 * 1024)
+        self.server = LocalHTTPServer()
+        self.entry = self.server.add_file('/file.iso', self.content)
+        self.server.add_file('/mirror/file.iso', self.content)
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'journal.sqlite3')
+        self.journal = DownloadJournal(self.path, commit_interval=0.05)
+        self.info = {'url': self.server.url('/file.iso'), 'filename': 'file.iso',
+                     'checksum': hashlib.sha256(self.content).hexdigest()}
+
+    def tearDown(self):
+        """Close the journal, stop the server and remove files"""
+        self.journal.close()
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def queue(self, journal: DownloadJournal) -> DownloadQueue:
+        def run(item: QueueItem) -> bool:
+            hasher = item.prepare()
+            return item.download(hasher) and item.verify(hasher)
+        return DownloadQueue(run, journal=journal)
+
+    def test_job_lifecycle(self):
+        """Test a queued download is recorded with its outcome and mirror statistics"""
+        queue = self.queue(self.journal)
+        item = queue.add('Test', 'Edition', self.temp_dir.name, self.info)
+        self.assertTrue(queue.wait(10))
+        self.assertEqual(item.state, COMPLETED)
+
+        job = self.journal.history()[0]
+        self.assertEqual((job['state'], job['verified'], job['downloaded']), ('completed', True, len(self.content)))
+        self.assertEqual(job['info']['filename'], 'file.iso')
+        self.assertEqual(self.journal.unfinished(), [])
+        stats = self.journal.mirror_stats([self.info['url']])[self.info['url']]
+        self.assertEqual((stats['bytes'], stats['successes'], stats['failures']), (len(self.content), 1, 0))
+        self.assertGreater(stats['throughput'], 0)
+
+    def test_batched_commits(self):
+        """Test progress records reach the database at the next batched commit, not one by one"""
+        self.journal.commit_interval = 3600
+        self.journal.record_mirror(self.info['url'], 1000, 1.0, True)
+        reader = sqlite3.connect(self.path)
+        self.assertEqual(reader.execute("SELECT COUNT(*) FROM mirrors").fetchone()[0], 0)
+        self.journal.flush()
+        self.assertEqual(reader.execute("SELECT COUNT(*) FROM mirrors").fetchone()[0], 1)
+        reader.close()
+
+    def test_resume_after_crash(self):
+        """Test a job left running by a crashed app is queued again and resumes its ranges"""
+        filepath = os.path.join(self.temp_dir.name, 'file.iso')
+        item = QueueItem(1, 'Test', 'Edition', self.temp_dir.name, self.info)
+        job_id = self.journal.add_job(item)
+        self.journal.start_job(job_id, item)
+        done = 256 * 1024
+        with open(filepath + '.part', 'wb') as f:
+            f.write(self.content[:done])
+        PartState(self.info['url'], len(self.content), ranges=[(0, done)]).save(filepath + '.part')
+        time.sleep(0.2)
+        # The app dies without finishing the job; a new one opens the journal
+        journal = DownloadJournal(self.path)
+        try:
+            self.assertEqual([job['id'] for job in journal.unfinished()], [job_id])
+            self.assertEqual(journal.ranges(job_id), [(0, done)])
+
+            queue = self.queue(journal)
+            restored = queue.restore()
+            self.assertEqual([item.filepath for item in restored], [filepath])
+            self.assertEqual(restored[0].journal_id, job_id)
+            self.assertTrue(queue.wait(10))
+            self.assertEqual(restored[0].state, COMPLETED)
+            self.assertEqual(self.entry.requests[-1][1]['Range'], f'bytes={done}-')
+            self.assertEqual(journal.unfinished(), [])
+        finally:
+            journal.close()
+
+    def test_rank_by_history(self):
+        """Test mirrors are ordered by the throughput they delivered before"""
+        slow, fast, failing, unknown = (self.server.url(f'/{name}.iso') for name in ('slow', 'fast', 'failing', 'unknown'))
+        self.journal.record_mirror(slow, 1000, 10.0, True)
+        self.journal.record_mirror(fast, 1000, 1.0, True)
+        self.journal.record_mirror(failing, 0, 0.0, False)
+        self.assertEqual(self.journal.rank([failing, unknown, slow, fast]), [fast, slow, unknown, failing])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Tests for ISO library verification
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from utils.data_manager import DistroDataManager
+from utils.iso_store import ISOStore
+from utils.library import FAILED, OK, MISMATCH, UNKNOWN, hash_file, verify_library
+
+def crashing_hash_file(path: str, piece_length: int = 0):
+    """Hash like hash_file, but kill the worker process on files named crash.iso"""
+    if os.path.basename(path) == 'crash.iso':
+        os._exit(1)
+    return hash_file(path, piece_length)
+
+class TestVerifyLibrary(unittest.TestCase):
+    """Test cases for verify_library"""
+    
+    def setUp(self):
+        """Write a catalog and a library directory"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.library = os.path.join(self.temp_dir.name, 'isos')
+        os.makedirs(os.path.join(self.library, 'old'))
+        self.content = os.urandom(64 * 1024)
+        data = {
+            "Test": {
+                "description": "Test distribution",
+                "editions": {
+                    "Desktop": {
+                        "filename": "desktop.iso",
+                        "url": "https://example.com/desktop.iso",
+                        "checksum": hashlib.sha256(self.content).hexdigest()
+                    },
+                    "Server": {
+                        "filename": "server.iso",
+                        "url": "https://example.com/server.iso",
+                        "checksum": "0" * 64
+                    }
+                }
+            }
+        }
+        data_file = os.path.join(self.temp_dir.name, 'distro_data.json')
+        with open(data_file, 'w') as f:
+            json.dump(data, f)
+        self.manager = DistroDataManager(data_file)
+    
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+    
+    def write(self, name: str, content: bytes):
+        with open(os.path.join(self.library, name), 'wb') as f:
+            f.write(content)
+    
+    def test_statuses(self):
+        """Test files are matched by name, then by checksum"""
+        self.write('desktop.iso', self.content)
+        self.write('renamed.iso', self.content)
+        self.write('server.iso', b'corrupt')
+        self.write('notes.txt', b'ignored')
+        self.write('old/desktop.iso', self.content)
+        
+        report = verify_library(self.library, self.manager, workers=2)
+        statuses = {os.path.relpath(r['path'], self.library): (r['status'], r['edition']) for r in report.results}
+        self.assertEqual(statuses, {
+            'desktop.iso': (OK, 'Desktop'),
+            'renamed.iso': (OK, 'Desktop'),
+            'server.iso': (MISMATCH, 'Server')
+        })
+        self.assertEqual(report.bytes_hashed, 2 * len(self.content) + len(b'corrupt'))
+        
+        report = verify_library(self.library, self.manager, recursive=True)
+        self.assertEqual(report.count(OK), 3)
+    
+    def test_unknown_and_cached(self):
+        """Test unknown images are reported and cached hashes are reused"""
+        self.write('mystery.img', b'mystery')
+        store = ISOStore(os.path.join(self.temp_dir.name, 'store'))
+        
+        first = verify_library(self.library, self.manager, store=store)
+        self.assertEqual(first.count(UNKNOWN), 1)
+        self.assertFalse(first.results[0]['cached'])
+        
+        second = verify_library(self.library, self.manager, store=store)
+        self.assertTrue(second.results[0]['cached'])
+        self.assertEqual(second.bytes_hashed, 0)
+    
+    def test_worker_crash(self):
+        """Test files a dead worker process was hashing are reported as failed"""
+        self.write('crash.iso', b'crash')
+        with patch('utils.library.hash_file', crashing_hash_file):
+            report = verify_library(self.library, self.manager, workers=1)
+        statuses = {os.path.basename(r['path']): r['status'] for r in report.results}
+        self.assertEqual(statuses['crash.iso'], FAILED)
+        self.assertEqual(report.to_dict()['failed'], len(report.results) - report.count(OK))
+
+if __name__ == '__main__':
+    unittest.main()
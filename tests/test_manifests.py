@@ -0,0 +1,117 @@
+"""
+Tests for recorded piece manifests and repairing files with them
+"""
+
+import hashlib
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from utils.data_manager import DistroDataManager
+from utils.downloader import DownloadJob
+from utils.library import OK, verify_library
+from utils.manifests import ManifestStore
+from utils.pieces import PieceRecorder, create_manifest
+
+PIECE_LENGTH = 256 * 1024
+
+class TestManifests(unittest.TestCase):
+    """Test cases for ManifestStore and repairs from a local stand-in mirror"""
+
+    def setUp(self):
+        """Put an ISO on a file:// mirror and create a manifest store"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.content = os.urandom(2 * 1024 * 1024 + 1000)
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+        self.mirror_path = os.path.join(self.temp_dir.name, 'mirror', 'file.iso')
+        os.makedirs(os.path.dirname(self.mirror_path))
+        with open(self.mirror_path, 'wb') as f:
+            f.write(self.content)
+        self.url = Path(self.mirror_path).as_uri()
+        self.filepath = os.path.join(self.temp_dir.name, 'file.iso')
+        self.manifests = ManifestStore(os.path.join(self.temp_dir.name, 'manifests'), piece_length=PIECE_LENGTH)
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def corrupt(self, *offsets):
+        with open(self.filepath, 'r+b') as f:
+            for offset in offsets:
+                f.seek(offset)
+                byte = f.read(1)
+                f.seek(offset)
+                f.write(bytes([byte[0] ^ 0xFF]))
+
+    def job(self, events=None) -> DownloadJob:
+        return DownloadJob(self.url, self.filepath, checksum=self.checksum, manifests=self.manifests,
+                           on_event=lambda event, fields: events.append((event, fields)) if events is not None else None)
+
+    def test_recorder_matches_create_manifest(self):
+        """Test pieces recorded in any chunking match those of a file hashed in one pass"""
+        recorder = PieceRecorder(PIECE_LENGTH)
+        for offset in range(0, len(self.content), 100000):
+            self.assertTrue(recorder.update(offset, self.content[offset:offset + 100000]))
+        digest, manifest = create_manifest(self.mirror_path, PIECE_LENGTH)
+        self.assertEqual(digest, self.checksum)
+        self.assertEqual(recorder.manifest().to_dict(), manifest.to_dict())
+        self.assertEqual(len(manifest), 9)
+        self.assertEqual(manifest.size, len(self.content))
+
+    def test_store_round_trip(self):
+        """Test a saved manifest is loaded only under its own checksum"""
+        _, manifest = create_manifest(self.mirror_path, PIECE_LENGTH)
+        self.assertIsNone(self.manifests.load(self.checksum))
+        self.assertTrue(self.manifests.save(self.checksum, manifest))
+        self.assertEqual(self.manifests.load(self.checksum.upper()).hashes, manifest.hashes)
+
+        # A manifest filed under the wrong checksum is ignored
+        self.manifests.path('0' * 64).parent.mkdir(parents=True)
+        os.replace(self.manifests.path(self.checksum), self.manifests.path('0' * 64))
+        self.assertIsNone(self.manifests.load('0' * 64))
+
+    def test_download_records_and_repairs(self):
+        """Test the first verified download records pieces and a later one fetches only corrupt pieces"""
+        self.assertTrue(self.job().run())
+        self.assertTrue(self.manifests.contains(self.checksum))
+
+        self.corrupt(PIECE_LENGTH * 2 + 5, PIECE_LENGTH * 7)
+        events = []
+        job = self.job(events)
+        self.assertTrue(job.run())
+        self.assertEqual(events[0], ('repair', {'pieces': 2, 'bytes': 2 * PIECE_LENGTH}))
+        self.assertEqual(job.progress.downloaded, 2 * PIECE_LENGTH)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_no_manifest_without_store(self):
+        """Test nothing is recorded or repaired without a manifest store"""
+        job = DownloadJob(self.url, self.filepath, checksum=self.checksum)
+        self.assertTrue(job.run())
+        self.assertIsNone(job.pieces)
+        self.assertFalse(job.salvage())
+
+    def test_library_records_and_salvages(self):
+        """Test verifying a library records pieces used to repair the file later"""
+        data_file = os.path.join(self.temp_dir.name, 'distro_data.json')
+        with open(data_file, 'w') as f:
+            f.write('{"Test": {"editions": {"Edition": {"filename": "file.iso", "url": "%s", "checksum": "%s"}}}}'
+                    % (self.url, self.checksum))
+        with open(self.filepath, 'wb') as f:
+            f.write(self.content)
+
+        report = verify_library(self.temp_dir.name, DistroDataManager(data_file), workers=1,
+                                manifests=self.manifests)
+        self.assertEqual(report.results[0]['status'], OK)
+        self.assertEqual(self.manifests.load(self.checksum).size, len(self.content))
+
+        self.corrupt(len(self.content) - 1)
+        job = DownloadJob(self.url, self.filepath, checksum=self.checksum, pieces=self.manifests.load(self.checksum))
+        self.assertTrue(job.salvage())
+        self.assertEqual(job.progress.downloaded, 1000)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+Tests for Metalink parsing, piece hashes and piece repair
+"""
+
+import hashlib
+import os
+import tempfile
+import unittest
+
+from utils.downloader import DownloadJob
+from utils.metalink import parse_metalink
+from utils.pieces import PieceHasher, PieceManifest, find_bad_pieces
+from tests.http_server import LocalHTTPServer
+
+PIECE_LENGTH = 256 * 1024
+
+def piece_hashes(content: bytes, length: int = PIECE_LENGTH):
+    return [hashlib.sha256(content[offset:offset + length]).hexdigest() for offset in range(0, len(content), length)]
+
+def meta4(name: str, content: bytes, urls) -> bytes:
+    pieces = ''.join(f'<hash>{digest}</hash>' for digest in piece_hashes(content))
+    resources = ''.join(f'<url priority="{rank}">{url}</url>' for rank, url in enumerate(urls, 1))
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<metalink xmlns="urn:ietf:params:xml:ns:metalink">
+  <file name="{name}">
+    <size>{len(content)}</size>
+    <hash type="sha-256">{hashlib.sha256(content).hexdigest()}</hash>
+    <pieces length="{PIECE_LENGTH}" type="sha-256">{pieces}</pieces>
+    {resources}
+    <url priority="9">ftp://ftp.example.com/{name}</url>
+  </file>
+</metalink>'''.encode()
+
+class TestMetalink(unittest.TestCase):
+    """Test cases for Metalink parsing and piece repair"""
+
+    def setUp(self):
+        """Start a local server with a file, a mirror and a Metalink"""
+        self.content = os.urandom(2 * 1024 * 1024 + 1000)
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+        self.server = LocalHTTPServer()
+        self.entry = self.server.add_file('/file.iso', self.content)
+        self.mirror = self.server.add_file('/mirror/file.iso', self.content)
+        self.server.add_file('/file.iso.meta4', meta4('file.iso', self.content, [self.server.url('/mirror/file.iso')]))
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.temp_dir.name, 'file.iso')
+        self.manifest = PieceManifest(PIECE_LENGTH, piece_hashes(self.content), 'sha-256', len(self.content))
+
+    def tearDown(self):
+        """Stop the server and remove downloaded files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def write_corrupted(self, *offsets):
+        data = bytearray(self.content)
+        for offset in offsets:
+            data[offset] ^= 0xFF
+        with open(self.filepath, 'wb') as f:
+            f.write(data)
+
+    def test_parse_meta4(self):
+        """Test size, hashes, pieces and URLs in priority order, skipping unsupported schemes"""
+        files = parse_metalink(meta4('file.iso', self.content, ['http://b.example/f', 'http://a.example/f']))
+        self.assertEqual(len(files), 1)
+        entry = files[0]
+        self.assertEqual(entry.size, len(self.content))
+        self.assertEqual(entry.sha256, self.checksum)
+        self.assertEqual(entry.urls, ['http://b.example/f', 'http://a.example/f'])
+        self.assertEqual(len(entry.pieces), 9)
+        self.assertEqual(entry.pieces.piece_size(8), 1000)
+
+    def test_parse_metalink3(self):
+        """Test the older Metalink 3 layout with preferences"""
+        document = b'''<metalink version="3.0" xmlns="http://www.metalinker.org/"><files>
+          <file name="file.iso"><size>10</size>
+            <verification><hash type="sha256">ABC</hash>
+              <pieces length="5" type="sha1"><hash piece="0">aa</hash><hash piece="1">bb</hash></pieces>
+            </verification>
+            <resources><url type="http" preference="10">http://slow.example/file.iso</url>
+              <url type="http" preference="100">http://fast.example/file.iso</url></resources>
+          </file></files></metalink>'''
+        entry = parse_metalink(document)[0]
+        self.assertEqual(entry.sha256, 'abc')
+        self.assertEqual(entry.urls, ['http://fast.example/file.iso', 'http://slow.example/file.iso'])
+        self.assertEqual(entry.pieces.hashes, ['aa', 'bb'])
+        with self.assertRaises(ValueError):
+            parse_metalink(b'<html></html>')
+
+    def test_piece_hasher(self):
+        """Test corrupt pieces are found while the file is hashed"""
+        self.write_corrupted(PIECE_LENGTH * 3 + 7, len(self.content) - 1)
+        self.assertEqual(find_bad_pieces(self.filepath, self.manifest), [3, 8])
+
+        hasher = PieceHasher(self.manifest)
+        self.assertTrue(hasher.update(0, self.content))
+        self.assertEqual(hasher.finish(), [])
+
+    def test_repair_fetches_only_bad_pieces(self):
+        """Test a failed checksum re-fetches just the corrupt pieces"""
+        self.write_corrupted(PIECE_LENGTH * 5 + 1)
+        events = []
+        job = DownloadJob(self.server.url('/file.iso'), self.filepath, checksum=self.checksum,
+                          pieces=self.manifest, on_event=lambda event, fields: events.append((event, fields)))
+        self.assertTrue(job.verify())
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(events[0], ('repair', {'pieces': 1, 'bytes': PIECE_LENGTH}))
+        self.assertEqual([headers['Range'] for _, headers in self.entry.requests],
+                         [f'bytes={PIECE_LENGTH * 5}-{PIECE_LENGTH * 6 - 1}'])
+
+    def test_download_with_metalink(self):
+        """Test a Metalink adds its mirrors and piece hashes to a download"""
+        job = DownloadJob(self.server.url('/file.iso'), self.filepath, checksum=self.checksum,
+                          metalink=self.server.url('/file.iso.meta4'))
+        self.assertTrue(job.run())
+        self.assertEqual(job.mirrors, [self.server.url('/file.iso'), self.server.url('/mirror/file.iso')])
+        self.assertEqual(len(job.pieces), 9)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_metalink_for_another_file_ignored(self):
+        """Test a Metalink whose checksum differs from the catalog's is not used"""
+        job = DownloadJob(self.server.url('/file.iso'), self.filepath, checksum='0' * 64,
+                          metalink=self.server.url('/file.iso.meta4'))
+        job.prepare()
+        self.assertIsNone(job.pieces)
+        self.assertEqual(job.mirrors, [self.server.url('/file.iso')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests for ranking mirrors by probed latency and throughput
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+from utils.downloader import DownloadJob
+from utils.mirror_ranking import MirrorRanker, probe_mirror
+from tests.http_server import LocalHTTPServer
+
+class TestMirrorRanking(unittest.TestCase):
+    """Test cases for MirrorRanker against local stand-in mirrors"""
+
+    def setUp(self):
+        """Serve the same ISO from a slow and a fast path and count probes"""
+        self.content = os.urandom(512 * 1024)
+        self.server = LocalHTTPServer()
+        self.server.add_file('/slow/file.iso', self.content, chunk_delay=0.05)
+        self.server.add_file('/fast/file.iso', self.content)
+        self.server.add_file('/other/file.iso', self.content[:1000])
+        self.server.start()
+        self.slow = self.server.url('/slow/file.iso')
+        self.fast = self.server.url('/fast/file.iso')
+        self.missing = self.server.url('/missing/file.iso')
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.temp_dir.name, 'mirrors.json')
+        self.probed = []
+        self.network = 'net-a'
+
+    def tearDown(self):
+        """Stop the server and remove the cache"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def ranker(self, **options) -> MirrorRanker:
+        def probe(url):
+            self.probed.append(url)
+            return probe_mirror(url)
+        return MirrorRanker(self.cache_file, probe=probe, network=lambda: self.network, **options)
+
+    def test_probe_mirror(self):
+        """Test a probe measures a mirror and reports the full file size"""
+        probe = probe_mirror(self.fast)
+        self.assertTrue(probe['ok'])
+        self.assertEqual(probe['size'], len(self.content))
+        self.assertGreater(probe['throughput'], 0)
+        self.assertFalse(probe_mirror(self.missing)['ok'])
+
+    def test_rank_fastest_first(self):
+        """Test the fast mirror goes first and failing or mismatched ones last"""
+        other = self.server.url('/other/file.iso')
+        ranked = self.ranker().rank([self.missing, self.slow, other, self.fast])
+        self.assertEqual(ranked, [self.fast, self.slow, self.missing, other])
+
+    def test_cache_per_network(self):
+        """Test a ranking is reused on the same network and redone on another"""
+        urls = [self.slow, self.fast]
+        self.assertEqual(self.ranker().rank(urls), [self.fast, self.slow])
+        self.assertEqual(len(self.probed), 2)
+
+        # A new ranker (a later run) finds the cached probes for this network
+        self.assertEqual(self.ranker().rank(urls), [self.fast, self.slow])
+        self.assertEqual(len(self.probed), 2)
+
+        self.network = 'net-b'
+        self.ranker().rank(urls)
+        self.assertEqual(len(self.probed), 4)
+
+        # Expired probes are made again
+        self.ranker(ttl=0).rank(urls)
+        self.assertEqual(len(self.probed), 6)
+
+    def test_deadline(self):
+        """Test a mirror that does not answer in time is ranked last without waiting for it"""
+        def probe(url):
+            if url == self.slow:
+                time.sleep(2)
+            return probe_mirror(url)
+        ranker = MirrorRanker(self.cache_file, deadline=0.5, probe=probe, network=lambda: self.network)
+        started = time.monotonic()
+        self.assertEqual(ranker.rank([self.slow, self.fast]), [self.fast, self.slow])
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertIsNone(ranker.describe(self.slow))
+
+    def test_download_uses_fastest(self):
+        """Test a download with a ranker starts from the fastest mirror"""
+        events = []
+        filepath = os.path.join(self.temp_dir.name, 'file.iso')
+        job = DownloadJob(self.slow, filepath, mirrors=[self.slow, self.fast], ranker=self.ranker(),
+                          on_event=lambda event, fields: events.append((event, fields)))
+        self.assertTrue(job.run())
+        self.assertIn(('mirrors_ranked', {'best': self.fast, 'mirrors': [self.fast, self.slow]}), events)
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+Tests for the LAN mirror server
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import requests
+
+from utils.data_manager import DistroDataManager
+from utils.downloader import DownloadJob
+from utils.iso_store import ISOStore
+from utils.mirror_server import MirrorServer, mirror_url, parse_range
+from tests.http_server import LocalHTTPServer
+
+class TestMirrorServer(unittest.TestCase):
+    """Test cases for serving the store and filling it from upstream"""
+
+    def setUp(self):
+        """Serve an ISO upstream and start a mirror server in front of an empty store"""
+        self.content = os.urandom(1024 * 1024 + 5)
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+        self.upstream = LocalHTTPServer()
+        self.entry = self.upstream.add_file('/test.iso', self.content, chunk_delay=0.005)
+        self.upstream.start()
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        data_file = os.path.join(self.temp_dir.name, 'distro_data.json')
+        with open(data_file, 'w') as f:
+            json.dump({'Test': {'description': 'Test distribution', 'editions': {'Edition': {
+                'filename': 'test.iso', 'url': self.upstream.url('/test.iso'), 'checksum': self.checksum}}}}, f)
+        self.store = ISOStore(os.path.join(self.temp_dir.name, 'store'))
+        self.events = []
+        self.server = MirrorServer(self.store, DistroDataManager(data_file), ('127.0.0.1', 0),
+                                   on_event=lambda event, fields: self.events.append(event)).start()
+        self.url = mirror_url(self.server.url, self.checksum, 'test.iso')
+
+    def tearDown(self):
+        """Stop the servers and remove files"""
+        self.server.stop()
+        self.upstream.stop()
+        self.temp_dir.cleanup()
+
+    def add_to_store(self):
+        path = os.path.join(self.temp_dir.name, 'test.iso')
+        with open(path, 'wb') as f:
+            f.write(self.content)
+        self.store.add(path, self.checksum)
+
+    def test_parse_range(self):
+        """Test single byte ranges are parsed and others mean the whole file"""
+        self.assertEqual(parse_range('bytes=10-19', 100), (10, 19))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-5', 100), (95, 99))
+        self.assertEqual(parse_range('bytes=0-500', 100), (0, 99))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range(None, 100))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=100-', 100)
+
+    def test_serve_from_store(self):
+        """Test stored ISOs are served with ranges, If-Range and ETags"""
+        self.add_to_store()
+        etag = f'"{self.checksum}"'
+        response = requests.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.content)
+        self.assertEqual(response.headers['ETag'], etag)
+
+        response = requests.get(self.url, headers={'Range': 'bytes=100-199', 'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.content[100:200])
+        self.assertEqual(response.headers['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        # A client holding another version gets the whole file
+        response = requests.get(self.url, headers={'Range': 'bytes=100-199', 'If-Range': '"other"'})
+        self.assertEqual((response.status_code, len(response.content)), (200, len(self.content)))
+
+        self.assertEqual(requests.get(self.url, headers={'Range': f'bytes={len(self.content)}-'}).status_code, 416)
+        self.assertEqual(requests.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(requests.head(self.url).headers['Content-Length'], str(len(self.content)))
+        self.assertEqual(requests.get(mirror_url(self.server.url, '0' * 64)).status_code, 404)
+        self.assertEqual(self.entry.gets, 0)
+
+    def test_concurrent_clients_share_fill(self):
+        """Test a cache miss is fetched upstream once while several clients read it"""
+        results = [None] * 4
+
+        def fetch(index: int):
+            results[index] = requests.get(self.url, timeout=30).content
+
+        threads = [threading.Thread(target=fetch, args=(index,)) for index in range(len(results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [self.content] * len(results))
+        self.assertEqual(self.entry.gets, 1)
+        self.assertTrue(self.store.contains(self.checksum))
+        self.assertIn('fill_completed', self.events)
+
+        # Later clients are served from the store
+        self.assertEqual(requests.get(self.url).content, self.content)
+        self.assertEqual(self.entry.gets, 1)
+
+    def test_failed_fill_never_completes(self):
+        """Test clients of a fill that fails verification do not receive the whole file"""
+        self.upstream.add_file('/other.iso', os.urandom(4096))
+        self.server.sources[self.checksum]['urls'] = [self.upstream.url('/other.iso')]
+        with self.assertRaises(requests.exceptions.RequestException):
+            requests.get(self.url, timeout=30).content
+        self.assertFalse(self.store.contains(self.checksum))
+        self.assertIn('fill_failed', self.events)
+
+    def test_preferred_mirror(self):
+        """Test a job downloads from its preferred mirror and falls back to its own mirrors"""
+        filepath = os.path.join(self.temp_dir.name, 'first.iso')
+        job = DownloadJob(self.upstream.url('/test.iso'), filepath, checksum=self.checksum, connections=4,
+                          preferred=[self.url])
+        self.assertTrue(job.run())
+        gets = self.entry.gets
+        self.assertEqual(gets, 1)
+
+        filepath = os.path.join(self.temp_dir.name, 'second.iso')
+        job = DownloadJob(self.upstream.url('/test.iso'), filepath, checksum=self.checksum,
+                          preferred=[mirror_url(self.server.url, '1' * 64)])
+        self.assertTrue(job.run())
+        self.assertEqual(self.entry.gets, gets + 1)
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Tests for multi-mirror downloads
+"""
+
+import unittest
+import tempfile
+import hashlib
+import os
+
+from utils.downloader import StreamingHasher
+from utils.mirrors import MirrorStats, RangeScheduler, MultiMirrorDownloader, MIN_STEAL_SIZE
+from tests.http_server import LocalHTTPServer
+
+class TestRangeScheduler(unittest.TestCase):
+    """Test cases for RangeScheduler"""
+    
+    def test_ranges_cover_file(self):
+        """Test the initial ranges cover the file exactly once"""
+        scheduler = RangeScheduler(10 * 1024 * 1024 + 5, range_size=4 * 1024 * 1024)
+        ranges = [(r.start, r.end) for r in scheduler.pending]
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], 10 * 1024 * 1024 + 4)
+        for previous, current in zip(ranges, ranges[1:]):
+            self.assertEqual(previous[1] + 1, current[0])
+    
+    def test_fast_mirror_steals_from_slow(self):
+        """Test an idle fast mirror takes over the tail of a slow mirror's range"""
+        scheduler = RangeScheduler(8 * MIN_STEAL_SIZE, range_size=8 * MIN_STEAL_SIZE)
+        slow, fast = MirrorStats("http://slow"), MirrorStats("http://fast")
+        slow.throughput, fast.throughput = 100.0, 300.0
+        
+        held = scheduler.next_range(slow)
+        stolen = scheduler.next_range(fast)
+        
+        self.assertIsNotNone(stolen)
+        self.assertEqual(held.end + 1, stolen.start)
+        self.assertEqual(stolen.end, 8 * MIN_STEAL_SIZE - 1)
+        self.assertGreater(stolen.end - stolen.start, held.end - held.start)
+    
+    def test_slow_mirror_does_not_steal(self):
+        """Test a slower mirror never takes work from a faster one"""
+        scheduler = RangeScheduler(8 * MIN_STEAL_SIZE, range_size=8 * MIN_STEAL_SIZE)
+        slow, fast = MirrorStats("http://slow"), MirrorStats("http://fast")
+        slow.throughput, fast.throughput = 100.0, 300.0
+        
+        scheduler.next_range(fast)
+        self.assertIsNone(scheduler._steal(slow))
+
+class TestMultiMirrorDownloader(unittest.TestCase):
+    """Test cases for MultiMirrorDownloader"""
+    
+    def setUp(self):
+        """Start a local server exposing the same file on several paths"""
+        self.content = os.urandom(6 * 1024 * 1024 + 77)
+        self.server = LocalHTTPServer()
+        self.server.add_file('/fast/test.iso', self.content)
+        self.server.add_file('/slow/test.iso', self.content, chunk_delay=0.01)
+        self.server.add_file('/norange/test.iso', self.content, support_ranges=False)
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.temp_dir.name, 'test.iso')
+    
+    def tearDown(self):
+        """Stop the server and remove downloaded files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+    
+    def test_download_from_mirrors(self):
+        """Test a file is assembled from several mirrors, favouring the fast one"""
+        mirrors = [self.server.url(p) for p in ('/slow/test.iso', '/fast/test.iso',
+                                                 '/norange/test.iso', '/missing/test.iso')]
+        hasher = StreamingHasher()
+        downloader = MultiMirrorDownloader(mirrors, self.filepath, hasher=hasher)
+        
+        self.assertTrue(downloader.run())
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertTrue(hasher.verify(self.filepath, hashlib.sha256(self.content).hexdigest()))
+        
+        # Mirrors without range support or the file are not used
+        self.assertEqual(set(downloader.stats), set(mirrors[:2]))
+        slow, fast = downloader.stats[mirrors[0]], downloader.stats[mirrors[1]]
+        self.assertEqual(slow.bytes_downloaded + fast.bytes_downloaded, len(self.content))
+        self.assertGreater(fast.bytes_downloaded, slow.bytes_downloaded)
+    
+    def test_no_usable_mirror(self):
+        """Test failure when no mirror supports ranges"""
+        downloader = MultiMirrorDownloader([self.server.url('/norange/test.iso')], self.filepath)
+        self.assertFalse(downloader.run())
+        self.assertFalse(os.path.exists(self.filepath))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Tests for partial download resume state
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from utils.part_state import (PART_BLOCK_SIZE, PartState, decode_ranges, encode_ranges, merge_ranges,
+                              remove_partial, state_path)
+
+class TestPartState(unittest.TestCase):
+    """Test cases for PartState"""
+    
+    def setUp(self):
+        """Create a temporary directory for sidecars"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.temp_dir.name, 'test.iso')
+        self.part_path = self.filepath + '.part'
+    
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+    
+    def test_merge_ranges(self):
+        """Test overlapping and adjacent ranges are merged"""
+        self.assertEqual(merge_ranges([(10, 20), (0, 5), (5, 8), (15, 30), (40, 40)]),
+                         [(0, 8), (10, 30)])
+    
+    def test_missing_ranges(self):
+        """Test the gaps between completed ranges are reported inclusively"""
+        state = PartState('http://example.com/a.iso', 100, ranges=[(0, 10), (20, 30)])
+        self.assertEqual(state.missing(), [(10, 19), (30, 99)])
+        self.assertEqual(state.contiguous_prefix, 10)
+        self.assertEqual(state.completed_bytes, 20)
+        
+        state.add_range(10, 20)
+        self.assertEqual(state.contiguous_prefix, 30)
+    
+    def test_save_and_load(self):
+        """Test the sidecar round-trips through disk"""
+        state = PartState('http://example.com/a.iso', 100, '"abc"', 'Mon, 01 Jan 2024 00:00:00 GMT', [(0, 50)])
+        state.save(self.part_path)
+        loaded = PartState.load(self.part_path)
+        self.assertEqual(loaded.to_dict(), state.to_dict())
+        
+        with open(state_path(self.part_path), 'w') as f:
+            f.write('not json')
+        self.assertIsNone(PartState.load(self.part_path))
+    
+    def test_bitmap_encoding(self):
+        """Test completed ranges survive the block bitmap exactly, including partly written blocks"""
+        size = 100 * PART_BLOCK_SIZE + 123
+        ranges = [(0, 3 * PART_BLOCK_SIZE + 10), (5 * PART_BLOCK_SIZE - 7, 5 * PART_BLOCK_SIZE + 1),
+                  (7 * PART_BLOCK_SIZE + 1, 40 * PART_BLOCK_SIZE), (99 * PART_BLOCK_SIZE, size)]
+        bitmap, fragments = encode_ranges(ranges, size)
+        self.assertEqual(decode_ranges(bitmap, fragments, size), ranges)
+        self.assertEqual(len(fragments), 3)
+        
+        # A fragmented 4 GB download stays a small sidecar
+        size = 4 * 1024 ** 3
+        ranges = [(start, start + 3 * PART_BLOCK_SIZE) for start in range(0, size, 4 * PART_BLOCK_SIZE)]
+        state = PartState('http://example.com/a.iso', size, ranges=ranges)
+        self.assertLess(len(json.dumps(state.to_dict())), 1024)
+        self.assertEqual(decode_ranges(*encode_ranges(ranges, size), size), ranges)
+    
+    def test_load_version_1(self):
+        """Test sidecars listing ranges, as older versions wrote them, still resume"""
+        with open(state_path(self.part_path), 'w') as f:
+            json.dump({'version': 1, 'url': 'http://example.com/a.iso', 'size': 100, 'etag': None,
+                       'last_modified': None, 'ranges': [[0, 10], [20, 30]]}, f)
+        self.assertEqual(PartState.load(self.part_path).ranges, [(0, 10), (20, 30)])
+    
+    def test_validators(self):
+        """Test If-Range and change detection use the right validator"""
+        url = 'http://example.com/a.iso'
+        state = PartState(url, 100, '"abc"', 'Mon, 01 Jan 2024 00:00:00 GMT')
+        self.assertEqual(state.if_range(url), '"abc"')
+        self.assertIsNone(state.if_range('http://mirror.example.com/a.iso'))
+        self.assertTrue(state.same_file(url, 100, '"abc"', None))
+        self.assertFalse(state.same_file(url, 100, '"def"', None))
+        self.assertFalse(state.same_file(url, 200, '"abc"', None))
+        # Mirrors are only compared by size
+        self.assertTrue(state.same_file('http://mirror.example.com/a.iso', 100, '"xyz"', None))
+        
+        weak = PartState(url, 100, 'W/"abc"', 'Mon, 01 Jan 2024 00:00:00 GMT')
+        self.assertEqual(weak.if_range(url), 'Mon, 01 Jan 2024 00:00:00 GMT')
+    
+    def test_remove_partial(self):
+        """Test the partial file and its sidecar are removed together"""
+        open(self.part_path, 'wb').close()
+        PartState('http://example.com/a.iso').save(self.part_path)
+        remove_partial(self.filepath)
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertFalse(os.path.exists(state_path(self.part_path)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Tests for connection warm-up and metadata prefetch
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+
+from utils.downloader import DownloadJob, free_space
+from utils.prefetch import MetadataPrefetcher
+from tests.http_server import LocalHTTPServer
+
+class TestMetadataPrefetcher(unittest.TestCase):
+    """Test cases for MetadataPrefetcher"""
+
+    def setUp(self):
+        """Start a local server"""
+        self.content = os.urandom(3 * 1024 * 1024)
+        self.server = LocalHTTPServer()
+        self.entry = self.server.add_file('/file.iso', self.content, etag='"v1"')
+        self.server.start()
+        self.url = self.server.url('/file.iso')
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Stop the server and remove downloaded files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def prefetch(self, prefetcher: MetadataPrefetcher, url: str) -> dict:
+        """Prefetch a URL and wait for the callback"""
+        done = threading.Event()
+        results = []
+        prefetcher.prefetch(url, lambda info: (results.append(info), done.set()))
+        self.assertTrue(done.wait(5))
+        return results[0]
+
+    def test_prefetch_and_cache(self):
+        """Test metadata is probed once and then served from the cache"""
+        prefetcher = MetadataPrefetcher()
+        info = self.prefetch(prefetcher, self.url)
+        self.assertEqual(info['size'], len(self.content))
+        self.assertTrue(info['accepts_ranges'])
+        self.assertEqual(info['etag'], '"v1"')
+
+        self.assertEqual(prefetcher.prefetch(self.url), info)
+        self.assertEqual(len(self.entry.requests), 1)
+
+    def test_concurrent_prefetches_share_probe(self):
+        """Test prefetches of a URL already being probed do not probe again"""
+        release = threading.Event()
+        calls = []
+
+        def probe(url):
+            calls.append(url)
+            release.wait(5)
+            return {'size': 1, 'accepts_ranges': True, 'etag': None, 'last_modified': None}
+
+        prefetcher = MetadataPrefetcher(probe=probe)
+        results = []
+        done = threading.Event()
+        prefetcher.prefetch('http://example.com/a.iso', results.append)
+        prefetcher.prefetch('http://example.com/a.iso', lambda info: (results.append(info), done.set()))
+        release.set()
+        self.assertTrue(done.wait(5))
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_probe_not_cached(self):
+        """Test a failed probe leaves nothing cached for the download to trust"""
+        prefetcher = MetadataPrefetcher()
+        info = self.prefetch(prefetcher, self.server.url('/missing.iso'))
+        self.assertEqual(info['size'], 0)
+        self.assertIsNone(prefetcher.cached(self.server.url('/missing.iso')))
+
+    def test_download_skips_probe(self):
+        """Test a job given prefetched metadata goes straight to its range requests"""
+        prefetcher = MetadataPrefetcher()
+        self.prefetch(prefetcher, self.url)
+        del self.entry.requests[:]
+
+        filepath = os.path.join(self.temp_dir.name, 'file.iso')
+        job = DownloadJob(self.url, filepath, connections=2, metadata=prefetcher.cached(self.url))
+        self.assertTrue(job.run())
+        self.assertEqual([method for method, _ in self.entry.requests], ['GET', 'GET'])
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_free_space(self):
+        """Test free space is found for directories that do not exist yet"""
+        self.assertGreater(free_space(self.temp_dir.name), 0)
+        self.assertIsNotNone(free_space(os.path.join(self.temp_dir.name, 'a', 'b')))
+
+if __name__ == '__main__':
+    unittest.main()
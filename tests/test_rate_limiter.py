@@ -0,0 +1,104 @@
+"""
+Tests for the shared bandwidth limiter
+"""
+
+import datetime
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from utils.downloader import DownloadJob
+from utils.rate_limiter import RateLimiter, Schedule, get_limiter, parse_rate
+from tests.http_server import LocalHTTPServer
+
+class TestRateLimiter(unittest.TestCase):
+    """Test cases for RateLimiter, rates and schedules"""
+
+    def test_parse_rate(self):
+        """Test rates with units and the spellings of no limit"""
+        self.assertEqual(parse_rate('500K'), 500 * 1024)
+        self.assertEqual(parse_rate('2M'), 2 * 1024 ** 2)
+        self.assertEqual(parse_rate('1.5MB/s'), 1.5 * 1024 ** 2)
+        self.assertEqual(parse_rate('100'), 100)
+        for text in ('', '0', 'off', 'unlimited'):
+            self.assertEqual(parse_rate(text), 0)
+        with self.assertRaises(ValueError):
+            parse_rate('fast')
+
+    def test_schedule(self):
+        """Test windows by weekday, across midnight and outside every window"""
+        schedule = Schedule.parse("Mon-Fri 09:00-18:00=1M; 22:00-06:00=off")
+        monday = datetime.datetime(2026, 10, 12)
+        self.assertEqual(schedule.rate_at(monday.replace(hour=10)), 1024 ** 2)
+        self.assertIsNone(schedule.rate_at(monday.replace(hour=19)))
+        self.assertEqual(schedule.rate_at(monday.replace(hour=23)), 0)
+        self.assertEqual(schedule.rate_at(monday.replace(hour=5)), 0)
+        self.assertIsNone(schedule.rate_at((monday + datetime.timedelta(days=5)).replace(hour=10)))
+        with self.assertRaises(ValueError):
+            Schedule.parse("Someday 09:00-18:00=1M")
+
+    def test_shared_rate(self):
+        """Test the total rate of several threads stays at the limit"""
+        limiter = RateLimiter(4 * 1024 * 1024)
+        chunk = 64 * 1024
+        totals = []
+
+        def transfer():
+            total = 0
+            deadline = time.monotonic() + 0.5
+            while time.monotonic() < deadline:
+                limiter.consume(chunk)
+                total += chunk
+            totals.append(total)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=transfer) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rate = sum(totals) / (time.monotonic() - started)
+        self.assertLess(abs(rate - limiter.rate) / limiter.rate, 0.25)
+
+    def test_rate_change_wakes_waiters(self):
+        """Test lifting the limit releases transfers waiting on it"""
+        limiter = RateLimiter(1024)
+        done = threading.Event()
+        thread = threading.Thread(target=lambda: (limiter.consume(64 * 1024), done.set()))
+        thread.start()
+        self.assertFalse(done.wait(0.2))
+        limiter.set_rate(0)
+        self.assertTrue(done.wait(1))
+        thread.join()
+
+class TestLimitedDownload(unittest.TestCase):
+    """Test cases for downloads under the application-wide limit"""
+
+    def setUp(self):
+        """Start a local server and limit downloads"""
+        self.content = os.urandom(2 * 1024 * 1024)
+        self.server = LocalHTTPServer()
+        self.server.add_file('/file.iso', self.content)
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        get_limiter().set_rate(4 * 1024 * 1024)
+
+    def tearDown(self):
+        """Lift the limit and stop the server"""
+        get_limiter().set_rate(0)
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def test_segments_share_limit(self):
+        """Test the segments of a download share one limit"""
+        filepath = os.path.join(self.temp_dir.name, 'file.iso')
+        started = time.monotonic()
+        self.assertTrue(DownloadJob(self.server.url('/file.iso'), filepath, connections=4).run())
+        self.assertGreater(time.monotonic() - started, 0.35)
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+if __name__ == '__main__':
+    unittest.main()
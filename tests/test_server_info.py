@@ -0,0 +1,116 @@
+"""
+Tests for offline server information lookups
+"""
+
+import ipaddress
+import os
+import tempfile
+import threading
+import unittest
+
+from utils.server_info import DNSCache, GeoIPTable, ServerInfoLookup, country_flag, write_table
+
+def v4(address: str) -> int:
+    return int(ipaddress.IPv4Address(address))
+
+class TestGeoIPTable(unittest.TestCase):
+    """Test cases for the binary IP country table"""
+    
+    def setUp(self):
+        """Write a small table"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'geoip.bin')
+        ipv4 = [(v4('1.0.0.0'), v4('1.0.0.255'), 'AU'), (v4('8.8.8.0'), v4('8.8.8.255'), 'US'),
+                (v4('193.0.0.0'), v4('193.0.7.255'), 'NL')]
+        ipv6 = [(int(ipaddress.IPv6Address('2001:67c::')) >> 64,
+                 (int(ipaddress.IPv6Address('2001:67c::')) >> 64) + 0xFFFFFFFF, 'NL')]
+        write_table(self.path, ipv4, ipv6, {'NL': 'Netherlands', 'US': 'United States'})
+        self.table = GeoIPTable(self.path)
+    
+    def tearDown(self):
+        """Remove the table"""
+        self.temp_dir.cleanup()
+    
+    def test_lookup(self):
+        """Test addresses inside, between and outside the ranges"""
+        self.assertEqual(self.table.lookup('8.8.8.8'), 'US')
+        self.assertEqual(self.table.lookup('1.0.0.0'), 'AU')
+        self.assertEqual(self.table.lookup('193.0.7.255'), 'NL')
+        self.assertIsNone(self.table.lookup('9.9.9.9'))
+        self.assertIsNone(self.table.lookup('0.0.0.1'))
+        self.assertIsNone(self.table.lookup('not an address'))
+        self.assertEqual(self.table.lookup('2001:67c:2e8::1'), 'NL')
+        self.assertIsNone(self.table.lookup('2a00::1'))
+    
+    def test_names_and_flags(self):
+        """Test country names fall back to the code"""
+        self.assertEqual(self.table.country_name('NL'), 'Netherlands')
+        self.assertEqual(self.table.country_name('AU'), 'AU')
+        self.assertEqual(country_flag('NL'), '🇳🇱')
+        self.assertEqual(country_flag(None), '🏳️')
+    
+    def test_lookup_service(self):
+        """Test server info is resolved once, in the background"""
+        calls = []
+        
+        def resolver(host):
+            calls.append(host)
+            return '193.0.0.10'
+        
+        lookup = ServerInfoLookup(self.path, dns=DNSCache(resolver=resolver))
+        url = 'https://mirror.example.org/isos/test.iso'
+        self.assertIsNone(lookup.cached(url))
+        
+        done = threading.Event()
+        results = []
+        self.assertIsNone(lookup.lookup(url, lambda info: (results.append(info), done.set())))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(results[0]['country_name'], 'Netherlands')
+        self.assertEqual(results[0]['ip'], '193.0.0.10')
+        
+        # The second lookup is answered from the cache without a callback
+        info = lookup.lookup(url, lambda info: self.fail("unexpected callback"))
+        self.assertEqual(info['domain'], 'mirror.example.org')
+        self.assertEqual(calls, ['mirror.example.org'])
+    
+    def test_missing_table(self):
+        """Test lookups still work without a table"""
+        lookup = ServerInfoLookup(os.path.join(self.temp_dir.name, 'missing.bin'),
+                                  dns=DNSCache(resolver=lambda host: '8.8.8.8'))
+        info = lookup.describe('example.org', '8.8.8.8')
+        self.assertEqual(info['country_name'], 'Unknown')
+
+class TestDNSCache(unittest.TestCase):
+    """Test cases for DNSCache"""
+    
+    def test_concurrent_lookups_share_one_query(self):
+        """Test simultaneous resolves of one host are coalesced"""
+        release = threading.Event()
+        calls = []
+        
+        def resolver(host):
+            calls.append(host)
+            release.wait(5)
+            return '127.0.0.1'
+        
+        dns = DNSCache(resolver=resolver)
+        futures = [dns.resolve('example.org') for _ in range(5)]
+        release.set()
+        self.assertEqual({future.result(5) for future in futures}, {'127.0.0.1'})
+        self.assertEqual(calls, ['example.org'])
+    
+    def test_failures_are_cached(self):
+        """Test a failed lookup is not retried immediately"""
+        calls = []
+        
+        def resolver(host):
+            calls.append(host)
+            raise OSError("no such host")
+        
+        dns = DNSCache(resolver=resolver)
+        self.assertIsNone(dns.resolve('missing.invalid').result(5))
+        self.assertEqual(dns.cached('missing.invalid'), (True, None))
+        self.assertEqual(len(calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
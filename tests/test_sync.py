@@ -0,0 +1,145 @@
+"""
+Tests for syncing a directory with the catalog
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from utils.data_manager import DistroDataManager
+from utils.sync import FETCH, KEEP, PRUNE, STAGING_DIR, VERIFY, SyncState, execute_sync, plan_sync
+from tests.http_server import LocalHTTPServer
+from tests.test_library import crashing_hash_file
+
+class TestSync(unittest.TestCase):
+    """Test cases for sync plans and their execution"""
+
+    def setUp(self):
+        """Serve two ISOs and write a catalog pointing at them"""
+        self.files = {'one.iso': os.urandom(300 * 1024), 'two.iso': os.urandom(200 * 1024)}
+        self.server = LocalHTTPServer()
+        self.entries = {name: self.server.add_file(f'/{name}', content) for name, content in self.files.items()}
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.temp_dir.name, 'isos')
+        self.data_file = os.path.join(self.temp_dir.name, 'distro_data.json')
+        self.write_catalog()
+
+    def tearDown(self):
+        """Stop the server and remove files"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def write_catalog(self, checksums=None):
+        checksums = checksums or {}
+        editions = {name.split('.')[0].title(): {
+            'filename': name, 'url': self.server.url(f'/{name}'),
+            'checksum': checksums.get(name, hashlib.sha256(content).hexdigest())
+        } for name, content in self.files.items()}
+        with open(self.data_file, 'w') as f:
+            json.dump({'Test': {'description': 'Test distribution', 'editions': editions}}, f)
+        self.manager = DistroDataManager(self.data_file)
+
+    def sync(self, **options):
+        state = SyncState(self.directory) if os.path.isdir(self.directory) else None
+        plan = plan_sync(self.directory, self.manager, state, prune=options.pop('prune', False))
+        return execute_sync(plan, self.manager, state, **options)
+
+    def actions(self, plan):
+        return {entry['filename']: entry['action'] for entry in plan.actions}
+
+    def read(self, name: str) -> bytes:
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return f.read()
+
+    def test_dry_run_changes_nothing(self):
+        """Test planning an empty directory fetches everything without touching the disk"""
+        plan = plan_sync(self.directory, self.manager)
+        self.assertEqual(self.actions(plan), {'one.iso': FETCH, 'two.iso': FETCH})
+        self.assertTrue(plan.changes)
+        self.assertFalse(os.path.exists(self.directory))
+
+    def test_sync_and_fast_rerun(self):
+        """Test a sync fetches every edition and a rerun keeps them without hashing or requests"""
+        plan = self.sync()
+        self.assertTrue(plan.ok)
+        for name, content in self.files.items():
+            self.assertEqual(self.read(name), content)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['.distro-sync.json', 'one.iso', 'two.iso'])
+
+        requests = sum(len(entry.requests) for entry in self.entries.values())
+        started = time.monotonic()
+        plan = plan_sync(self.directory, self.manager)
+        self.assertEqual(self.actions(plan), {'one.iso': KEEP, 'two.iso': KEEP})
+        self.assertFalse(plan.changes)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(sum(len(entry.requests) for entry in self.entries.values()), requests)
+
+    def test_changed_file_reverified(self):
+        """Test a file modified since the last sync is hashed and fetched again if corrupt"""
+        self.sync()
+        path = os.path.join(self.directory, 'one.iso')
+        with open(path, 'r+b') as f:
+            f.write(b'corrupt')
+        plan = plan_sync(self.directory, self.manager)
+        self.assertEqual(self.actions(plan), {'one.iso': VERIFY, 'two.iso': KEEP})
+        plan = execute_sync(plan, self.manager)
+        self.assertTrue(plan.ok)
+        self.assertEqual(plan.actions[0]['reason'], 'mismatch')
+        self.assertEqual(self.read('one.iso'), self.files['one.iso'])
+
+    def test_failed_fetch_keeps_old_file(self):
+        """Test a new release that fails to verify leaves the old file in place and nothing partial"""
+        self.sync()
+        old = self.files['one.iso']
+        self.files['one.iso'] = os.urandom(300 * 1024)
+        self.entries['one.iso'].content = self.files['one.iso']
+        self.write_catalog({'one.iso': '0' * 64})
+        plan = plan_sync(self.directory, self.manager)
+        self.assertEqual(self.actions(plan), {'one.iso': FETCH, 'two.iso': KEEP})
+        plan = execute_sync(plan, self.manager)
+        self.assertFalse(plan.ok)
+        self.assertEqual(self.read('one.iso'), old)
+        self.assertEqual(sorted(name for name in os.listdir(self.directory) if name.endswith('.iso')),
+                         ['one.iso', 'two.iso'])
+
+        # Once the catalog is right the new release replaces the old one
+        self.write_catalog()
+        self.assertTrue(self.sync().ok)
+        self.assertEqual(self.read('one.iso'), self.files['one.iso'])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, STAGING_DIR)))
+
+    def test_worker_crash(self):
+        """Test a file whose hashing worker died is reported as failed instead of aborting the sync"""
+        self.sync()
+        path = os.path.join(self.directory, 'crash.iso')
+        os.rename(os.path.join(self.directory, 'one.iso'), path)
+        self.files['crash.iso'] = self.files.pop('one.iso')
+        self.entries['crash.iso'] = self.server.add_file('/crash.iso', self.files['crash.iso'])
+        self.write_catalog()
+        plan = plan_sync(self.directory, self.manager)
+        self.assertEqual(self.actions(plan), {'crash.iso': VERIFY, 'two.iso': KEEP})
+        with patch('utils.sync.hash_file', crashing_hash_file):
+            plan = execute_sync(plan, self.manager)
+        self.assertFalse(plan.ok)
+        self.assertEqual(plan.of(VERIFY)[0]['status'], 'failed')
+        self.assertEqual(plan.of(KEEP)[0]['status'], 'ok')
+
+    def test_prune(self):
+        """Test disk images outside the catalog are removed only when pruning"""
+        os.makedirs(self.directory)
+        for name in ('old.iso', 'notes.txt'):
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(b'x')
+        self.assertNotIn('old.iso', self.actions(plan_sync(self.directory, self.manager)))
+        plan = self.sync(prune=True)
+        self.assertEqual(plan.of(PRUNE)[0]['filename'], 'old.iso')
+        self.assertTrue(plan.ok)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['.distro-sync.json', 'notes.txt', 'one.iso', 'two.iso'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Tests for concurrent, cached version checking
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from utils.version_checker import VersionChecker, parse_arch, parse_release_file
+from tests.http_server import LocalHTTPServer
+
+class TestVersionChecker(unittest.TestCase):
+    """Test cases for VersionChecker"""
+    
+    def setUp(self):
+        """Serve two release sources"""
+        self.server = LocalHTTPServer()
+        self.arch = self.server.add_file('/arch.json', json.dumps({'latest_version': '2024.06.01'}).encode(),
+                                         etag='"arch-1"')
+        self.debian = self.server.add_file('/Release', b"Suite: stable\nVersion: 12.6\nCodename: bookworm\n")
+        self.server.start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.temp_dir.name, 'versions.json')
+        self.sources = {
+            'Arch Linux': (self.server.url('/arch.json'), parse_arch),
+            'Debian': (self.server.url('/Release'), parse_release_file),
+            'Broken': (self.server.url('/missing'), parse_arch),
+        }
+    
+    def tearDown(self):
+        """Stop the server and remove the cache"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+    
+    def checker(self, ttl: float = 3600) -> VersionChecker:
+        return VersionChecker(self.cache_file, ttl=ttl, sources=self.sources)
+    
+    def test_check_all(self):
+        """Test every source is queried and failures are left out"""
+        seen = []
+        results = self.checker().check_all(on_result=lambda distro, info: seen.append(distro))
+        self.assertEqual(results['Arch Linux']['version'], '2024.06.01')
+        self.assertEqual(results['Debian']['name'], '12.6 (bookworm)')
+        self.assertNotIn('Broken', results)
+        self.assertEqual(sorted(seen), ['Arch Linux', 'Debian'])
+    
+    def test_cache_within_ttl(self):
+        """Test a restart within the TTL makes no network calls"""
+        self.checker().check_all()
+        requests_before = len(self.arch.requests) + len(self.debian.requests)
+        
+        results = self.checker().check_all(['Arch Linux', 'Debian'])
+        self.assertEqual(results['Debian']['version'], '12.6')
+        self.assertEqual(len(self.arch.requests) + len(self.debian.requests), requests_before)
+    
+    def test_conditional_request(self):
+        """Test expired entries are revalidated with their ETag"""
+        self.checker().check_all(['Arch Linux'])
+        results = self.checker(ttl=0).check_all(['Arch Linux'])
+        self.assertEqual(results['Arch Linux']['version'], '2024.06.01')
+        method, headers = self.arch.requests[-1]
+        self.assertEqual(headers['If-None-Match'], '"arch-1"')
+    
+    def test_stale_result_on_failure(self):
+        """Test the last known version is kept when a source fails"""
+        self.checker().check_all(['Debian'])
+        self.sources['Debian'] = (self.server.url('/missing'), parse_release_file)
+        results = self.checker(ttl=0).check_all(['Debian'])
+        self.assertEqual(results['Debian']['version'], '12.6')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Atomic file writes for Linux Distro Downloader
+
+Caches, indexes and sidecars are written to a temporary file next to
+their target and renamed over it, so a reader never sees a partial file.
+Every write gets its own temporary file from ``mkstemp``, so threads and
+processes saving the same file at once never truncate or rename away each
+other's.
+"""
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Any, Iterator, Union
+
+PathLike = Union[str, 'os.PathLike[str]']
+
+def temp_path_for(path: PathLike) -> str:
+    """Get an unused temporary path next to path, for callers that create the file themselves (e.g. os.link)"""
+    path = os.fspath(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f'{os.path.basename(path)}.', suffix='.tmp',
+                                     dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    os.remove(temp_path)
+    return temp_path
+
+@contextmanager
+def atomic_write(path: PathLike, mode: str = 'w') -> Iterator[IO[Any]]:
+    """Open a private temporary file that replaces path once the block completes
+
+    If the block raises, the temporary file is removed and path is left as
+    it was.
+    """
+    path = os.fspath(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f'{os.path.basename(path)}.', suffix='.tmp',
+                                     dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else 'utf-8') as f:
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def write_json(path: PathLike, data: Any):
+    """Write data as JSON atomically"""
+    with atomic_write(path) as f:
+        json.dump(data, f)
@@ -11,6 +11,11 @@ from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+def get_mirror_urls(edition_data: Dict[str, Any]) -> List[str]:
+    """Get all download URLs for an edition, primary URL first"""
+    urls = [edition_data['url']] + list(edition_data.get('mirrors', []))
+    return list(dict.fromkeys(urls))
+
 class DistroDataManager:
     """Manage distribution data and validation"""
     
@@ -95,6 +100,32 @@ class DistroDataManager:
             logger.error(f"Invalid URL format in edition '{edition_name}' of '{distro_name}': {url}")
             return False
         
+        # Validate optional mirror list
+        mirrors = data.get('mirrors', [])
+        if not isinstance(mirrors, list):
+            logger.error(f"'mirrors' must be a list in edition '{edition_name}' of '{distro_name}'")
+            return False
+        
+        for mirror in mirrors:
+            # Local mirrors (e.g. a NAS mount) are read through the file transport
+            if not isinstance(mirror, str) or not mirror.startswith(('http://', 'https://', 'file://')):
+                logger.error(f"Invalid mirror URL in edition '{edition_name}' of '{distro_name}': {mirror}")
+                return False
+        
+        # An optional Metalink adds mirrors and piece hashes
+        metalink = data.get('metalink')
+        if metalink is not None and (not isinstance(metalink, str)
+                                     or not metalink.startswith(('http://', 'https://', 'file://'))):
+            logger.error(f"Invalid Metalink URL in edition '{edition_name}' of '{distro_name}': {metalink}")
+            return False
+        
+        # An optional block map (.zsync or generated) allows delta updates from an older ISO
+        zsync = data.get('zsync')
+        if zsync is not None and (not isinstance(zsync, str)
+                                  or not zsync.startswith(('http://', 'https://', 'file://'))):
+            logger.error(f"Invalid block map URL in edition '{edition_name}' of '{distro_name}': {zsync}")
+            return False
+        
         # Validate checksum format (should be 64 character hex string for SHA256)
         checksum = data['checksum']
         if not isinstance(checksum, str) or len(checksum) != 64:
@@ -128,14 +159,17 @@ class DistroDataManager:
             return self.data[distro_name]['editions'][edition_name]
         return None
     
-    def get_download_info(self, distro_name: str, edition_name: str) -> Optional[Dict[str, str]]:
+    def get_download_info(self, distro_name: str, edition_name: str) -> Optional[Dict[str, Any]]:
         """Get download information for a specific edition"""
         edition_info = self.get_edition_info(distro_name, edition_name)
         if edition_info:
             return {
                 'url': edition_info['url'],
+                'mirrors': get_mirror_urls(edition_info),
                 'filename': edition_info['filename'],
-                'checksum': edition_info['checksum']
+                'checksum': edition_info['checksum'],
+                'metalink': edition_info.get('metalink'),
+                'zsync': edition_info.get('zsync')
             }
         return None
     
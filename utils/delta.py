@@ -0,0 +1,414 @@
+"""
+Delta updates for Linux Distro Downloader
+
+Point releases share most of their blocks with the previous image, so a
+new ISO is assembled from an older one already on disk plus only the
+ranges that changed. The new image is described by a block map: a
+``.zsync`` file as published by several distributions, or one generated
+with ``create_block_map`` (saved as JSON, e.g. next to an ISO on a local
+mirror). Every block has a weak rolling checksum and a truncated strong
+hash.
+
+ISO 9660 images keep file data in 2048-byte sectors, so the old image is
+scanned at sector offsets rather than at every byte; this finds the same
+blocks at a fraction of the cost in Python. Blocks are looked up by their
+strong hash in a sorted array (12 bytes per block rather than a dict
+entry), and a match must also pass the weak checksum unless the strong
+hash is long enough on its own or the match continues a run of matching
+blocks. The assembled file must match the catalog's SHA-256.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from utils.downloader import (ByteRange, DownloadProgress, JobControl, StreamingHasher, download_segment,
+                              preallocate, request_timeout, transport_for)
+
+logger = logging.getLogger(__name__)
+
+ISO_SECTOR = 2048
+DEFAULT_BLOCK_SIZE = ISO_SECTOR  # The block size zsyncmake picks for ISOs
+GENERATED_CHECKSUM_BYTES = 8  # 12 bytes per block with the weak checksum: 24 MB for a 4 GB ISO
+MIN_STRONG_BYTES = 8  # Shorter strong hashes also need the weak checksum to rule out false matches
+BLOCK_MAP_VERSION = 1
+MAX_BLOCK_MAP_SIZE = 64 * 1024 * 1024
+SCAN_READ_SIZE = 8 * 1024 * 1024
+COPY_SIZE = 1024 * 1024
+MIN_REUSE_RUN = 256 * 1024  # Shorter runs of reusable bytes between changes are fetched rather than split the range
+
+def rsum(block: Any) -> bytes:
+    """The zsync rolling checksum of a block: 16-bit sums a and b, big-endian"""
+    a = sum(block) & 0xFFFF
+    b = sum(accumulate(block)) & 0xFFFF  # Same as the sum of (length - i) * byte
+    return a.to_bytes(2, 'big') + b.to_bytes(2, 'big')
+
+def adler32(block: Any) -> bytes:
+    return zlib.adler32(block).to_bytes(4, 'big')
+
+WEAK_CHECKSUMS = {'rsum': rsum, 'adler32': adler32}
+
+def strong_digest(hash_type: str) -> Callable[[Any], bytes]:
+    """Get a function hashing a block with hash_type
+
+    MD4, used by ``.zsync`` files, is missing from OpenSSL 3 builds of
+    hashlib; pycryptodome provides it where installed.
+    """
+    try:
+        hashlib.new(hash_type)
+        constructor = getattr(hashlib, hash_type, None)
+        if constructor:
+            return lambda data: constructor(data).digest()
+        return lambda data: hashlib.new(hash_type, data).digest()
+    except ValueError:
+        if hash_type != 'md4':
+            raise ValueError(f"Unsupported block hash: {hash_type}") from None
+    try:
+        from Crypto.Hash import MD4
+    except ImportError:
+        raise ValueError("MD4 (used by .zsync files) is not available; install pycryptodome") from None
+    return lambda data: MD4.new(bytes(data)).digest()
+
+class BlockMap:
+    """Weak and strong checksums of every block of a file
+
+    ``entries`` holds one record per block: the last ``weak_bytes`` of its
+    weak checksum followed by the first ``checksum_bytes`` of its strong
+    hash. The last block is hashed padded with zeros to the block size.
+    """
+
+    def __init__(self, block_size: int, length: int, entries: bytes, hash_type: str = 'sha256',
+                 weak_type: str = 'adler32', weak_bytes: int = 4,
+                 checksum_bytes: int = GENERATED_CHECKSUM_BYTES, sha256: Optional[str] = None):
+        if block_size <= 0 or not 0 < weak_bytes <= 4 or checksum_bytes <= 0 or weak_type not in WEAK_CHECKSUMS:
+            raise ValueError(f"Invalid block map parameters: {block_size}, {weak_type}, {weak_bytes}, "
+                             f"{checksum_bytes}")
+        self.block_size = block_size
+        self.length = length
+        self.entries = entries
+        self.hash_type = hash_type
+        self.weak_type = weak_type
+        self.weak_bytes = weak_bytes
+        self.checksum_bytes = checksum_bytes
+        self.sha256 = sha256
+        if len(entries) != len(self) * self.record_size:
+            raise ValueError(f"Block map has {len(entries)} bytes of checksums for {len(self)} blocks")
+
+    def __len__(self) -> int:
+        return (self.length + self.block_size - 1) // self.block_size
+
+    @property
+    def record_size(self) -> int:
+        return self.weak_bytes + self.checksum_bytes
+
+    def weak(self, index: int) -> bytes:
+        offset = index * self.record_size
+        return self.entries[offset:offset + self.weak_bytes]
+
+    def strong(self, index: int) -> bytes:
+        offset = index * self.record_size + self.weak_bytes
+        return self.entries[offset:offset + self.checksum_bytes]
+
+    def block_range(self, index: int) -> Tuple[int, int]:
+        """Get the inclusive byte range of a block"""
+        start = index * self.block_size
+        return start, min(start + self.block_size, self.length) - 1
+
+    @classmethod
+    def parse(cls, content: bytes) -> 'BlockMap':
+        """Read a ``.zsync`` file or a generated JSON block map"""
+        if content.lstrip().startswith(b'{'):
+            try:
+                return cls.from_dict(json.loads(content))
+            except UnicodeDecodeError as e:
+                raise ValueError(f"Invalid block map: {e}") from e
+        return cls.parse_zsync(content)
+
+    @classmethod
+    def parse_zsync(cls, content: bytes) -> 'BlockMap':
+        header, separator, entries = content.partition(b'\n\n')
+        if not separator:
+            raise ValueError("Not a zsync file: no end of header")
+        fields = {}
+        for line in header.decode('utf-8', 'replace').splitlines():
+            name, _, value = line.partition(':')
+            fields[name.strip().lower()] = value.strip()
+        if 'zsync' not in fields:
+            raise ValueError("Not a zsync file")
+        try:
+            _, weak_bytes, checksum_bytes = (int(value) for value in fields.get('hash-lengths', '2,4,16').split(','))
+            return cls(int(fields['blocksize']), int(fields['length']), entries, 'md4', 'rsum',
+                       weak_bytes, checksum_bytes)
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"Invalid zsync header: {e}") from e
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'version': BLOCK_MAP_VERSION, 'block_size': self.block_size, 'length': self.length,
+                'hash_type': self.hash_type, 'weak_type': self.weak_type, 'weak_bytes': self.weak_bytes,
+                'checksum_bytes': self.checksum_bytes, 'sha256': self.sha256,
+                'entries': base64.b64encode(self.entries).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'BlockMap':
+        if data.get('version') != BLOCK_MAP_VERSION:
+            raise ValueError(f"Unsupported block map version: {data.get('version')}")
+        try:
+            return cls(data['block_size'], data['length'], base64.b64decode(data['entries']),
+                       data.get('hash_type', 'sha256'), data.get('weak_type', 'adler32'),
+                       data.get('weak_bytes', 4), data.get('checksum_bytes', GENERATED_CHECKSUM_BYTES),
+                       data.get('sha256'))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid block map: {e}") from e
+
+class DeltaReport:
+    """Outcome of a delta update"""
+
+    def __init__(self, reused: int = 0, fetched: int = 0):
+        self.reused = reused
+        self.fetched = fetched
+        self.ranges = 0
+        self.scan_seconds = 0.0
+        self.elapsed = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        total = self.reused + self.fetched
+        return {'reused': self.reused, 'fetched': self.fetched, 'ranges': self.ranges,
+                'reused_percent': round(100 * self.reused / total, 1) if total else 0.0,
+                'scan_seconds': round(self.scan_seconds, 3), 'seconds': round(self.elapsed, 3)}
+
+def create_block_map(filepath: str, block_size: int = DEFAULT_BLOCK_SIZE) -> BlockMap:
+    """Generate the block map of a file, along with its SHA-256"""
+    digest = strong_digest('sha256')
+    whole = hashlib.sha256()
+    entries = bytearray()
+    with open(filepath, 'rb') as f:
+        while True:
+            data = f.read(max(SCAN_READ_SIZE // block_size, 1) * block_size)
+            if not data:
+                break
+            whole.update(data)
+            view = memoryview(data)
+            for offset in range(0, len(data), block_size):
+                block = view[offset:offset + block_size]
+                if len(block) < block_size:
+                    block = bytes(block).ljust(block_size, b'\0')
+                entries += adler32(block) + digest(block)[:GENERATED_CHECKSUM_BYTES]
+    return BlockMap(block_size, os.path.getsize(filepath), bytes(entries), sha256=whole.hexdigest())
+
+def sorted_keys(block_map: BlockMap) -> Tuple[array, array]:
+    """Sort the blocks by the first 8 bytes of their strong hash, for lookups by bisection"""
+    width = min(block_map.checksum_bytes, 8)
+    keys = array('Q', (int.from_bytes(block_map.strong(index)[:width], 'big') for index in range(len(block_map))))
+    order = array('L', sorted(range(len(block_map)), key=keys.__getitem__))
+    return array('Q', (keys[index] for index in order)), order
+
+def find_reusable(old_path: str, block_map: BlockMap, control: Optional[JobControl] = None) -> array:
+    """Find blocks of the new file in an old one
+
+    Returns the offset in the old file of every block of the new one, or
+    -1 for blocks that have to be fetched.
+    """
+    digest = strong_digest(block_map.hash_type)
+    weak = WEAK_CHECKSUMS[block_map.weak_type]
+    size = block_map.block_size
+    width = min(block_map.checksum_bytes, 8)
+    weak_slice = slice(4 - block_map.weak_bytes, 4)
+    keys, order = sorted_keys(block_map)
+    found = array('q', [-1]) * len(block_map)
+    missing = len(block_map)
+
+    def matches(block: Any, index: int, offset: int, strong: bytes) -> bool:
+        if strong != block_map.strong(index):
+            return False
+        if block_map.checksum_bytes >= MIN_STRONG_BYTES:
+            return True
+        # A block continuing a run of matches is as good as zsync's consecutive matches
+        if index and found[index - 1] == offset - size:
+            return True
+        return weak(block)[weak_slice] == block_map.weak(index)
+
+    step = min(size, ISO_SECTOR)
+    with open(old_path, 'rb') as f:
+        base = 0  # Offset in the old file of data[0]
+        data = b''
+        eof = False
+        while not eof and missing:
+            if control and control.is_cancelled():
+                break
+            chunk = f.read(SCAN_READ_SIZE)
+            eof = not chunk
+            data = data + chunk
+            view = memoryview(data)
+            pos = 0
+            while pos + size <= len(data) or (eof and pos < len(data)):
+                block = view[pos:pos + size]
+                if len(block) < size:
+                    block = bytes(block).ljust(size, b'\0')
+                strong = digest(block)[:block_map.checksum_bytes]
+                key = int.from_bytes(strong[:width], 'big')
+                slot = bisect_left(keys, key)
+                while slot < len(keys) and keys[slot] == key:
+                    index = order[slot]
+                    if found[index] < 0 and matches(block, index, base + pos, strong):
+                        found[index] = base + pos
+                        missing -= 1
+                    slot += 1
+                pos += step
+            view.release()
+            data = data[pos:]
+            base += pos
+    logger.info(f"Found {len(found) - missing} of {len(found)} blocks in {old_path}")
+    return found
+
+def plan_ranges(block_map: BlockMap, found: array) -> List[Tuple[int, int]]:
+    """Get the byte ranges to fetch, joining ranges split by short runs of reusable blocks"""
+    ranges: List[Tuple[int, int]] = []
+    for index, source in enumerate(found):
+        if source >= 0:
+            continue
+        start, end = block_map.block_range(index)
+        if ranges and start - ranges[-1][1] - 1 < MIN_REUSE_RUN:
+            start = ranges.pop()[0]
+        ranges.append((start, end))
+    return ranges
+
+def copy_blocks(old_path: str, new_path: str, block_map: BlockMap, found: array,
+                skip: List[Tuple[int, int]]) -> int:
+    """Copy reusable blocks from the old file into place, except those in ranges being fetched
+
+    Consecutive blocks that are also consecutive in the old file are
+    copied as one run.
+    """
+    copied = 0
+    fetched = iter(skip)
+    current = next(fetched, None)
+    with open(old_path, 'rb') as src, open(new_path, 'r+b') as dst:
+        old_size = os.fstat(src.fileno()).st_size
+        run: Optional[List[int]] = None  # [target start, source start, length]
+        for index, source in enumerate(found):
+            if source < 0:
+                continue
+            start, end = block_map.block_range(index)
+            while current and current[1] < start:
+                current = next(fetched, None)
+            if current and current[0] <= start:
+                continue
+            length = min(end - start + 1, old_size - source)  # The rest of a padded last block is zeros
+            if run and run[0] + run[2] == start and run[1] + run[2] == source:
+                run[2] += length
+                continue
+            if run:
+                copied += copy_range(src, dst, *run)
+            run = [start, source, length]
+        if run:
+            copied += copy_range(src, dst, *run)
+    return copied
+
+def copy_range(src, dst, target: int, source: int, length: int) -> int:
+    src.seek(source)
+    dst.seek(target)
+    remaining = length
+    while remaining > 0:
+        data = src.read(min(COPY_SIZE, remaining))
+        if not data:
+            break
+        dst.write(data)
+        remaining -= len(data)
+    return length - remaining
+
+def fetch_block_map(source: str, session: Any = None) -> Optional[BlockMap]:
+    """Load a block map from a local path or a URL"""
+    # Imported here to share the bounded body reader without a module cycle
+    from utils.metalink import read_body
+
+    try:
+        if os.path.exists(source):
+            with open(source, 'rb') as f:
+                content = f.read(MAX_BLOCK_MAP_SIZE + 1)
+        else:
+            http = transport_for(source, session)
+            response = http.get(source, stream=True, timeout=request_timeout(http))
+            try:
+                response.raise_for_status()
+                content = read_body(response, MAX_BLOCK_MAP_SIZE + 1)
+            finally:
+                response.close()
+        if len(content) > MAX_BLOCK_MAP_SIZE:
+            raise ValueError("Block map is too large")
+        return BlockMap.parse(content)
+    except (requests.exceptions.RequestException, IOError, ValueError) as e:
+        logger.warning(f"Could not load block map {source}: {e}")
+        return None
+
+def delta_update(urls: List[str], filepath: str, checksum: str, old_path: str, block_map: BlockMap,
+                 control: Optional[JobControl] = None, session: Any = None,
+                 progress: Optional[DownloadProgress] = None) -> Optional[DeltaReport]:
+    """Build filepath from the blocks of old_path it shares, fetching only the rest from urls
+
+    The file is assembled next to filepath and moved into place once it
+    matches checksum. Returns a report of bytes reused and fetched, or None
+    if the update failed.
+    """
+    control = control or JobControl()
+    progress = progress or DownloadProgress()
+    checksum = checksum.lower()
+    if block_map.sha256 and block_map.sha256 != checksum:
+        logger.error(f"Block map describes another file (SHA-256 {block_map.sha256})")
+        return None
+
+    report = DeltaReport()
+    started = time.monotonic()
+    try:
+        found = find_reusable(old_path, block_map, control)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not scan {old_path}: {e}")
+        return None
+    report.scan_seconds = time.monotonic() - started
+    if control.is_cancelled():
+        return None
+
+    temp_path = filepath + '.delta'
+    ranges = plan_ranges(block_map, found)
+    report.ranges = len(ranges)
+    try:
+        # Every byte is either copied or fetched, so nothing stale survives
+        preallocate(temp_path, block_map.length)
+        report.reused = copy_blocks(old_path, temp_path, block_map, found, ranges)
+
+        progress.reset(sum(end - start + 1 for start, end in ranges))
+        for count, (start, end) in enumerate(ranges):
+            # Ranges are spread over the mirrors, trying the others when one fails
+            for url in urls[count % len(urls):] + urls[:count % len(urls)]:
+                try:
+                    if download_segment(url, temp_path, ByteRange(start, end), progress, control, session):
+                        break
+                except (requests.exceptions.RequestException, IOError) as e:
+                    logger.warning(f"Could not fetch bytes {start}-{end} from {url}: {e}")
+                if control.is_cancelled():
+                    raise InterruptedError("Delta update cancelled")
+            else:
+                raise IOError(f"No mirror served bytes {start}-{end}")
+            report.fetched += end - start + 1
+
+        if not StreamingHasher().verify(temp_path, checksum):
+            raise IOError("Assembled file does not match its checksum")
+        os.replace(temp_path, filepath)
+    except (OSError, InterruptedError) as e:
+        logger.error(f"Delta update of {filepath} failed: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+    report.elapsed = time.monotonic() - started
+    logger.info(f"Delta update of {filepath}: {report.to_dict()}")
+    return report
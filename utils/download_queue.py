@@ -0,0 +1,276 @@
+"""
+Download queue for Linux Distro Downloader
+
+Runs several edition downloads at once, limited by a global concurrency
+limit and a connection cap on the host each item starts from. Items can
+be reordered, paused and cancelled independently. Each item is a
+DownloadJob, so it downloads, pauses and resumes like any other job. Given a journal (see
+utils/journal.py), every item and its outcome is recorded there, so
+unfinished items can be queued again after a restart.
+"""
+
+import itertools
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Any
+from urllib.parse import urlparse
+
+from utils.downloader import DownloadJob
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 2
+DEFAULT_PER_HOST_LIMIT = 4
+
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+class QueueItem(DownloadJob):
+    """A single edition download in the queue"""
+
+    def __init__(self, item_id: int, distro: str, edition: str, download_dir: str,
+                 download_info: Dict[str, Any], connections: int = 1):
+        super().__init__(download_info['url'], os.path.join(download_dir, download_info['filename']),
+                         mirrors=download_info.get('mirrors'), checksum=download_info['checksum'],
+                         connections=connections, metadata=download_info.get('metadata'),
+                         metalink=download_info.get('metalink'))
+        self.id = item_id
+        self.distro = distro
+        self.edition = edition
+        self.download_dir = download_dir
+        self.filename = download_info['filename']
+        # Charged against the per-host cap: fallback mirrors are only used once it fails
+        self.host = urlparse(self.url).hostname or ''
+        self.state = QUEUED
+        self.journal_id: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.distro} {self.edition}"
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    @property
+    def status_text(self) -> str:
+        """Short status for display in the queue"""
+        if self.state == DOWNLOADING and self.paused:
+            return 'paused'
+        if self.state == QUEUED and self.paused:
+            return 'queued (paused)'
+        return self.state
+
+class DownloadQueue:
+    """Schedule queued downloads within concurrency and per-host limits"""
+
+    def __init__(self, run_item: Callable[[QueueItem], bool],
+                 max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+                 per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 on_change: Optional[Callable[[QueueItem], None]] = None, journal: Any = None):
+        self.run_item = run_item
+        self.max_concurrent = max(1, max_concurrent)
+        self.per_host_limit = max(1, per_host_limit)
+        self.on_change = on_change
+        self.journal = journal
+        self.items: List[QueueItem] = []
+        self._ids = itertools.count(1)
+        self._host_connections: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._condition = threading.Condition(self._lock)
+
+    def add(self, distro: str, edition: str, download_dir: str,
+            download_info: Dict[str, Any], connections: int = 1) -> QueueItem:
+        """Queue an edition for download"""
+        with self._lock:
+            item = QueueItem(next(self._ids), distro, edition, download_dir, download_info, connections)
+            if self.journal:
+                item.journal = self.journal
+                item.journal_id = self.journal.add_job(item)
+            self.items.append(item)
+            logger.info(f"Queued download #{item.id}: {item.name}")
+        self._notify(item)
+        self._schedule()
+        return item
+
+    def restore(self) -> List[QueueItem]:
+        """Queue again the items the journal recorded as unfinished, e.g. after a crash"""
+        if not self.journal:
+            return []
+        items = []
+        for job in self.journal.unfinished():
+            if self.find(job['filepath']):
+                continue
+            logger.info(f"Resuming unfinished download of {job['filepath']} from the journal")
+            os.makedirs(job['download_dir'], exist_ok=True)
+            items.append(self.add(job['distro'], job['edition'], job['download_dir'], job['info'],
+                                  connections=job['connections']))
+        return items
+
+    def get(self, item_id: int) -> Optional[QueueItem]:
+        """Get a queue item by id"""
+        with self._lock:
+            for item in self.items:
+                if item.id == item_id:
+                    return item
+        return None
+
+    def find(self, filepath: str) -> Optional[QueueItem]:
+        """Get the unfinished item writing to a file, if any"""
+        with self._lock:
+            for item in self.items:
+                if item.filepath == filepath and not item.finished:
+                    return item
+        return None
+
+    def move(self, item_id: int, offset: int) -> bool:
+        """Move an item up (negative offset) or down the queue"""
+        with self._lock:
+            item = self.get(item_id)
+            if item is None:
+                return False
+            index = self.items.index(item)
+            new_index = max(0, min(len(self.items) - 1, index + offset))
+            self.items.insert(new_index, self.items.pop(index))
+        self._notify(item)
+        self._schedule()
+        return True
+
+    def pause(self, item_id: int) -> bool:
+        """Pause a queued or running item"""
+        return self._set_paused(item_id, True)
+
+    def resume(self, item_id: int) -> bool:
+        """Resume a paused item"""
+        return self._set_paused(item_id, False)
+
+    def _set_paused(self, item_id: int, paused: bool) -> bool:
+        item = self.get(item_id)
+        if item is None or item.finished:
+            return False
+        if paused:
+            item.pause()
+        else:
+            item.resume()
+        logger.info(f"{'Paused' if paused else 'Resumed'} download #{item.id}: {item.name}")
+        self._notify(item)
+        self._schedule()
+        return True
+
+    def cancel(self, item_id: int) -> bool:
+        """Cancel a queued or running item"""
+        with self._lock:
+            item = self.get(item_id)
+            if item is None or item.finished:
+                return False
+            item.cancel()
+            if item.state == QUEUED:
+                item.state = CANCELLED
+                self._record(item, False)
+                self._condition.notify_all()
+
+        logger.info(f"Cancelled download #{item.id}: {item.name}")
+        self._notify(item)
+        return True
+
+    def clear_finished(self):
+        """Remove completed, failed and cancelled items"""
+        with self._lock:
+            self.items = [item for item in self.items if not item.finished]
+
+    def set_limits(self, max_concurrent: Optional[int] = None, per_host_limit: Optional[int] = None):
+        """Change the concurrency limits; running items are not interrupted"""
+        with self._lock:
+            if max_concurrent is not None:
+                self.max_concurrent = max(1, max_concurrent)
+            if per_host_limit is not None:
+                self.per_host_limit = max(1, per_host_limit)
+        self._schedule()
+
+    @property
+    def active_items(self) -> List[QueueItem]:
+        with self._lock:
+            return [item for item in self.items if item.state == DOWNLOADING]
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every item has finished"""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: all(item.finished for item in self.items), timeout)
+
+    def _schedule(self):
+        """Start queued items in order while the limits allow"""
+        started = []
+        with self._lock:
+            active = len(self.active_items)
+            for item in self.items:
+                if active >= self.max_concurrent:
+                    break
+                if item.state != QUEUED or item.paused:
+                    continue
+
+                # Later items for other hosts may start while this one waits for its host
+                connections = min(item.connections, self.per_host_limit)
+                if self._host_connections.get(item.host, 0) + connections > self.per_host_limit:
+                    continue
+
+                item.connections = connections
+                self._host_connections[item.host] = self._host_connections.get(item.host, 0) + connections
+                item.state = DOWNLOADING
+                active += 1
+                started.append(item)
+
+        for item in started:
+            logger.info(f"Starting download #{item.id}: {item.name}")
+            threading.Thread(target=self._run, args=(item,), daemon=True).start()
+            self._notify(item)
+
+    def _run(self, item: QueueItem):
+        """Run one item and start the next when it finishes"""
+        if item.journal_id is not None:
+            try:
+                self.journal.start_job(item.journal_id, item)
+            except Exception as e:
+                logger.warning(f"Could not record the start of download #{item.id}: {e}")
+        try:
+            ok = self.run_item(item)
+        except Exception as e:
+            logger.error(f"Download #{item.id} failed: {e}")
+            item.error = item.error or str(e)
+            ok = False
+
+        with self._lock:
+            if item.cancelled:
+                item.state = CANCELLED
+            else:
+                item.state = COMPLETED if ok else FAILED
+            item.response = None
+            self._host_connections[item.host] -= item.connections
+            self._record(item, ok)
+            # Report the outcome before waiters can see the item as finished
+            self._notify(item)
+            self._condition.notify_all()
+
+        self._schedule()
+
+    def _record(self, item: QueueItem, ok: bool):
+        """Record how an item ended in the journal"""
+        if item.journal_id is None:
+            return
+        try:
+            self.journal.finish_job(item.journal_id, item.state, item.error or None,
+                                    verified=ok and bool(item.checksum))
+        except Exception as e:
+            logger.warning(f"Could not record the outcome of download #{item.id}: {e}")
+
+    def _notify(self, item: QueueItem):
+        if self.on_change:
+            try:
+                self.on_change(item)
+            except Exception as e:
+                logger.warning(f"Queue change callback failed: {e}")
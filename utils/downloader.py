@@ -0,0 +1,1660 @@
+"""
+Download engine for Linux Distro Downloader
+
+This module contains the GUI-independent parts of the download process:
+progress tracking, server capability probing, segmented (multi-connection)
+downloads and checksum verification. ``DownloadJob`` ties them together
+behind start/pause/resume/cancel, so the GUI, the CLI and benchmarks all
+drive the same transfer loop; transports decide how requests are made
+(the shared client of utils/http_client.py or any requests session, a bare
+urllib3 pool, or local ``file://`` URLs).
+"""
+
+import abc
+import errno
+import hashlib
+import http.client
+import logging
+import mmap
+import os
+import queue
+import random
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from typing import Callable, Dict, List, Optional, Tuple, Any
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import requests
+import urllib3
+from requests.structures import CaseInsensitiveDict
+
+from utils.http_client import TransportResponse, close_response, get_client
+from utils.part_state import PartState, remove_partial, response_validators, state_path
+from utils.rate_limiter import get_limiter
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = 30
+DEFAULT_SEGMENTS = 4
+MAX_SEGMENTS = 16
+MIN_SEGMENT_SIZE = 1024 * 1024  # Files smaller than two segments use one stream
+HASH_READ_SIZE = 1024 * 1024
+HASH_FOLLOW_INTERVAL = 0.25
+SPEED_EWMA_ALPHA = 0.3  # Weight of the newest sample in the smoothed speed
+PROGRESS_POLL_INTERVAL = 0.1  # Displays sample progress at 10 Hz
+MIN_READ_SIZE = 64 * 1024
+MAX_READ_SIZE = 4 * 1024 * 1024
+READ_TARGET_TIME = 0.1  # The read size grows until one read takes about this long
+WRITE_QUEUE_DEPTH = 3  # Buffers per transfer, so memory stays bounded
+
+MAX_REDIRECTS = 10
+
+LOW_SPEED_LIMIT = 16 * 1024  # Bytes per second below which a connection counts as stalled
+LOW_SPEED_TIME = 20.0  # Seconds a connection may stay below LOW_SPEED_LIMIT before it is dropped
+WATCHDOG_INTERVAL = 1.0
+MAX_ACTIVE_MIRRORS = 4  # Mirrors downloaded from at once; the others are kept for failover
+RETRY_BUDGET = 8  # Retries per download job, shared by all its connections
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRY_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+RANGE_PATTERN = re.compile(r'bytes=(\d+)-(\d*)$')
+
+class DownloadProgress:
+    """Track download progress fed by one or more worker threads
+
+    Each worker adds to its own counter slot, so the transfer loop never
+    takes a lock. Smoothed speed and ETA are computed in ``sample()``, which
+    the display calls at a fixed rate rather than on every chunk.
+    """
+
+    def __init__(self, total_size: int = 0, downloaded: int = 0):
+        self.total_size = total_size
+        self.initial_size = downloaded
+        self.start_time = time.time()
+        self.last_update = self.start_time
+        self.ewma_speed = 0.0
+        self._counters: Dict[int, int] = {}
+        self._sample_time: Optional[float] = None
+        self._sample_bytes = downloaded
+
+    def reset(self, total_size: int, downloaded: int = 0):
+        """Start tracking a new transfer (called before workers start)"""
+        self.__init__(total_size, downloaded)
+
+    def update(self, bytes_count: int, slot: int = 0):
+        """Record newly downloaded bytes; each worker thread uses its own slot"""
+        self._counters[slot] = self._counters.get(slot, 0) + bytes_count
+        self.last_update = time.time()
+
+    @property
+    def downloaded(self) -> int:
+        """Total bytes downloaded, including any resumed prefix"""
+        return self.initial_size + sum(list(self._counters.values()))
+
+    def sample(self, now: Optional[float] = None):
+        """Refresh the smoothed speed; call at a steady rate from one thread"""
+        now = time.time() if now is None else now
+        downloaded = self.downloaded
+        previous = self.start_time if self._sample_time is None else self._sample_time
+        elapsed = now - previous
+        if elapsed <= 0:
+            return
+
+        rate = (downloaded - self._sample_bytes) / elapsed
+        if self._sample_time is None:
+            self.ewma_speed = rate
+        else:
+            self.ewma_speed = SPEED_EWMA_ALPHA * rate + (1 - SPEED_EWMA_ALPHA) * self.ewma_speed
+        self._sample_time = now
+        self._sample_bytes = downloaded
+
+    @property
+    def speed(self) -> float:
+        """Download speed in bytes per second (smoothed once sampled)"""
+        if self._sample_time is not None:
+            return self.ewma_speed
+        elapsed = self.last_update - self.start_time
+        return (self.downloaded - self.initial_size) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def progress_percent(self) -> float:
+        """Download progress as a percentage"""
+        if self.total_size <= 0:
+            return 0.0
+        return min(100.0, self.downloaded / self.total_size * 100)
+
+    @property
+    def speed_mbps(self) -> float:
+        """Download speed in MB/s"""
+        return self.speed / (1024 * 1024)
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """Estimated seconds remaining, or None if unknown"""
+        speed = self.speed
+        if self.total_size <= 0 or speed <= 0:
+            return None
+        return max(0.0, (self.total_size - self.downloaded) / speed)
+
+    def format_eta(self) -> str:
+        """Format the estimated time remaining for display"""
+        eta = self.eta_seconds
+        if eta is None:
+            return "--:--"
+        minutes, seconds = divmod(int(eta), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+    @staticmethod
+    def format_size(size: float) -> str:
+        """Format a byte count for display"""
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if size < 1024 or unit == 'GB':
+                return f"{size:.1f} {unit}"
+            size /= 1024
+        return f"{size:.1f} GB"
+
+class StreamingHasher:
+    """Compute a SHA256 checksum while a file is being written
+
+    Bytes written at the current hash position are hashed straight from
+    memory. Bytes written out of order (other segments or mirrors) are read
+    back from the file once the contiguous prefix before them is complete,
+    so only data that could not be hashed inline is ever read again.
+    """
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.position = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Start over, e.g. when a download restarts because the file changed"""
+        with self._lock:
+            self.sha256 = hashlib.sha256()
+            self.position = 0
+
+    def update(self, offset: int, data: bytes) -> bool:
+        """Hash data written at offset if it continues the hashed prefix"""
+        with self._lock:
+            if offset != self.position:
+                return False
+            self._consume(data)
+            return True
+
+    def advance(self, filepath: str, end: int):
+        """Hash bytes already on disk up to (not including) end"""
+        with self._lock:
+            if end <= self.position:
+                return
+            with open(filepath, 'rb') as f:
+                f.seek(self.position)
+                while self.position < end:
+                    chunk = f.read(min(HASH_READ_SIZE, end - self.position))
+                    if not chunk:
+                        break
+                    self._consume(chunk)
+
+    def _consume(self, data: bytes):
+        """Hash the next bytes of the file, in order; called with the lock held"""
+        self.sha256.update(data)
+        self.position += len(data)
+
+    def follow(self, filepath: str, completed_prefix: Callable[[], int], stop: threading.Event):
+        """Keep hashing the completed prefix of a file until stop is set"""
+        while not stop.wait(HASH_FOLLOW_INTERVAL):
+            try:
+                self.advance(filepath, completed_prefix())
+            except IOError as e:
+                logger.debug(f"Hash follower could not read {filepath}: {e}")
+                return
+
+    def hexdigest(self) -> str:
+        with self._lock:
+            return self.sha256.copy().hexdigest().lower()
+
+    def verify(self, filepath: str, expected_checksum: str) -> bool:
+        """Finish hashing the completed file and compare with the expected checksum"""
+        try:
+            size = os.path.getsize(filepath)
+            if self.position > size:
+                logger.warning(f"Hashed {self.position} bytes but file has {size}, rehashing")
+                return verify_checksum(filepath, expected_checksum)
+
+            if self.position < size:
+                logger.info(f"Hashing remaining {size - self.position} bytes of {filepath}")
+            self.advance(filepath, size)
+
+            calculated_checksum = self.hexdigest()
+            expected_checksum = expected_checksum.lower()
+
+            logger.info(f"Expected checksum: {expected_checksum}")
+            logger.info(f"Calculated checksum: {calculated_checksum}")
+
+            return calculated_checksum == expected_checksum
+
+        except Exception as e:
+            logger.error(f"Error calculating checksum: {e}")
+            return False
+
+class Transport(abc.ABC):
+    """How the engine makes requests
+
+    Anything with requests-style ``get(url, stream=, timeout=, headers=)``
+    and ``head(url, allow_redirects=, timeout=)`` methods can drive a
+    download, so any requests session (the shared HTTPClient included)
+    works as is. Responses need
+    ``status_code``, ``ok``, case-insensitive ``headers``,
+    ``raise_for_status()``, ``close()`` and a ``raw`` body for body_stream.
+    """
+
+    @abc.abstractmethod
+    def get(self, url: str, stream: bool = True, timeout: Optional[float] = REQUEST_TIMEOUT,
+            headers: Optional[Dict[str, str]] = None, allow_redirects: bool = True):
+        ...
+
+    @abc.abstractmethod
+    def head(self, url: str, allow_redirects: bool = True, timeout: Optional[float] = REQUEST_TIMEOUT,
+             headers: Optional[Dict[str, str]] = None):
+        ...
+
+    def close(self):
+        pass
+
+class Urllib3Transport(Transport):
+    """Requests made straight on a urllib3 pool
+
+    Skips the per-request work of a requests session (hooks, cookies,
+    adapter lookup), which shows in benchmarks and with many small ranges.
+    urllib3 errors are raised as their requests equivalents so callers
+    handle every transport alike.
+    """
+
+    def __init__(self, pool_size: int = MAX_SEGMENTS):
+        self.pool = urllib3.PoolManager(maxsize=pool_size)
+
+    def _request(self, method: str, url: str, headers: Optional[Dict[str, str]], timeout: Optional[float],
+                 allow_redirects: bool, preload: bool) -> TransportResponse:
+        retries = urllib3.Retry(total=None, connect=0, read=0, status=0, other=0,
+                                redirect=MAX_REDIRECTS) if allow_redirects else False
+        try:
+            raw = self.pool.request(method, url, headers=headers, preload_content=preload,
+                                    timeout=urllib3.Timeout(connect=timeout, read=timeout), retries=retries)
+        except urllib3.exceptions.TimeoutError as e:
+            raise requests.exceptions.Timeout(e) from e
+        except urllib3.exceptions.HTTPError as e:
+            raise requests.exceptions.ConnectionError(e) from e
+
+        def release():
+            # A connection with unread body bytes cannot be reused
+            fp = getattr(raw, '_fp', None)
+            if fp is not None and not fp.isclosed():
+                raw.close()
+            raw.release_conn()
+
+        return TransportResponse(url, raw.status, dict(raw.headers), raw, release)
+
+    def get(self, url: str, stream: bool = True, timeout: Optional[float] = REQUEST_TIMEOUT,
+            headers: Optional[Dict[str, str]] = None, allow_redirects: bool = True) -> TransportResponse:
+        return self._request('GET', url, headers, timeout, allow_redirects, preload=not stream)
+
+    def head(self, url: str, allow_redirects: bool = True, timeout: Optional[float] = REQUEST_TIMEOUT,
+             headers: Optional[Dict[str, str]] = None) -> TransportResponse:
+        return self._request('HEAD', url, headers, timeout, allow_redirects, preload=True)
+
+    def close(self):
+        self.pool.clear()
+
+class FileBody:
+    """The readinto-capable body of a local file response"""
+
+    def __init__(self, f, length: int):
+        self.f = f
+        self.remaining = length
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer)[:self.remaining]
+        count = self.f.readinto(view) if len(view) else 0
+        self.remaining -= count
+        return count
+
+    def close(self):
+        self.f.close()
+
+class FileTransport(Transport):
+    """Serve ``file://`` URLs from the local file system with HTTP semantics
+
+    Local mirrors (a NAS mount, a USB drive) and benchmarks go through the
+    same engine as remote servers: byte ranges, If-Range and validators
+    behave as they would over HTTP.
+    """
+
+    @staticmethod
+    def _stat(url: str) -> Tuple[str, Optional[os.stat_result]]:
+        path = url2pathname(urlparse(url).path)
+        try:
+            return path, os.stat(path)
+        except OSError:
+            return path, None
+
+    @staticmethod
+    def _headers(stat: os.stat_result) -> Dict[str, str]:
+        return {
+            'Content-Length': str(stat.st_size),
+            'Accept-Ranges': 'bytes',
+            'ETag': f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True)
+        }
+
+    def get(self, url: str, stream: bool = True, timeout: Optional[float] = None,
+            headers: Optional[Dict[str, str]] = None, allow_redirects: bool = True) -> TransportResponse:
+        path, stat = self._stat(url)
+        if stat is None:
+            return TransportResponse(url, 404, {})
+
+        request_headers = CaseInsensitiveDict(headers or {})
+        response_headers = self._headers(stat)
+        size = stat.st_size
+        start, end, status = 0, size - 1, 200
+        match = RANGE_PATTERN.match(request_headers.get('range', '').strip())
+        if_range = request_headers.get('if-range')
+        # A stale If-Range gets the whole file, as from an HTTP server
+        if match and if_range in (None, response_headers['ETag'], response_headers['Last-Modified']):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start > end:
+                return TransportResponse(url, 416, {'Content-Range': f'bytes */{size}'})
+            status = 206
+            response_headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response_headers['Content-Length'] = str(end - start + 1)
+
+        f = open(path, 'rb', buffering=0)
+        f.seek(start)
+        body = FileBody(f, end - start + 1)
+        return TransportResponse(url, status, response_headers, body, body.close)
+
+    def head(self, url: str, allow_redirects: bool = True, timeout: Optional[float] = None,
+             headers: Optional[Dict[str, str]] = None) -> TransportResponse:
+        _, stat = self._stat(url)
+        if stat is None:
+            return TransportResponse(url, 404, {})
+        return TransportResponse(url, 200, self._headers(stat))
+
+def transport_for(url: str, transport: Any = None) -> Any:
+    """Pick how to request a URL: local files directly, others with the given transport or the shared client"""
+    if urlparse(url).scheme == 'file':
+        return FileTransport()
+    return transport or get_client()
+
+def request_timeout(transport: Any) -> float:
+    """Get the timeout configured on a transport, or REQUEST_TIMEOUT"""
+    return getattr(transport, 'timeout', None) or REQUEST_TIMEOUT
+
+def probe_download(url: str, session: Any = None) -> Dict[str, Any]:
+    """Find the file size, its validators and whether the server honours byte ranges"""
+    http = transport_for(url, session)
+    info = {'size': 0, 'accepts_ranges': False, 'etag': None, 'last_modified': None}
+
+    try:
+        response = http.head(url, allow_redirects=True, timeout=request_timeout(http))
+        if response.ok:
+            info['size'] = int(response.headers.get('content-length', 0))
+            info['etag'], info['last_modified'] = response_validators(response.headers)
+            if response.headers.get('accept-ranges', '').lower() == 'bytes' and info['size'] > 0:
+                info['accepts_ranges'] = True
+                return info
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.debug(f"HEAD probe failed for {url}: {e}")
+
+    # Some servers do not advertise Accept-Ranges, so ask for a single byte
+    try:
+        response = http.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=request_timeout(http))
+        try:
+            if response.ok and not (info['etag'] or info['last_modified']):
+                info['etag'], info['last_modified'] = response_validators(response.headers)
+            if response.status_code == 206:
+                match = CONTENT_RANGE_PATTERN.match(response.headers.get('content-range', ''))
+                if match and match.group(3) != '*':
+                    info['size'] = int(match.group(3))
+                    info['accepts_ranges'] = True
+                # Reading the single byte lets the connection be reused
+                body_stream(response).readinto(bytearray(1))
+            elif response.ok and not info['size']:
+                info['size'] = int(response.headers.get('content-length', 0))
+        finally:
+            response.close()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.debug(f"Range probe failed for {url}: {e}")
+
+    return info
+
+def split_ranges(total_size: int, segments: int) -> List[Tuple[int, int]]:
+    """Split a file into contiguous inclusive byte ranges"""
+    segments = max(1, min(segments, MAX_SEGMENTS, total_size // MIN_SEGMENT_SIZE or 1))
+    segment_size = total_size // segments
+
+    ranges = []
+    start = 0
+    for index in range(segments):
+        end = total_size - 1 if index == segments - 1 else start + segment_size - 1
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+def split_missing(missing: List[Tuple[int, int]], segments: int) -> List[Tuple[int, int]]:
+    """Split the missing inclusive ranges of a file across about ``segments`` connections"""
+    total = sum(end - start + 1 for start, end in missing)
+    ranges = []
+    for start, end in missing:
+        size = end - start + 1
+        share = max(1, round(segments * size / total)) if total else 1
+        ranges.extend((start + first, start + last) for first, last in split_ranges(size, share))
+    return ranges
+
+class RetryPolicy:
+    """When to drop a slow connection, and how often and how long to wait before retrying
+
+    Delays grow exponentially with full jitter (a random delay up to the
+    exponential bound), so connections that failed together do not retry
+    in lockstep; a server's Retry-After is honoured up to ``max_delay``.
+    The budget is shared by every connection of a job, so a download that
+    keeps failing gives up instead of retrying each segment forever.
+    """
+
+    def __init__(self, budget: int = RETRY_BUDGET, base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY, low_speed_limit: float = LOW_SPEED_LIMIT,
+                 low_speed_time: float = LOW_SPEED_TIME):
+        self.budget = budget
+        self.remaining = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.low_speed_limit = low_speed_limit  # 0 disables the stall watchdog
+        self.low_speed_time = low_speed_time
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Spend one retry of the budget, returning False if none is left"""
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """Get the seconds to wait before retry number attempt (counting from 0)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after', '') if response is not None else ''
+        if retry_after.strip().isdigit():
+            delay = max(delay, min(float(retry_after), self.max_delay))
+        return delay
+
+class TransferError(IOError):
+    """A response body ended early or broke off; the rest can be requested again"""
+
+class TransferStalled(TransferError):
+    """Raised by copy_stream when the stall watchdog dropped a connection that was too slow"""
+
+class InsufficientSpaceError(IOError):
+    """The file system holding a download cannot fit the whole file"""
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether a request may succeed when retried, unlike e.g. a 404 or a full disk"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError, TransferError,
+                              ConnectionError, TimeoutError))
+
+class JobControl:
+    """Pause and cancel signals, retry policy and events shared by the threads of a download
+
+    Paused workers block on a condition instead of polling, and pausing or
+    cancelling wakes them straight away. A child control (e.g. one attempt
+    of a job) can be cancelled on its own, is cancelled with its parent and
+    always pauses with it; it shares its parent's retry budget and events.
+    """
+
+    def __init__(self, parent: Optional['JobControl'] = None, retry_policy: Optional[RetryPolicy] = None):
+        self.parent = parent
+        self._condition = parent._condition if parent else threading.Condition()
+        self._paused = False
+        self._cancelled = False
+        self._retry_policy = retry_policy
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        if self.parent:
+            return self.parent.retry_policy
+        if self._retry_policy is None:
+            self._retry_policy = RetryPolicy()
+        return self._retry_policy
+
+    @retry_policy.setter
+    def retry_policy(self, policy: RetryPolicy):
+        self._retry_policy = policy
+
+    def pause(self):
+        if self.parent:
+            return self.parent.pause()
+        with self._condition:
+            self._paused = True
+            self._condition.notify_all()
+
+    def resume(self):
+        if self.parent:
+            return self.parent.resume()
+        with self._condition:
+            self._paused = False
+            self._condition.notify_all()
+
+    def cancel(self):
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+
+    def is_paused(self) -> bool:
+        return self.parent.is_paused() if self.parent else self._paused
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled or (self.parent is not None and self.parent.is_cancelled())
+
+    def wait_if_paused(self, timeout: Optional[float] = None) -> bool:
+        """Block while paused, returning False once cancelled"""
+        with self._condition:
+            self._condition.wait_for(lambda: not self.is_paused() or self.is_cancelled(), timeout)
+        return not self.is_cancelled()
+
+    def sleep(self, seconds: float) -> bool:
+        """Wait for seconds, returning False early once cancelled"""
+        with self._condition:
+            self._condition.wait_for(self.is_cancelled, seconds)
+        return not self.is_cancelled()
+
+    def emit(self, event: str, **fields: Any):
+        """Report a transfer event such as a stall, retry or failover"""
+        if self.parent:
+            self.parent.emit(event, **fields)
+
+    def should_retry(self, error: Exception, attempt: int, url: str) -> bool:
+        """Wait out the backoff before retrying a failed transfer
+
+        Returns False straight away if the error is not worth retrying or
+        the retry budget is spent, and after the wait if the job was
+        cancelled meanwhile.
+        """
+        if self.is_cancelled() or not is_retryable(error):
+            return False
+        policy = self.retry_policy
+        if not policy.take():
+            logger.error(f"Retry budget of {policy.budget} spent, giving up on {url}: {error}")
+            self.emit('retries_exhausted', url=url, error=str(error))
+            return False
+        delay = policy.delay(attempt, error)
+        logger.warning(f"Transfer from {url} failed ({error}), retry {attempt + 1} in {delay:.1f}s")
+        self.emit('retry', url=url, attempt=attempt + 1, delay=round(delay, 2), error=str(error))
+        return self.sleep(delay)
+
+class TransferPaused(Exception):
+    """Raised by copy_stream when its job is paused, after writing what was read
+
+    The caller closes the response, so a paused download holds no
+    connection, and requests the rest once the job resumes.
+    """
+
+class ByteRange:
+    """An inclusive byte range being transferred
+
+    ``fetched`` is the next offset to read from the network and ``pos`` the
+    next offset not yet written to disk. ``end`` is None for a body of
+    unknown length, and may shrink while another worker takes over the tail.
+    """
+
+    def __init__(self, start: int, end: Optional[int] = None, lock: Optional[threading.Lock] = None):
+        self.start = start
+        self.end = end
+        self.pos = start
+        self.fetched = start
+        self.owner: Any = None
+        self.lock = lock or threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        """Bytes not yet written"""
+        return max(0, self.end - self.pos + 1)
+
+    @property
+    def unfetched(self) -> int:
+        """Bytes not yet read from the network"""
+        return max(0, self.end - self.fetched + 1)
+
+    def wanted(self) -> int:
+        """How many more bytes the range needs, or -1 if unbounded"""
+        with self.lock:
+            return -1 if self.end is None else self.unfetched
+
+    def accept(self, count: int) -> int:
+        """Claim bytes just read, returning how many still belong to the range"""
+        with self.lock:
+            if self.end is not None:
+                count = min(count, self.unfetched)
+            self.fetched += count
+            return count
+
+    def advance(self, count: int):
+        """Record bytes written to disk"""
+        with self.lock:
+            self.pos += count
+
+class BufferedFileWriter:
+    """Write filled buffers to a file on a dedicated thread
+
+    Buffers come from a fixed-size pool and are recycled once written, so a
+    transfer never holds more than ``depth`` buffers and the reader blocks
+    while the disk catches up.
+    """
+
+    def __init__(self, f, on_written: Optional[Callable[[int, memoryview], None]] = None,
+                 depth: int = WRITE_QUEUE_DEPTH):
+        self.f = f
+        self.on_written = on_written
+        self.error: Optional[Exception] = None
+        self._depth = depth
+        self._allocated = 0
+        self._free: "queue.Queue[bytearray]" = queue.Queue()
+        self._filled: "queue.Queue[Optional[Tuple[bytearray, int, int]]]" = queue.Queue(maxsize=depth)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def acquire(self, size: int) -> bytearray:
+        """Get a free buffer of at least size bytes, waiting for one if needed"""
+        if self.error:
+            raise self.error
+        try:
+            buffer = self._free.get_nowait()
+        except queue.Empty:
+            if self._allocated < self._depth:
+                self._allocated += 1
+                return bytearray(size)
+            buffer = self._free.get()
+        # The read size has grown since this buffer was allocated
+        return buffer if len(buffer) >= size else bytearray(size)
+
+    def release(self, buffer: bytearray):
+        """Return an unused buffer to the pool"""
+        self._free.put(buffer)
+
+    def submit(self, buffer: bytearray, offset: int, length: int):
+        """Queue the first length bytes of a buffer for writing at offset"""
+        self._filled.put((buffer, offset, length))
+
+    def close(self):
+        """Write everything queued and stop, raising any write error"""
+        self._filled.put(None)
+        self._thread.join()
+        if self.error:
+            raise self.error
+
+    def _run(self):
+        while True:
+            job = self._filled.get()
+            if job is None:
+                return
+            buffer, offset, length = job
+            if self.error is None:
+                try:
+                    view = memoryview(buffer)[:length]
+                    write_at(self.f, view, offset)
+                    if self.on_written:
+                        self.on_written(offset, view)
+                except Exception as e:
+                    self.error = e
+            self._free.put(buffer)
+
+def write_at(f, data: memoryview, offset: int):
+    """Write all of data at offset in an unbuffered file
+
+    Positional writes leave the file position alone, so writers never
+    depend on each other's progress. Without ``os.pwrite`` (Windows) the
+    file object is sought instead, which is safe as every writer opens its
+    own.
+    """
+    written = 0
+    if hasattr(os, 'pwrite'):
+        fd = f.fileno()
+        while written < len(data):
+            written += os.pwrite(fd, data[written:], offset + written)
+        return
+    f.seek(offset)
+    while written < len(data):
+        written += f.write(data[written:])
+
+def preallocate(path: str, size: int):
+    """Give a file its final size before the first byte is written
+
+    Space is reserved with ``posix_fallocate`` where the file system supports
+    it, so a full disk is reported now rather than gigabytes in; elsewhere
+    the file is extended sparsely once free space has been checked. Bytes
+    already in the file are kept. Raises InsufficientSpaceError if the file
+    cannot fit.
+    """
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        stat = os.fstat(f.fileno())
+        allocated = getattr(stat, 'st_blocks', 0) * 512
+        free = free_space(path)
+        if free is not None and size - allocated > free:
+            raise InsufficientSpaceError(
+                f"Not enough disk space for {os.path.basename(path)}: it needs "
+                f"{DownloadProgress.format_size(size - allocated)} more, "
+                f"{DownloadProgress.format_size(free)} free")
+        reserved = False
+        if size > stat.st_size and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                reserved = True
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise InsufficientSpaceError(f"Not enough disk space for {os.path.basename(path)}") from e
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS):
+                    raise
+                logger.debug(f"Cannot reserve space for {path}, extending it sparsely: {e}")
+        if not reserved or stat.st_size > size:
+            f.truncate(size)
+
+def body_stream(response: Any):
+    """Get a readinto-capable stream for a response body
+
+    Bodies without a content encoding are read from the underlying
+    http.client response, which fills the caller's buffer straight from the
+    socket. Encoded bodies go through urllib3 so they are decoded.
+    Transports that already give a plain reader have it used directly.
+    """
+    raw = response.raw
+    encoding = response.headers.get('content-encoding', 'identity').strip().lower()
+    if encoding in ('', 'identity'):
+        fp = getattr(raw, '_fp', None)
+        if fp is not None and hasattr(fp, 'readinto'):
+            return fp
+        if not hasattr(raw, 'decode_content'):
+            return raw  # Already a plain reader, e.g. a local file
+    raw.decode_content = True
+    return raw
+
+def next_read_size(read_size: int, count: int, elapsed: float) -> int:
+    """Adapt the read size so one read takes about READ_TARGET_TIME"""
+    if count < read_size:
+        return read_size
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    if rate * READ_TARGET_TIME > read_size * 2:
+        return min(read_size * 2, MAX_READ_SIZE)
+    if rate * READ_TARGET_TIME < read_size / 2:
+        return max(read_size // 2, MIN_READ_SIZE)
+    return read_size
+
+def interrupt_response(response: Any):
+    """Unblock a read of a response body in progress on another thread
+
+    Closing a response does not wake a thread blocked on its socket, so the
+    socket is shut down for reading where the transport allows it.
+    """
+    try:
+        shutdown = getattr(getattr(response, 'raw', None), 'shutdown', None)
+        if shutdown:
+            shutdown()
+        else:
+            response.close()
+    except Exception as e:
+        logger.debug(f"Could not interrupt response: {e}")
+
+class StallWatchdog:
+    """Drop a connection whose speed stays below a limit for too long
+
+    A trickling connection never times out, as a few bytes keep arriving,
+    so the watchdog samples the bytes read once a second and interrupts the
+    response from its own thread once the speed over the last ``period``
+    seconds is below ``limit``. The transfer is then retried from where it
+    stopped. Time the transfer spends held back by the rate limiter is
+    ``excused`` and not counted against it.
+    """
+
+    def __init__(self, response: Any, byte_range: 'ByteRange', limit: float, period: float):
+        self.response = response
+        self.byte_range = byte_range
+        self.limit = limit
+        self.period = period
+        self.stalled = False
+        self.speed = 0.0
+        self.excused = 0.0
+        self._stop = threading.Event()
+        if limit > 0 and period > 0:
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        samples = deque([(time.monotonic(), self.byte_range.fetched, self.excused)])
+        while not self._stop.wait(WATCHDOG_INTERVAL):
+            now, fetched, excused = time.monotonic(), self.byte_range.fetched, self.excused
+            samples.append((now, fetched, excused))
+            while len(samples) > 1 and samples[1][0] <= now - self.period:
+                samples.popleft()
+            since, base, excused_base = samples[0]
+            if now - since < self.period:
+                continue
+            active = now - since - (excused - excused_base)
+            if active < self.period / 2:
+                continue  # Mostly held back by the rate limiter
+            self.speed = (fetched - base) / active
+            if self.speed < self.limit:
+                self.stalled = True
+                interrupt_response(self.response)
+                return
+
+    def stop(self):
+        self._stop.set()
+
+    def error(self) -> 'TransferStalled':
+        return TransferStalled(f"Connection stalled at {self.speed / 1024:.1f} KB/s for {self.period:.0f}s")
+
+def copy_stream(response: Any, f, byte_range: ByteRange, control: JobControl,
+                on_written: Optional[Callable[[int, memoryview], None]] = None) -> bool:
+    """Stream a response body into its place in a file
+
+    The body is read into pooled buffers with ``readinto`` and written by a
+    BufferedFileWriter, so reads and writes overlap without a bytes object
+    per chunk. The read size grows with the measured throughput. Bytes past
+    ``byte_range.end`` are dropped; ``on_written`` runs on the writer thread
+    after each write with a view that is only valid during the call.
+    Returns False if cancelled, and raises TransferPaused once everything
+    read so far is written if the job is paused. A connection slower than
+    the job's low-speed limit raises TransferStalled. Bytes read count
+    against the shared rate limiter.
+    """
+    stream = body_stream(response)
+    limiter = get_limiter()
+
+    def written(offset: int, view: memoryview):
+        byte_range.advance(len(view))
+        if on_written:
+            on_written(offset, view)
+
+    policy = control.retry_policy
+    watchdog = StallWatchdog(response, byte_range, policy.low_speed_limit, policy.low_speed_time)
+    writer = BufferedFileWriter(f, written)
+    read_size = MIN_READ_SIZE
+    try:
+        while True:
+            if control.is_cancelled():
+                return False
+            if control.is_paused():
+                raise TransferPaused()
+
+            wanted = byte_range.wanted()
+            if wanted == 0:
+                return True
+            size = limiter.read_size(read_size if wanted < 0 else min(read_size, wanted))
+
+            buffer = writer.acquire(read_size)
+            offset = byte_range.fetched
+            started = time.monotonic()
+            try:
+                count = stream.readinto(memoryview(buffer)[:size])
+            except Exception as e:
+                writer.release(buffer)
+                if watchdog.stalled:
+                    raise watchdog.error() from e
+                if isinstance(e, (http.client.HTTPException, urllib3.exceptions.HTTPError)):
+                    raise TransferError(f"Incomplete response: {e!r}") from e
+                raise
+            elapsed = time.monotonic() - started
+
+            count = byte_range.accept(count) if count else 0
+            if not count:
+                # Cancelling closes the response, which also ends the body
+                writer.release(buffer)
+                if watchdog.stalled:
+                    raise watchdog.error()
+                return not control.is_cancelled()
+            writer.submit(buffer, offset, count)
+            read_size = next_read_size(read_size, count, elapsed)
+            watchdog.excused += limiter.consume(count, control)
+    except TransferStalled:
+        logger.warning(f"Dropping stalled connection to {getattr(response, 'url', '')} "
+                       f"at offset {byte_range.fetched}")
+        control.emit('stalled', url=getattr(response, 'url', ''), offset=byte_range.fetched,
+                     speed=round(watchdog.speed))
+        raise
+    finally:
+        watchdog.stop()
+        writer.close()
+
+def skip_stream(response: Any, count: int, control: JobControl) -> bool:
+    """Read and drop the first count bytes of a response body"""
+    stream = body_stream(response)
+    limiter = get_limiter()
+    buffer = memoryview(bytearray(min(count, MAX_READ_SIZE)))
+    while count > 0:
+        if control.is_cancelled():
+            return False
+        try:
+            read = stream.readinto(buffer[:min(count, len(buffer))])
+        except (http.client.HTTPException, urllib3.exceptions.HTTPError) as e:
+            raise TransferError(f"Incomplete response: {e!r}") from e
+        if not read:
+            return False
+        count -= read
+        limiter.consume(read, control)
+    return True
+
+def download_segment(url: str, filepath: str, byte_range: ByteRange,
+                     progress: DownloadProgress,
+                     control: JobControl,
+                     session: Any = None,
+                     hasher: Optional[StreamingHasher] = None,
+                     slot: int = 0,
+                     if_range: Optional[str] = None) -> bool:
+    """Download a byte range into its offset in a preallocated file
+
+    With ``if_range`` the server sends the whole (changed) file instead of
+    the range if the validator no longer matches, which fails the segment.
+    While the job is paused the connection is closed; the rest of the range
+    is requested again on resume. Dropped or stalled connections are
+    retried from where they stopped, as the job's retry policy allows.
+    """
+    http = transport_for(url, session)
+    start, end = byte_range.start, byte_range.end
+
+    def written(offset: int, data: memoryview):
+        if hasher:
+            hasher.update(offset, data)
+        progress.update(len(data), slot)
+
+    failures = 0
+    while True:
+        if not control.wait_if_paused():
+            return False
+        headers = {'Range': f'bytes={byte_range.pos}-{byte_range.end}'}
+        if if_range:
+            headers['If-Range'] = if_range
+
+        try:
+            response = http.get(url, stream=True, timeout=request_timeout(http), headers=headers)
+            try:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    logger.error(f"Server sent the whole file for range {start}-{end}; "
+                                 f"it ignores ranges or the file has changed")
+                    return False
+
+                # Unbuffered so the hash follower can read back completed bytes
+                with open(filepath, 'r+b', buffering=0) as f:
+                    if not copy_stream(response, f, byte_range, control, written):
+                        return False
+            finally:
+                close_response(response)
+            if byte_range.remaining:
+                raise TransferError(f"Connection closed with {byte_range.remaining} bytes of "
+                                    f"segment {start}-{end} left")
+            return True
+        except TransferPaused:
+            pass
+        except (requests.exceptions.RequestException, IOError) as e:
+            if not control.should_retry(e, failures, url):
+                if control.is_cancelled():
+                    return False
+                raise
+            failures += 1
+
+def download_segmented(url: str, filepath: str, total_size: int,
+                       segments: int = DEFAULT_SEGMENTS,
+                       control: Optional[JobControl] = None,
+                       progress: Optional[DownloadProgress] = None,
+                       session: Any = None,
+                       hasher: Optional[StreamingHasher] = None,
+                       state: Optional[PartState] = None) -> bool:
+    """Download a file over several concurrent range requests
+
+    The file is written to ``filepath + ".part"`` (preallocated to its final
+    size) and renamed into place once every segment has completed. Given a
+    resume state, only its missing ranges are fetched; on failure the
+    completed ranges are saved next to the ``.part`` file for a later
+    resume. If a hasher is given it is fed while the segments arrive; a
+    given progress object is reset and updated so callers can poll it.
+    """
+    part_path = filepath + ".part"
+    state = state or PartState(url, total_size)
+    ranges = [ByteRange(start, end) for start, end in split_missing(state.missing(), segments)]
+    progress = progress or DownloadProgress()
+    progress.reset(total_size, state.completed_bytes)
+    # Cancelled on its own when a segment fails, so the others stop too
+    attempt = JobControl(control)
+    if_range = state.if_range(url)
+
+    def completed_prefix() -> int:
+        for byte_range in ranges:
+            if byte_range.remaining:
+                return byte_range.pos
+        return total_size
+
+    def written_ranges() -> List[Tuple[int, int]]:
+        return [(byte_range.start, byte_range.pos) for byte_range in ranges]
+
+    logger.info(f"Segmented download of {url} using {len(ranges)} connections"
+                + (f", resuming {state.completed_bytes} bytes" if state.ranges else ""))
+
+    # The sidecar comes first: a full-size .part file without one would look complete
+    state.save(part_path)
+    preallocate(part_path, total_size)
+
+    def run_segment(index: int) -> bool:
+        byte_range = ranges[index]
+        try:
+            ok = download_segment(url, part_path, byte_range, progress, attempt, session, hasher,
+                                  index, if_range)
+        except (requests.exceptions.RequestException, IOError) as e:
+            logger.error(f"Segment {byte_range.start}-{byte_range.end} failed: {e}")
+            ok = False
+        if not ok:
+            attempt.cancel()
+        return ok
+
+    stop = threading.Event()
+    checkpoint = threading.Thread(target=state.checkpoint, args=(part_path, written_ranges, stop), daemon=True)
+    checkpoint.start()
+    if hasher:
+        follower = threading.Thread(target=hasher.follow, args=(part_path, completed_prefix, stop),
+                                    daemon=True)
+        follower.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(segments, len(ranges)))) as executor:
+            results = list(executor.map(run_segment, range(len(ranges))))
+    finally:
+        stop.set()
+        checkpoint.join()
+        if hasher:
+            follower.join()
+        for start, end in written_ranges():
+            state.add_range(start, end)
+
+    if not all(results):
+        # Keep what was downloaded so the next attempt only fetches the rest
+        state.save(part_path)
+        logger.info(f"Kept {state.completed_bytes} of {total_size} bytes in {part_path} for resume")
+        return False
+
+    finish_part(filepath)
+    return True
+
+def free_space(path: str) -> Optional[int]:
+    """Get the free bytes on the file system holding path (or its nearest existing parent)"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    try:
+        return shutil.disk_usage(path).free
+    except OSError as e:
+        logger.debug(f"Could not get free space of {path}: {e}")
+        return None
+
+def finish_part(filepath: str):
+    """Move a completed ``.part`` file into place and drop its resume state"""
+    part_path = filepath + ".part"
+    if os.path.exists(state_path(part_path)):
+        os.remove(state_path(part_path))
+    # Replaces an older file in one step, so it never goes missing in between
+    os.replace(part_path, filepath)
+
+def calculate_sha256(filepath: str) -> str:
+    """Calculate the SHA256 checksum of a file
+
+    Files are memory-mapped where possible, so they are hashed straight from
+    the page cache (hashlib releases the GIL meanwhile); others are read in
+    large blocks.
+    """
+    sha256_hash = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and some special or network files cannot be mapped
+            for chunk in iter(lambda: f.read(HASH_READ_SIZE), b""):
+                sha256_hash.update(chunk)
+        else:
+            with mapped:
+                if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                sha256_hash.update(mapped)
+    return sha256_hash.hexdigest().lower()
+
+def verify_checksum(filepath: str, expected_checksum: str) -> bool:
+    """Verify a file against its expected SHA256 checksum"""
+    try:
+        calculated_checksum = calculate_sha256(filepath)
+        expected_checksum = expected_checksum.lower()
+
+        logger.info(f"Expected checksum: {expected_checksum}")
+        logger.info(f"Calculated checksum: {calculated_checksum}")
+
+        return calculated_checksum == expected_checksum
+
+    except Exception as e:
+        logger.error(f"Error calculating checksum: {e}")
+        return False
+
+class DownloadJob(JobControl):
+    """Download one file, driven the same way by the GUI, the CLI and benchmarks
+
+    ``start()`` runs the job on a background thread (``run()`` does the same
+    in the caller's thread); ``pause()``, ``resume()`` and ``cancel()`` may
+    be called from any thread. A paused job releases its connections and
+    picks up where it stopped. Progress is kept in ``progress`` and, given
+    ``on_progress``, reported every PROGRESS_POLL_INTERVAL while running.
+    The transport is used for every request (see ``transport_for``).
+    Prefetched ``metadata`` of the primary URL saves the initial probe.
+    Stalls, retries and failovers to other mirrors are passed to
+    ``on_event`` as an event name and its fields. Given the URL of a
+    ``metalink``, its mirrors and piece hashes are used as well, so a file
+    failing its checksum only has its corrupt pieces fetched again. Given
+    a ``manifests`` store (see utils/manifests.py), piece hashes are
+    recorded for files that verify and used for those that do not. A
+    ``ranker`` (see utils/mirror_ranking.py) puts the fastest mirrors first.
+    ``preferred`` mirrors, e.g. a LAN mirror server (see
+    utils/mirror_server.py), are tried alone before any of the others.
+    A ``journal`` (see utils/journal.py) records the bytes and time each
+    mirror delivered and, without a ranker, orders mirrors by that history.
+    """
+
+    def __init__(self, url: str, filepath: str, mirrors: Optional[List[str]] = None,
+                 checksum: Optional[str] = None, connections: int = 1, transport: Any = None,
+                 on_progress: Optional[Callable[['DownloadJob'], None]] = None,
+                 metadata: Optional[Dict[str, Any]] = None, retry_policy: Optional[RetryPolicy] = None,
+                 on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 metalink: Optional[str] = None, pieces: Any = None, manifests: Any = None,
+                 ranker: Any = None, preferred: Optional[List[str]] = None):
+        super().__init__(retry_policy=retry_policy)
+        self.url = url
+        self.mirrors = mirrors or [url]
+        self.filepath = filepath
+        self.checksum = checksum
+        self.connections = max(1, connections)
+        self.transport = transport
+        self.on_progress = on_progress
+        self.on_event = on_event
+        self.metadata = metadata  # A recent probe_download() result for url, e.g. from a prefetch
+        self.metalink = metalink
+        self.pieces = pieces  # A utils.pieces.PieceManifest of the file, if known
+        self.manifests = manifests  # A utils.manifests.ManifestStore to record and look up pieces in
+        self.ranker = ranker  # A utils.mirror_ranking.MirrorRanker ordering the mirrors before downloading
+        self.preferred = preferred or []  # Tried one by one before the mirrors, which are only used if all fail
+        self.journal = None  # A utils.journal.DownloadJournal keeping mirror statistics
+        self.progress = DownloadProgress()
+        self.error = ''
+        self.out_of_space = False
+        self.result: Optional[bool] = None
+        self.response = None  # Open response of a single-stream download, closed on cancel
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def paused(self) -> bool:
+        return self.is_paused()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.is_cancelled()
+
+    def cancel(self):
+        super().cancel()
+        response = self.response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def emit(self, event: str, **fields: Any):
+        if self.on_event:
+            try:
+                self.on_event(event, fields)
+            except Exception as e:
+                logger.warning(f"Event callback failed: {e}")
+
+    def start(self) -> 'DownloadJob':
+        """Run the job on a background thread"""
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[bool]:
+        """Wait for a started job, returning its result (None while running)"""
+        if self._thread:
+            self._thread.join(timeout)
+        return self.result
+
+    def run(self) -> bool:
+        """Download and, given a checksum, verify the file"""
+        stop = threading.Event()
+        if self.on_progress:
+            reporter = threading.Thread(target=self._report, args=(stop,), daemon=True)
+            reporter.start()
+
+        ok = False
+        try:
+            hasher = self.prepare() if self.checksum or self.metalink else None
+            # An existing copy with known piece hashes only has its bad pieces fetched
+            ok = self.salvage()
+            if not ok:
+                ok = self.download(hasher)
+                if ok and self.checksum and not self.verify(hasher):
+                    self.error = "Checksum verification failed"
+                    logger.error(f"{self.error}: {self.filepath}")
+                    ok = False
+        finally:
+            self.result = ok
+            stop.set()
+            if self.on_progress:
+                reporter.join()
+                self.on_progress(self)
+        return ok
+
+    def prepare(self) -> StreamingHasher:
+        """Load the Metalink, if any, and create the hasher for the download
+
+        With piece hashes the hasher also checks each piece as it is hashed;
+        without them, given a manifest store, it records them instead.
+        """
+        # Imported here because utils.pieces builds on this module
+        from utils.pieces import PieceHasher, PieceRecorder
+
+        if self.metalink and self.pieces is None:
+            self.load_metalink()
+        if self.pieces is None and self.manifests and self.checksum:
+            self.pieces = self.manifests.load(self.checksum)
+        if self.pieces:
+            return PieceHasher(self.pieces)
+        if self.manifests and self.checksum:
+            return PieceRecorder(self.manifests.piece_length)
+        return StreamingHasher()
+
+    def load_metalink(self):
+        """Add the mirrors and piece hashes of the job's Metalink"""
+        from utils.metalink import MAX_METALINK_MIRRORS, fetch_metalink
+
+        entry = fetch_metalink(self.metalink, os.path.basename(self.filepath), self.transport)
+        if entry is None:
+            return
+        if self.checksum and entry.sha256 and entry.sha256 != self.checksum.lower():
+            logger.warning(f"Metalink {self.metalink} describes another file (SHA-256 {entry.sha256}), ignoring it")
+            return
+        added = [url for url in entry.urls if url not in self.mirrors][:MAX_METALINK_MIRRORS]
+        self.mirrors = self.mirrors + added
+        self.checksum = self.checksum or entry.sha256
+        self.pieces = entry.pieces
+        logger.info(f"Metalink {self.metalink}: {len(added)} more mirrors, "
+                    f"{len(entry.pieces) if entry.pieces else 'no'} piece hashes")
+
+    def verify(self, hasher: Optional[StreamingHasher] = None) -> bool:
+        """Check the file against its checksum, fetching corrupt pieces again where piece hashes are known"""
+        if hasher:
+            ok = hasher.verify(self.filepath, self.checksum)
+        else:
+            ok = verify_checksum(self.filepath, self.checksum)
+        if ok:
+            self.record_manifest(hasher)
+        if ok or self.pieces is None or self.cancelled:
+            return ok
+        return self.repair(hasher)
+
+    def record_manifest(self, hasher: Optional[StreamingHasher]):
+        """Keep the piece hashes recorded while the verified file was hashed"""
+        from utils.pieces import PieceRecorder
+
+        if not self.manifests or not isinstance(hasher, PieceRecorder) or self.manifests.contains(self.checksum):
+            return
+        # A recorder that did not see the whole file (e.g. after a rehash) has no complete manifest
+        if hasher.position == os.path.getsize(self.filepath):
+            self.manifests.save(self.checksum, hasher.manifest())
+
+    def salvage(self) -> bool:
+        """Repair an existing copy of the file in place instead of downloading it again
+
+        Needs piece hashes and an existing file of their size. Returns True
+        once the file matches the checksum.
+        """
+        from utils.pieces import PieceHasher
+
+        if not self.pieces or not self.pieces.size or not self.checksum:
+            return False
+        try:
+            if os.path.getsize(self.filepath) != self.pieces.size:
+                return False
+            logger.info(f"Checking existing {self.filepath} piece by piece")
+            hasher = PieceHasher(self.pieces)
+            hasher.advance(self.filepath, self.pieces.size)
+        except OSError:
+            return False
+        if hasher.hexdigest() == self.checksum.lower():
+            return True
+        return self.repair(hasher)
+
+    def repair(self, hasher: Optional[StreamingHasher] = None) -> bool:
+        """Re-fetch the pieces that do not match their hashes and check the whole file again"""
+        from utils.pieces import PieceHasher, find_bad_pieces, repair_pieces
+
+        # A piece hasher that saw the whole file already knows the bad pieces
+        if isinstance(hasher, PieceHasher) and hasher.manifest is self.pieces and \
+                hasher.position == os.path.getsize(self.filepath):
+            bad_pieces = hasher.finish()
+        else:
+            bad_pieces = find_bad_pieces(self.filepath, self.pieces)
+        if not bad_pieces:
+            logger.error(f"Every piece of {self.filepath} matches, but the file does not; "
+                         f"the piece hashes describe another file")
+            return False
+
+        size = sum(self.pieces.piece_size(index) for index in bad_pieces)
+        logger.warning(f"{len(bad_pieces)} corrupt pieces ({DownloadProgress.format_size(size)}) "
+                       f"in {self.filepath}, fetching them again")
+        self.emit('repair', pieces=len(bad_pieces), bytes=size)
+        if not repair_pieces(self.filepath, self.pieces, bad_pieces, self.mirrors, self, self.transport,
+                             self.progress):
+            return False
+        return verify_checksum(self.filepath, self.checksum)
+
+    def _report(self, stop: threading.Event):
+        while not stop.wait(PROGRESS_POLL_INTERVAL):
+            self.progress.sample()
+            try:
+                self.on_progress(self)
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {e}")
+
+    def load_part_state(self) -> Optional[PartState]:
+        """Get the resume state of the ``.part`` file, if it can be resumed"""
+        part_path = self.filepath + ".part"
+        if not os.path.exists(part_path):
+            return None
+
+        state = PartState.load(part_path)
+        if state is None:
+            # A partial without a sidecar (older versions): resume its prefix as-is
+            return PartState(self.url, ranges=[(0, os.path.getsize(part_path))])
+        if state.url not in self.mirrors and state.url not in self.preferred:
+            logger.warning(f"Partial download of {os.path.basename(self.filepath)} came from {state.url}, "
+                           f"which is no longer listed, starting over")
+            remove_partial(self.filepath)
+            return None
+        return state
+
+    def download(self, hasher: Optional[StreamingHasher] = None) -> bool:
+        """Download the file, picking the fastest available strategy
+
+        Downloads are spread across all mirrors when several are known,
+        otherwise split into segments when the server honours byte ranges,
+        and fall back to a single stream. Each strategy resumes the ranges
+        recorded next to an existing ``.part`` file, so a failed attempt is
+        never thrown away. When a URL still fails after its retries, the
+        next mirror takes over. Preferred mirrors come first, each over one
+        connection: a LAN mirror needs no more, and a single stream follows
+        a file the mirror is still fetching. Progress is recorded in
+        ``progress``.
+        """
+        # Imported here because utils.mirrors builds on this module
+        from utils.mirrors import MultiMirrorDownloader
+
+        for url in self.preferred:
+            ok = self.download_from(url, hasher, connections=1)
+            self.record_transfer(url, ok)
+            if ok:
+                self.error = ''
+                return True
+            if self.cancelled or self.out_of_space:
+                return False
+            logger.warning(f"Preferred mirror {url} failed, using the edition's mirrors")
+            self.emit('failover', url=self.mirrors[0], previous=url, error=self.error)
+
+        ranker = self.ranker or self.journal
+        if ranker and len(self.mirrors) > 1:
+            self.rank_mirrors(ranker)
+        try:
+            state = self.load_part_state()
+            # Partials without a known size can only be resumed sequentially
+            if len(self.mirrors) > 1 and (state is None or state.size > 0):
+                downloader = MultiMirrorDownloader(self.mirrors[:MAX_ACTIVE_MIRRORS], self.filepath, control=self,
+                                                   progress=self.progress, session=self.transport,
+                                                   hasher=hasher, state=state)
+                ok = downloader.run()
+                for mirror in downloader.stats.values():
+                    if mirror.bytes_downloaded or mirror.failures:
+                        self.record_transfer(mirror.url, not mirror.failures, mirror.bytes_downloaded,
+                                             mirror.bytes_downloaded / mirror.throughput if mirror.throughput else 0.0)
+                if ok:
+                    return True
+                if self.cancelled:
+                    return False
+                logger.warning("Multi-mirror download failed, falling back to one mirror at a time")
+        except (requests.exceptions.RequestException, IOError) as e:
+            return self.failed(e)
+
+        for index, url in enumerate(self.mirrors):
+            if index:
+                logger.warning(f"Failing over from {self.mirrors[index - 1]} to {url}")
+                self.emit('failover', url=url, previous=self.mirrors[index - 1], error=self.error)
+            ok = self.download_from(url, hasher)
+            self.record_transfer(url, ok)
+            if ok:
+                self.error = ''
+                return True
+            # Another mirror would not make the file fit
+            if self.cancelled or self.out_of_space:
+                return False
+        return False
+
+    def rank_mirrors(self, ranker: Any):
+        """Put the fastest mirrors from here first"""
+        ranked = ranker.rank(self.mirrors)
+        if ranked == self.mirrors:
+            return
+        logger.info(f"Mirrors of {os.path.basename(self.filepath)} by speed: {', '.join(ranked)}")
+        self.mirrors = ranked
+        self.emit('mirrors_ranked', best=ranked[0], mirrors=ranked)
+
+    def record_transfer(self, url: str, ok: bool, bytes_count: Optional[int] = None,
+                        seconds: Optional[float] = None):
+        """Add a transfer to the journal's statistics of a mirror (by default the last one tracked in progress)"""
+        if self.journal is None or self.cancelled:
+            return
+        if bytes_count is None:
+            bytes_count = self.progress.downloaded - self.progress.initial_size
+            seconds = time.time() - self.progress.start_time
+        try:
+            self.journal.record_mirror(url, bytes_count, seconds, ok)
+        except Exception as e:
+            logger.warning(f"Could not record mirror statistics of {url}: {e}")
+
+    def failed(self, error: Exception) -> bool:
+        """Record why the download failed"""
+        if isinstance(error, InsufficientSpaceError):
+            self.out_of_space = True
+            self.error = str(error)
+            logger.error(self.error)
+            self.emit('no_space', path=self.filepath, error=self.error)
+        elif isinstance(error, requests.exceptions.RequestException):
+            if not self.cancelled:
+                self.error = f"Network error: {error}"
+                logger.error(f"Network error during download: {error}")
+        else:
+            self.error = f"File system error: {error}"
+            logger.error(f"File system error during download: {error}")
+        return False
+
+    def download_from(self, url: str, hasher: Optional[StreamingHasher] = None,
+                      connections: Optional[int] = None) -> bool:
+        """Download the file from one URL, in segments if its server honours byte ranges"""
+        filepath = self.filepath
+        connections = connections or self.connections
+        try:
+            state = self.load_part_state()
+            if connections > 1 and (state is None or state.size > 0):
+                server_info = (self.metadata if url == self.url else None) or probe_download(url, self.transport)
+                if state and not state.same_file(url, server_info['size'], server_info['etag'],
+                                                 server_info['last_modified']):
+                    logger.warning("The file changed upstream since the partial download, starting over")
+                    remove_partial(filepath)
+                    state = None
+                if server_info['accepts_ranges'] and server_info['size'] >= 2 * MIN_SEGMENT_SIZE:
+                    if state is None:
+                        if hasher:
+                            hasher.reset()
+                        state = PartState(url, server_info['size'], server_info['etag'],
+                                          server_info['last_modified'])
+                    return download_segmented(url, filepath, server_info['size'], segments=connections,
+                                              control=self, progress=self.progress, session=self.transport,
+                                              hasher=hasher, state=state)
+                logger.info("Server does not support byte ranges, using a single connection")
+
+            failures = 0
+            while True:
+                try:
+                    return self.download_single_stream(hasher, state, url)
+                except (requests.exceptions.RequestException, IOError) as e:
+                    if not self.should_retry(e, failures, url):
+                        raise
+                    failures += 1
+                    # Picks up the prefix saved when the connection dropped
+                    state = self.load_part_state()
+
+        except (requests.exceptions.RequestException, IOError) as e:
+            return self.failed(e)
+
+    def download_single_stream(self, hasher: Optional[StreamingHasher] = None,
+                               state: Optional[PartState] = None, url: Optional[str] = None) -> bool:
+        """Download over one connection, resuming the completed prefix of a ``.part`` file
+
+        The resume request carries ``If-Range``, so a changed file comes
+        back whole (200) and replaces the partial. A 200 for an unchanged
+        file (a server ignoring ranges) skips the bytes already on disk
+        instead of appending them again. A connection that breaks off raises
+        TransferError once what it delivered is saved for the next attempt.
+        """
+        url = url or self.url
+        filepath = self.filepath
+        part_path = filepath + ".part"
+
+        resume_pos = state.contiguous_prefix if state else 0
+        if state and state.size and resume_pos >= state.size:
+            logger.info(f"Partial download already complete: {part_path}")
+            return self.finish_single_stream(state, resume_pos)
+
+        headers = {}
+        if resume_pos > 0:
+            logger.info(f"Resuming download from position: {resume_pos}")
+            headers['Range'] = f'bytes={resume_pos}-'
+            if state.if_range(url):
+                headers['If-Range'] = state.if_range(url)
+
+        http = transport_for(url, self.transport)
+        self.response = http.get(url, stream=True, timeout=request_timeout(http), headers=headers)
+        self.response.raise_for_status()
+        etag, last_modified = response_validators(self.response.headers)
+        length = int(self.response.headers.get('content-length', 0))
+
+        skip = 0
+        if resume_pos > 0 and self.response.status_code == 206:
+            match = CONTENT_RANGE_PATTERN.match(self.response.headers.get('content-range', ''))
+            if not match or int(match.group(1)) != resume_pos:
+                self.error = "Server returned an unexpected byte range"
+                logger.error(f"{self.error}: {self.response.headers.get('content-range')}")
+                self.response.close()
+                return False
+            total_size = int(match.group(3)) if match.group(3) != '*' else resume_pos + length
+            if not state.same_file(url, total_size, etag, last_modified):
+                # Servers without If-Range support resume the new file at the old offset
+                logger.warning("The file changed upstream since the partial download, starting over")
+                self.response.close()
+                remove_partial(filepath)
+                return self.download_single_stream(hasher, url=url)
+        elif resume_pos > 0:
+            total_size = length
+            if state.same_file(url, total_size, etag, last_modified):
+                logger.warning("Server ignored the range request, skipping the bytes already downloaded")
+                skip = resume_pos
+            else:
+                logger.warning("The file changed upstream since the partial download, starting over")
+                resume_pos = 0
+        else:
+            total_size = length
+
+        if resume_pos == 0:
+            state = PartState(url, total_size, etag, last_modified)
+            if hasher:
+                hasher.reset()
+        elif not state.size:
+            # Learn the size of a partial saved without a sidecar
+            state.size = total_size
+        state.save(part_path)
+        if total_size:
+            preallocate(part_path, total_size)
+
+        progress = self.progress
+        progress.reset(total_size, resume_pos)
+
+        # Hash the already downloaded prefix once; new bytes are hashed as they arrive
+        if hasher and resume_pos > 0:
+            hasher.advance(part_path, resume_pos)
+
+        def written(offset: int, data: memoryview):
+            if hasher:
+                hasher.update(offset, data)
+            progress.update(len(data))
+
+        byte_range = ByteRange(resume_pos)
+        stop = threading.Event()
+        checkpoint = threading.Thread(target=state.checkpoint,
+                                      args=(part_path, lambda: [(byte_range.start, byte_range.pos)], stop),
+                                      daemon=True)
+        checkpoint.start()
+        paused = False
+        try:
+            with open(part_path, 'r+b' if total_size or resume_pos > 0 else 'wb', buffering=0) as f:
+                if not total_size:
+                    # Drop anything after the prefix, e.g. segments of an earlier attempt
+                    f.truncate(resume_pos)
+                if skip and not skip_stream(self.response, skip, self):
+                    return False
+                if not copy_stream(self.response, f, byte_range, self, written):
+                    return False
+        except TransferPaused:
+            paused = True
+        finally:
+            close_response(self.response)
+            stop.set()
+            checkpoint.join()
+            state.ranges = []
+            state.add_range(0, byte_range.pos)
+            state.save(part_path)
+
+        if paused:
+            # Nothing is held open while paused; the rest is requested on resume
+            if not self.wait_if_paused():
+                return False
+            return self.download_single_stream(hasher, state, url)
+        if state.size and byte_range.pos < state.size:
+            raise TransferError(f"Connection closed after {byte_range.pos} of {state.size} bytes")
+        return self.finish_single_stream(state, byte_range.pos)
+
+    def finish_single_stream(self, state: PartState, size: int) -> bool:
+        """Move a complete single-stream download into place"""
+        if state.size and size != state.size:
+            self.error = f"Incomplete download: {size} of {state.size} bytes"
+            logger.error(self.error)
+            return False
+        finish_part(self.filepath)
+        return True
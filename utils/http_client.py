@@ -0,0 +1,254 @@
+"""
+Shared HTTP client for Linux Distro Downloader
+
+Every request the application makes (downloads, probes, version checks)
+goes through one client, so connections to the same host are kept alive
+and reused instead of paying a TCP and TLS handshake each time. Pool sizes
+and timeouts are configurable, HTTP/2 is used where httpx (with h2) is
+installed and asked for, and per-host statistics show how often
+connections were reused and how quickly the first byte arrived.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_HOSTS = 16  # Hosts with a pool of kept-alive connections
+DEFAULT_POOL_SIZE = 16  # Kept-alive connections per host; enough for MAX_SEGMENTS
+DEFAULT_TIMEOUT = 30
+
+class ConnectionStats:
+    """Requests, new connections and time to first byte per host"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hosts: Dict[str, Dict[str, float]] = {}
+
+    def _host(self, host: str) -> Dict[str, float]:
+        return self.hosts.setdefault(host, {'requests': 0, 'connections': 0, 'ttfb_total': 0.0,
+                                            'ttfb_first': 0.0, 'ttfb_last': 0.0})
+
+    def record_connection(self, host: str):
+        with self._lock:
+            self._host(host)['connections'] += 1
+
+    def record_response(self, host: str, seconds: float):
+        """Record a response whose headers took seconds to arrive"""
+        with self._lock:
+            entry = self._host(host)
+            entry['requests'] += 1
+            entry['ttfb_total'] += seconds
+            entry['ttfb_last'] = seconds
+            if entry['requests'] == 1:
+                entry['ttfb_first'] = seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Summarise the statistics of every host"""
+        with self._lock:
+            hosts = {host: dict(entry) for host, entry in self.hosts.items()}
+        summary = {}
+        for host, entry in hosts.items():
+            requests_made = int(entry['requests'])
+            summary[host] = {
+                'requests': requests_made,
+                'connections': int(entry['connections']),
+                'reused': max(0, requests_made - int(entry['connections'])),
+                'ttfb_first_ms': round(entry['ttfb_first'] * 1000, 1),
+                'ttfb_last_ms': round(entry['ttfb_last'] * 1000, 1),
+                'ttfb_avg_ms': round(entry['ttfb_total'] / requests_made * 1000, 1) if requests_made else None
+            }
+        return summary
+
+def counting_pool(base: type, stats: ConnectionStats) -> type:
+    """Make a urllib3 pool class that counts the connections it opens"""
+    # Counted on connect, as pools reconnect dropped connection objects in place
+    class CountingConnection(base.ConnectionCls):
+        def connect(self):
+            stats.record_connection(self.host)
+            return super().connect()
+
+    class CountingPool(base):
+        ConnectionCls = CountingConnection
+    return CountingPool
+
+class CountingAdapter(HTTPAdapter):
+    """Transport adapter recording connection reuse and time to first byte"""
+
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        self.stats = stats  # Needed by init_poolmanager, which HTTPAdapter.__init__ calls
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': counting_pool(HTTPConnectionPool, self.stats),
+            'https': counting_pool(HTTPSConnectionPool, self.stats)
+        }
+
+    def send(self, request, **kwargs):
+        # Streamed sends return once the headers are parsed, i.e. at the first byte
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        self.stats.record_response(urlparse(request.url).hostname or '', time.monotonic() - started)
+        return response
+
+class HTTPClient(requests.Session):
+    """A requests session with per-host keep-alive pools, default timeouts and reuse statistics"""
+
+    def __init__(self, pool_hosts: int = DEFAULT_POOL_HOSTS, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+        self.stats = ConnectionStats()
+        adapter = CountingAdapter(self.stats, pool_connections=pool_hosts, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method: str, url: str, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+class TransportResponse:
+    """A response of the non-requests transports, shaped like a streamed requests response"""
+
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str], raw: Any = None,
+                 release: Optional[Callable[[], None]] = None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.raw = raw
+        self._release = release
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def close(self):
+        release, self._release = self._release, None
+        if release:
+            release()
+
+class IteratorBody:
+    """A readinto-capable body over an iterator of byte chunks"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.pending = memoryview(b'')
+
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.pending = memoryview(chunk)
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        return count
+
+class HTTP2Client:
+    """Client speaking HTTP/2 where servers offer it, using the optional httpx package
+
+    One HTTP/2 connection carries all segments of a download to a host as
+    concurrent streams. Requires ``httpx`` with HTTP/2 support
+    (``pip install 'httpx[http2]'``); see ``create_client`` for the fallback.
+    """
+
+    def __init__(self, pool_hosts: int = DEFAULT_POOL_HOSTS, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_TIMEOUT):
+        import httpx
+        self._httpx = httpx
+        self.timeout = timeout
+        self.stats = ConnectionStats()
+        self.client = httpx.Client(http2=True, timeout=timeout,
+                                   limits=httpx.Limits(max_connections=pool_hosts * pool_size,
+                                                       max_keepalive_connections=pool_hosts * pool_size))
+
+    def _send(self, method: str, url: str, headers: Optional[Dict[str, str]], timeout: Optional[float],
+              allow_redirects: bool) -> TransportResponse:
+        httpx = self._httpx
+        request = self.client.build_request(method, url, headers=headers,
+                                            timeout=self.timeout if timeout is None else timeout)
+        started = time.monotonic()
+        try:
+            response = self.client.send(request, stream=True, follow_redirects=allow_redirects)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(e) from e
+        self.stats.record_response(urlparse(url).hostname or '', time.monotonic() - started)
+        # httpx has already decoded any content encoding
+        headers = {name: value for name, value in response.headers.items() if name.lower() != 'content-encoding'}
+        return TransportResponse(url, response.status_code, headers, IteratorBody(response.iter_bytes()),
+                                 response.close)
+
+    def get(self, url: str, stream: bool = True, timeout: Optional[float] = None,
+            headers: Optional[Dict[str, str]] = None, allow_redirects: bool = True) -> TransportResponse:
+        return self._send('GET', url, headers, timeout, allow_redirects)
+
+    def head(self, url: str, allow_redirects: bool = True, timeout: Optional[float] = None,
+             headers: Optional[Dict[str, str]] = None) -> TransportResponse:
+        response = self._send('HEAD', url, headers, timeout, allow_redirects)
+        response.close()
+        return response
+
+    def close(self):
+        self.client.close()
+
+def create_client(pool_hosts: int = DEFAULT_POOL_HOSTS, pool_size: int = DEFAULT_POOL_SIZE,
+                  timeout: float = DEFAULT_TIMEOUT, http2: bool = False) -> Any:
+    """Create a client, using HTTP/2 if asked for and available"""
+    if http2:
+        try:
+            return HTTP2Client(pool_hosts, pool_size, timeout)
+        except ImportError as e:
+            logger.warning(f"HTTP/2 needs httpx with h2 installed ({e}); using HTTP/1.1")
+    return HTTPClient(pool_hosts, pool_size, timeout)
+
+_client: Any = None
+_client_lock = threading.Lock()
+
+def get_client() -> Any:
+    """Get the application-wide client, creating a default one on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+        return _client
+
+def configure(pool_hosts: int = DEFAULT_POOL_HOSTS, pool_size: int = DEFAULT_POOL_SIZE,
+              timeout: float = DEFAULT_TIMEOUT, http2: bool = False) -> Any:
+    """Replace the application-wide client with one using these settings"""
+    global _client
+    client = create_client(pool_hosts, pool_size, timeout, http2)
+    with _client_lock:
+        previous, _client = _client, client
+    if previous is not None:
+        previous.close()
+    return client
+
+def close_response(response: Any):
+    """Close a response, keeping its connection alive if the body was read to the end
+
+    The download loop reads bodies straight from http.client, so urllib3
+    never learns they are complete and requests would drop the connection
+    on close. Connections with unread bytes are closed as usual.
+    """
+    raw = getattr(response, 'raw', None)
+    fp = getattr(raw, '_fp', None)
+    if isinstance(response, requests.Response) and fp is not None and fp.isclosed():
+        raw.release_conn()
+    response.close()
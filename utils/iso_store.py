@@ -0,0 +1,248 @@
+"""
+Content-addressed ISO store for Linux Distro Downloader
+
+Verified ISOs are kept under their SHA-256 so an edition that was already
+downloaded (to any directory) can be provided again without network I/O,
+by reflink, hardlink or copy. A hash cache keyed by (device, inode, size,
+mtime) avoids re-hashing files that have already been verified, and the
+least recently used objects are evicted once the store exceeds its size
+limit.
+"""
+
+import errno
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from utils.atomic import temp_path_for, write_json
+from utils.downloader import calculate_sha256
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'linux-distro-downloader' / 'store'
+DEFAULT_MAX_STORE_SIZE = 64 * 1024 ** 3
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+MAX_HASH_ENTRIES = 1000
+FICLONE = 0x40049409  # Linux ioctl sharing extents between files (btrfs, XFS)
+
+def reflink(source: str, target: str) -> bool:
+    """Clone a file copy-on-write, returning False where unsupported"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    try:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError as e:
+        if os.path.exists(target):
+            os.remove(target)
+        if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EBADF):
+            logger.debug(f"Reflink of {source} failed: {e}")
+        return False
+
+def clone_file(source: str, target: str, allow_copy: bool = True) -> Optional[str]:
+    """Place a file at target as a reflink, hardlink or copy
+
+    Returns the method used, or None if only a copy was possible and copies
+    are not allowed. The target is replaced atomically.
+    """
+    temp_path = temp_path_for(target)
+
+    method = None
+    if reflink(source, temp_path):
+        method = 'reflink'
+    else:
+        try:
+            os.link(source, temp_path)
+            method = 'hardlink'
+        except OSError:
+            if allow_copy:
+                shutil.copyfile(source, temp_path)
+                method = 'copy'
+
+    try:
+        if method:
+            os.replace(temp_path, target)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return method
+
+def file_key(stat: os.stat_result) -> str:
+    return f"{stat.st_dev}:{stat.st_ino}"
+
+class ISOStore:
+    """Keep verified ISOs by checksum and provide them again on demand"""
+
+    def __init__(self, root: Optional[str] = None, max_size: int = DEFAULT_MAX_STORE_SIZE):
+        self.root = Path(root) if root else DEFAULT_STORE_DIR
+        self.max_size = max_size
+        self._lock = threading.RLock()
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self.hashes: Dict[str, Dict[str, Any]] = {}
+        self.load_index()
+
+    def object_path(self, checksum: str) -> Path:
+        checksum = checksum.lower()
+        return self.root / 'objects' / checksum[:2] / checksum
+
+    def load_index(self):
+        """Read the object and hash index"""
+        path = self.root / INDEX_FILE
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                self.objects = data.get('objects', {})
+                self.hashes = data.get('hashes', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable ISO store index {path}: {e}")
+
+    def save_index(self):
+        """Write the index atomically"""
+        with self._lock:
+            # Forget the oldest hashes once the cache grows too large
+            if len(self.hashes) > MAX_HASH_ENTRIES:
+                newest = sorted(self.hashes.items(), key=lambda entry: entry[1].get('checked', 0))
+                self.hashes = dict(newest[-MAX_HASH_ENTRIES:])
+            data = {'version': INDEX_VERSION, 'objects': self.objects, 'hashes': self.hashes}
+
+            self.root.mkdir(parents=True, exist_ok=True)
+            write_json(self.root / INDEX_FILE, data)
+
+    def cached_hash(self, filepath: str) -> Optional[str]:
+        """Get the recorded SHA-256 of a file if it has not changed since"""
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self.hashes.get(file_key(stat))
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+        return None
+
+    def record_hash(self, filepath: str, checksum: str):
+        """Remember the SHA-256 of a file by its identity and modification time"""
+        stat = os.stat(filepath)
+        with self._lock:
+            self.hashes[file_key(stat)] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': checksum.lower(),
+                'checked': time.time()
+            }
+
+    def file_matches(self, filepath: str, checksum: str) -> bool:
+        """Check a file against a checksum, hashing it only if not cached"""
+        digest = self.cached_hash(filepath)
+        if digest is None:
+            digest = calculate_sha256(filepath)
+            self.record_hash(filepath, digest)
+            self.save_index()
+        return digest == checksum.lower()
+
+    def contains(self, checksum: str) -> bool:
+        return self.object_path(checksum).exists()
+
+    def touch(self, checksum: str):
+        """Count an object as just used, so it is evicted last (saved with the next change of the index)"""
+        with self._lock:
+            entry = self.objects.get(checksum.lower())
+            if entry is not None:
+                entry['last_used'] = time.time()
+
+    def provision(self, filepath: str, checksum: str) -> Optional[str]:
+        """Make a verified copy of an ISO available at filepath without downloading
+
+        Returns 'existing' if filepath already holds the ISO, the clone
+        method if it came from the store, or None if a download is needed.
+        """
+        checksum = checksum.lower()
+        if os.path.exists(filepath):
+            if self.file_matches(filepath, checksum):
+                self.add(filepath, checksum)
+                return 'existing'
+            logger.info(f"Existing file does not match the expected checksum: {filepath}")
+
+        source = self.object_path(checksum)
+        if not source.exists():
+            return None
+        if not self.file_matches(str(source), checksum):
+            logger.warning(f"Removing corrupt store object {source}")
+            self.remove(checksum)
+            return None
+
+        started = time.monotonic()
+        method = clone_file(str(source), filepath)
+        self.record_hash(filepath, checksum)
+        with self._lock:
+            self.objects.setdefault(checksum, {'size': source.stat().st_size})['last_used'] = time.time()
+        self.save_index()
+        logger.info(f"Provided {filepath} from the ISO store by {method} in {time.monotonic() - started:.3f}s")
+        return method
+
+    def add(self, filepath: str, checksum: str) -> Optional[str]:
+        """Keep a verified ISO in the store
+
+        Only reflinks and hardlinks are used, so adding never costs a full
+        copy of the file. Returns the method used, or None.
+        """
+        checksum = checksum.lower()
+        target = self.object_path(checksum)
+        method = 'existing'
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                method = clone_file(filepath, str(target), allow_copy=False)
+            except OSError as e:
+                logger.warning(f"Could not add {filepath} to the ISO store: {e}")
+                return None
+            if method is None:
+                logger.info(f"Not adding {filepath} to the ISO store: it is on another file system")
+                return None
+            self.record_hash(str(target), checksum)
+
+        self.record_hash(filepath, checksum)
+        with self._lock:
+            self.objects[checksum] = {'size': target.stat().st_size, 'last_used': time.time()}
+        self.evict(keep=checksum)
+        self.save_index()
+        return method
+
+    def remove(self, checksum: str):
+        """Delete an object from the store"""
+        checksum = checksum.lower()
+        path = self.object_path(checksum)
+        if path.exists():
+            path.unlink()
+        with self._lock:
+            self.objects.pop(checksum, None)
+
+    @property
+    def total_size(self) -> int:
+        with self._lock:
+            return sum(entry.get('size', 0) for entry in self.objects.values())
+
+    def evict(self, keep: Optional[str] = None):
+        """Remove least recently used objects until the store fits its size limit"""
+        with self._lock:
+            by_age = sorted(self.objects.items(), key=lambda entry: entry[1].get('last_used', 0))
+            for checksum, _ in by_age:
+                if self.total_size <= self.max_size:
+                    break
+                if checksum == keep:
+                    continue
+                logger.info(f"Evicting {checksum} from the ISO store")
+                self.remove(checksum)
@@ -0,0 +1,232 @@
+"""
+Download journal for Linux Distro Downloader
+
+A SQLite database (in WAL mode) recording every queued download: where it
+goes, what it was fetched from, its progress and completed ranges, and how
+it ended, together with the bytes, time and failures seen per mirror. After
+a crash or restart it tells what was in flight, so unfinished jobs can be
+queued again, and which mirrors were fast before.
+
+Progress is snapshotted by a background thread and commits are batched
+every COMMIT_INTERVAL, so the transfer loop itself never touches the
+database. Jobs being added or finishing are committed at once.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from utils.iso_store import DEFAULT_STORE_DIR
+from utils.part_state import PartState
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_FILE = DEFAULT_STORE_DIR.parent / 'journal.sqlite3'
+SCHEMA_VERSION = 1
+COMMIT_INTERVAL = 1.0  # Seconds between batched commits (and progress snapshots)
+UNFINISHED_STATES = ('queued', 'downloading')
+HISTORY_LIMIT = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    filepath TEXT NOT NULL,
+    distro TEXT,
+    edition TEXT,
+    download_dir TEXT,
+    info TEXT NOT NULL,
+    connections INTEGER NOT NULL DEFAULT 1,
+    state TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    downloaded INTEGER NOT NULL DEFAULT 0,
+    checksum TEXT,
+    verified INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+CREATE TABLE IF NOT EXISTS ranges (
+    job_id INTEGER NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    PRIMARY KEY (job_id, start)
+);
+CREATE TABLE IF NOT EXISTS mirrors (
+    url TEXT PRIMARY KEY,
+    host TEXT,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+"""
+
+class DownloadJournal:
+    """Jobs, ranges, mirror statistics and outcomes of downloads, kept across restarts"""
+
+    def __init__(self, path: Optional[str] = None, commit_interval: float = COMMIT_INTERVAL):
+        self.path = str(path or DEFAULT_JOURNAL_FILE)
+        self.commit_interval = commit_interval
+        if self.path != ':memory:':
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # WAL commits survive a crash of the app; only a power cut may lose the last ones
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('PRAGMA foreign_keys=ON')
+        if self._db.execute('PRAGMA user_version').fetchone()[0] not in (0, SCHEMA_VERSION):
+            raise ValueError(f"Download journal {self.path} has an unknown schema version")
+        self._db.executescript(SCHEMA)
+        self._db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self._db.commit()
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._tracked: Dict[int, Any] = {}  # job id -> running DownloadJob
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._run, daemon=True)
+        self._flusher.start()
+
+    def _execute(self, sql: str, params: Tuple = (), commit: bool = False) -> sqlite3.Cursor:
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            if commit:
+                self._db.commit()
+                self._dirty = False
+            else:
+                self._dirty = True
+            return cursor
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params).fetchall()]
+
+    def add_job(self, job: Any) -> int:
+        """Record a queued download, taking over an unfinished record of the same file"""
+        info = {'url': job.url, 'mirrors': job.mirrors, 'filename': getattr(job, 'filename', None),
+                'checksum': job.checksum, 'metalink': job.metalink}
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT id FROM jobs WHERE filepath = ? AND state IN {UNFINISHED_STATES} ORDER BY id DESC",
+                (job.filepath,)).fetchone()
+            if row:
+                self._execute("UPDATE jobs SET state = 'queued', info = ?, updated = ? WHERE id = ?",
+                              (json.dumps(info), now, row['id']), commit=True)
+                return row['id']
+            cursor = self._execute(
+                "INSERT INTO jobs (filepath, distro, edition, download_dir, info, connections, state, checksum, "
+                "created, updated) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job.filepath, getattr(job, 'distro', None), getattr(job, 'edition', None),
+                 getattr(job, 'download_dir', None), json.dumps(info), job.connections, job.checksum, now, now),
+                commit=True)
+            return cursor.lastrowid
+
+    def start_job(self, job_id: int, job: Any):
+        """Mark a job as downloading and snapshot its progress until it finishes"""
+        with self._lock:
+            self._tracked[job_id] = job
+            self._execute("UPDATE jobs SET state = 'downloading', updated = ? WHERE id = ?", (time.time(), job_id))
+
+    def finish_job(self, job_id: int, state: str, error: Optional[str] = None, verified: bool = False):
+        """Record how a job ended"""
+        now = time.time()
+        with self._lock:
+            job = self._tracked.pop(job_id, None)
+            if job is not None:
+                self._snapshot(job_id, job)
+            if state == 'completed':
+                self._execute("DELETE FROM ranges WHERE job_id = ?", (job_id,))
+            self._execute("UPDATE jobs SET state = ?, error = ?, verified = ?, updated = ?, finished = ? "
+                          "WHERE id = ?", (state, error, int(verified), now, now, job_id), commit=True)
+
+    def record_mirror(self, url: str, bytes_count: int, seconds: float, ok: bool):
+        """Add a transfer from a mirror to its statistics"""
+        self._execute(
+            "INSERT INTO mirrors (url, host, bytes, seconds, successes, failures, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (url) DO UPDATE SET bytes = bytes + excluded.bytes, "
+            "seconds = seconds + excluded.seconds, successes = successes + excluded.successes, "
+            "failures = failures + excluded.failures, updated = excluded.updated",
+            (url, urlparse(url).hostname, bytes_count, seconds, int(ok), int(not ok), time.time()))
+
+    def _snapshot(self, job_id: int, job: Any):
+        """Record the progress and completed ranges of a running job"""
+        state = PartState.load(job.filepath + '.part')
+        self._execute("UPDATE jobs SET size = ?, downloaded = ?, updated = ? WHERE id = ?",
+                      (job.progress.total_size, job.progress.downloaded, time.time(), job_id))
+        if state is not None:
+            self._execute("DELETE FROM ranges WHERE job_id = ?", (job_id,))
+            self._db.executemany("INSERT INTO ranges (job_id, start, end) VALUES (?, ?, ?)",
+                                 [(job_id, start, end) for start, end in state.ranges])
+
+    def flush(self):
+        """Snapshot running jobs and commit everything recorded since the last commit"""
+        with self._lock:
+            for job_id, job in list(self._tracked.items()):
+                self._snapshot(job_id, job)
+            if self._dirty:
+                self._db.commit()
+                self._dirty = False
+
+    def _run(self):
+        while not self._stop.wait(self.commit_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not update the download journal {self.path}: {e}")
+
+    def close(self):
+        """Commit outstanding records and close the database"""
+        self._stop.set()
+        self._flusher.join()
+        with self._lock:
+            self.flush()
+            self._db.close()
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Get jobs that were queued or downloading when the app last stopped, oldest first"""
+        jobs = self._query(f"SELECT * FROM jobs WHERE state IN {UNFINISHED_STATES} ORDER BY id")
+        return [self._decode(job) for job in jobs if job['id'] not in self._tracked]
+
+    def history(self, limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
+        """Get the most recent jobs, newest first"""
+        return [self._decode(job) for job in self._query("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))]
+
+    def ranges(self, job_id: int) -> List[Tuple[int, int]]:
+        return [(row['start'], row['end'])
+                for row in self._query("SELECT start, end FROM ranges WHERE job_id = ? ORDER BY start", (job_id,))]
+
+    @staticmethod
+    def _decode(job: Dict[str, Any]) -> Dict[str, Any]:
+        job['info'] = json.loads(job['info'])
+        job['verified'] = bool(job['verified'])
+        return job
+
+    def mirror_stats(self, urls: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the recorded statistics of mirrors, with their average throughput"""
+        if not urls:
+            return {}
+        rows = self._query(f"SELECT * FROM mirrors WHERE url IN ({', '.join('?' * len(urls))})", tuple(urls))
+        for row in rows:
+            row['throughput'] = row['bytes'] / row['seconds'] if row['seconds'] > 0 else 0.0
+        return {row['url']: row for row in rows}
+
+    def rank(self, urls: List[str]) -> List[str]:
+        """Order mirrors by the throughput they delivered before
+
+        Mirrors without history keep their place after those known to be
+        fast; mirrors that only ever failed go last.
+        """
+        stats = self.mirror_stats(urls)
+        known = sorted((url for url in urls if url in stats and stats[url]['throughput'] > 0),
+                       key=lambda url: -stats[url]['throughput'])
+        failed = [url for url in urls if url in stats and not stats[url]['throughput'] and stats[url]['failures']]
+        return known + [url for url in urls if url not in known and url not in failed] + failed
@@ -0,0 +1,202 @@
+"""
+ISO library verification for Linux Distro Downloader
+
+Audits a directory of ISOs against every edition in the catalog. Files are
+hashed in a process pool so several disks (or a NAS link) are kept busy,
+and results are cached by file identity so unchanged files are not
+hashed again.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.data_manager import DistroDataManager
+from utils.downloader import calculate_sha256
+from utils.iso_store import ISOStore
+from utils.manifests import ManifestStore
+from utils.pieces import PieceManifest, create_manifest
+
+logger = logging.getLogger(__name__)
+
+OK = 'ok'
+MISMATCH = 'mismatch'
+UNKNOWN = 'unknown'
+FAILED = 'failed'  # The file could not be hashed
+
+IMAGE_EXTENSIONS = ('.iso', '.img')
+
+def hash_file(path: str, piece_length: int = 0) -> Tuple[str, str, float, Optional[Dict[str, Any]]]:
+    """Hash one file in a worker process, returning (path, sha256, seconds, pieces)
+
+    Given a piece length, the piece manifest is recorded in the same pass.
+    """
+    started = time.monotonic()
+    if piece_length:
+        digest, manifest = create_manifest(path, piece_length)
+        return path, digest, time.monotonic() - started, manifest.to_dict()
+    return path, calculate_sha256(path), time.monotonic() - started, None
+
+class LibraryReport:
+    """Outcome of verifying a directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.results: List[Dict[str, Any]] = []
+        self.bytes_hashed = 0
+        self.hash_seconds = 0.0
+        self.elapsed = 0.0
+
+    def count(self, status: str) -> int:
+        return sum(result['status'] == status for result in self.results)
+
+    @property
+    def throughput_mbps(self) -> float:
+        """Hashed megabytes per second of wall-clock time"""
+        return self.bytes_hashed / (1024 * 1024) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'directory': self.directory,
+            'ok': self.count(OK),
+            'mismatch': self.count(MISMATCH),
+            'unknown': self.count(UNKNOWN),
+            'failed': self.count(FAILED),
+            'cached': sum(result['cached'] for result in self.results),
+            'bytes_hashed': self.bytes_hashed,
+            'seconds': round(self.elapsed, 3),
+            'throughput_mbps': round(self.throughput_mbps, 2)
+        }
+
+def build_catalog(manager: DistroDataManager) -> Tuple[Dict[str, List[Tuple[str, str, str]]],
+                                                       Dict[str, Tuple[str, str]]]:
+    """Index the catalog by filename and by checksum"""
+    by_name: Dict[str, List[Tuple[str, str, str]]] = {}
+    by_checksum: Dict[str, Tuple[str, str]] = {}
+    for distro in manager.get_distributions():
+        for edition in manager.get_editions(distro):
+            info = manager.get_edition_info(distro, edition)
+            checksum = info['checksum'].lower()
+            by_name.setdefault(info['filename'], []).append((distro, edition, checksum))
+            by_checksum.setdefault(checksum, (distro, edition))
+    return by_name, by_checksum
+
+def find_candidates(directory: str, names: Dict[str, Any], recursive: bool = False) -> List[str]:
+    """List catalog filenames and disk images in a directory"""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if name in names or name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+        if not recursive:
+            break
+        dirs.sort()
+    return paths
+
+def create_pool(workers: int) -> Executor:
+    """Create a process pool, falling back to threads where processes are unavailable"""
+    try:
+        return ProcessPoolExecutor(max_workers=workers)
+    except (OSError, NotImplementedError, ImportError) as e:
+        logger.warning(f"Process pool unavailable, hashing in threads: {e}")
+        return ThreadPoolExecutor(max_workers=workers)
+
+def verify_library(directory: str, manager: DistroDataManager,
+                   store: Optional[ISOStore] = None,
+                   workers: Optional[int] = None,
+                   recursive: bool = False,
+                   on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+                   manifests: Optional[ManifestStore] = None) -> LibraryReport:
+    """Check every ISO in a directory against the catalog
+
+    Files named like an edition are compared with its checksum; other disk
+    images are identified by checksum alone. Each result is reported as
+    ``ok``, ``mismatch`` or ``unknown``, or ``failed`` if it could not be
+    hashed (e.g. its worker process died). Hashes recorded in the store's hash
+    cache are reused, and verified ISOs are added to the store. Given a
+    manifest store, piece hashes of verified ISOs that have none yet are
+    recorded while they are hashed.
+    """
+    by_name, by_checksum = build_catalog(manager)
+    report = LibraryReport(directory)
+    started = time.monotonic()
+
+    def finish(path: str, digest: str, seconds: float, cached: bool, pieces: Optional[Dict[str, Any]] = None):
+        candidates = by_name.get(os.path.basename(path), [])
+        match = next(((d, e) for d, e, checksum in candidates if checksum == digest), None)
+        match = match or by_checksum.get(digest)
+        if match:
+            status = OK
+        elif candidates:
+            status = MISMATCH
+            match = candidates[0][:2]
+        else:
+            status = UNKNOWN
+
+        size = os.path.getsize(path)
+        result = {
+            'path': path,
+            'status': status,
+            'distro': match[0] if match else None,
+            'edition': match[1] if match else None,
+            'sha256': digest,
+            'size': size,
+            'cached': cached,
+            'seconds': round(seconds, 3),
+            'mbps': round(size / (1024 * 1024) / seconds, 2) if seconds > 0 else None
+        }
+        report.results.append(result)
+        if store and status == OK:
+            store.add(path, digest)
+        if manifests and pieces and status == OK and not manifests.contains(digest):
+            manifests.save(digest, PieceManifest.from_dict(pieces))
+        if on_result:
+            on_result(result)
+
+    def fail(path: str, error: str):
+        result = {'path': path, 'status': FAILED, 'distro': None, 'edition': None, 'sha256': None,
+                  'size': os.path.getsize(path) if os.path.exists(path) else 0, 'cached': False,
+                  'seconds': 0.0, 'mbps': None, 'error': error}
+        report.results.append(result)
+        if on_result:
+            on_result(result)
+
+    to_hash = []
+    for path in find_candidates(directory, by_name, recursive):
+        digest = store.cached_hash(path) if store else None
+        if digest:
+            finish(path, digest, 0.0, True)
+        else:
+            to_hash.append(path)
+
+    if to_hash:
+        # Big files first so one large ISO does not finish last on its own
+        to_hash.sort(key=lambda path: os.path.getsize(path), reverse=True)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(to_hash)))
+        logger.info(f"Hashing {len(to_hash)} files in {directory} with {workers} workers")
+        with create_pool(workers) as pool:
+            piece_length = manifests.piece_length if manifests else 0
+            futures = {pool.submit(hash_file, path, piece_length): path for path in to_hash}
+            for future in as_completed(futures):
+                try:
+                    path, digest, seconds, pieces = future.result()
+                except (OSError, BrokenProcessPool) as e:
+                    # A worker killed mid-file breaks the pool; the files it still had fail too
+                    logger.error(f"Could not hash {futures[future]}: {e}")
+                    fail(futures[future], str(e) or type(e).__name__)
+                    continue
+                report.bytes_hashed += os.path.getsize(path)
+                report.hash_seconds += seconds
+                if store:
+                    store.record_hash(path, digest)
+                finish(path, digest, seconds, False, pieces)
+        if store:
+            store.save_index()
+
+    report.elapsed = time.monotonic() - started
+    report.results.sort(key=lambda result: result['path'])
+    logger.info(f"Verified {directory}: {report.to_dict()}")
+    return report
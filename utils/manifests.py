@@ -0,0 +1,71 @@
+"""
+Recorded piece manifests for Linux Distro Downloader
+
+Most editions publish only a whole-file checksum, so a single corrupt byte
+would cost a complete re-download. The first time such an ISO verifies, the
+hash of every MANIFEST_PIECE_LENGTH block is recorded alongside it (while
+the file is hashed anyway) and kept under the whole-file SHA-256. Later
+downloads and re-verifications of the same file then find and re-fetch
+only the blocks that do not match.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Optional
+
+from utils.atomic import write_json
+from utils.iso_store import DEFAULT_STORE_DIR
+from utils.pieces import PieceManifest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_DIR = DEFAULT_STORE_DIR / 'manifests'
+MANIFEST_PIECE_LENGTH = 4 * 1024 * 1024  # About 1000 hashes (64 KB of JSON) for a 4 GB ISO
+
+class ManifestStore:
+    """Piece manifests of verified files, keyed by their SHA-256"""
+
+    def __init__(self, root: Optional[str] = None, piece_length: int = MANIFEST_PIECE_LENGTH):
+        self.root = Path(root) if root else DEFAULT_MANIFEST_DIR
+        self.piece_length = piece_length
+
+    def path(self, checksum: str) -> Path:
+        checksum = checksum.lower()
+        return self.root / checksum[:2] / f'{checksum}.json'
+
+    def contains(self, checksum: str) -> bool:
+        return self.path(checksum).exists()
+
+    def load(self, checksum: str) -> Optional[PieceManifest]:
+        """Get the manifest recorded for a checksum, if any"""
+        path = self.path(checksum)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('sha256') != checksum.lower():
+                raise ValueError("manifest is for another file")
+            return PieceManifest.from_dict(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable piece manifest {path}: {e}")
+            return None
+
+    def save(self, checksum: str, manifest: PieceManifest) -> bool:
+        """Record the manifest of a verified file, replacing any earlier one atomically"""
+        path = self.path(checksum)
+        data = dict(manifest.to_dict(), sha256=checksum.lower())
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_json(path, data)
+        except OSError as e:
+            logger.warning(f"Could not save piece manifest {path}: {e}")
+            return False
+        logger.info(f"Recorded {len(manifest)} piece hashes for {checksum.lower()}")
+        return True
+
+    def remove(self, checksum: str):
+        path = self.path(checksum)
+        if path.exists():
+            path.unlink()
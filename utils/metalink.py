@@ -0,0 +1,150 @@
+"""
+Metalink support for Linux Distro Downloader
+
+Reads Metalink files (RFC 5854 ``.meta4`` and the older Metalink 3
+``.metalink``) published next to many distribution images. An edition in
+``distro_data.json`` may name one as ``"metalink"``: its mirrors are added
+to the edition's own, and its piece hashes let a download that fails its
+checksum re-fetch only the corrupt pieces (see utils/pieces.py).
+
+XML is parsed with defusedxml where installed, otherwise with the standard
+library parser, which does not resolve external entities.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from utils.downloader import body_stream, request_timeout, transport_for
+from utils.pieces import PieceManifest, hash_name
+
+logger = logging.getLogger(__name__)
+
+METALINK4_NS = 'urn:ietf:params:xml:ns:metalink'
+METALINK3_NS = 'http://www.metalinker.org/'
+MAX_METALINK_SIZE = 16 * 1024 * 1024  # Piece lists of large ISOs stay well below this
+SUPPORTED_SCHEMES = ('http', 'https', 'file')
+MAX_METALINK_MIRRORS = 8  # Mirrors added to an edition's own; each costs a probe and a connection
+
+try:
+    from defusedxml import ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+class MetalinkFile:
+    """One file described by a Metalink: its size, mirrors and hashes"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.size = 0
+        self.urls: List[str] = []  # Most preferred first
+        self.hashes: Dict[str, str] = {}  # hashlib name -> hex digest
+        self.pieces: Optional[PieceManifest] = None
+
+    @property
+    def sha256(self) -> Optional[str]:
+        return self.hashes.get('sha256')
+
+def _tag(element) -> Tuple[str, str]:
+    """Split an element tag into its namespace and local name"""
+    namespace, _, name = element.tag.rpartition('}')
+    return namespace.lstrip('{'), name
+
+def _children(element, name: str) -> List[Any]:
+    return [child for child in element if _tag(child)[1] == name]
+
+def _text(element, name: str) -> Optional[str]:
+    children = _children(element, name)
+    return children[0].text.strip() if children and children[0].text else None
+
+def _pieces(element, size: int) -> Optional[PieceManifest]:
+    """Read a <pieces> element, whose hashes are in piece order"""
+    try:
+        hashes = [child.text.strip() for child in _children(element, 'hash') if child.text]
+        return PieceManifest(int(element.get('length', 0)), hashes, element.get('type', 'sha-1'), size)
+    except ValueError as e:
+        logger.warning(f"Ignoring piece hashes of Metalink: {e}")
+        return None
+
+def _parse_file(element, version: int, base_url: str) -> MetalinkFile:
+    entry = MetalinkFile(element.get('name', ''))
+    size = _text(element, 'size')
+    entry.size = int(size) if size and size.isdigit() else 0
+
+    # Metalink 3 keeps hashes in <verification> and URLs in <resources>
+    containers = [element] + (_children(element, 'verification') if version == 3 else [])
+    for container in containers:
+        for hash_element in _children(container, 'hash'):
+            if hash_element.get('type') and hash_element.text:
+                entry.hashes[hash_name(hash_element.get('type'))] = hash_element.text.strip().lower()
+        for pieces_element in _children(container, 'pieces'):
+            entry.pieces = entry.pieces or _pieces(pieces_element, entry.size)
+
+    ranked = []
+    for container in ([element] if version == 4 else _children(element, 'resources')):
+        for url_element in _children(container, 'url'):
+            url = urljoin(base_url, (url_element.text or '').strip())
+            if urlparse(url).scheme not in SUPPORTED_SCHEMES:
+                continue
+            if version == 4:
+                rank = int(url_element.get('priority', 999999))  # 1 is the most preferred
+            else:
+                rank = -int(url_element.get('preference', 0))  # 100 is the most preferred
+            ranked.append((rank, len(ranked), url))
+    entry.urls = list(dict.fromkeys(url for _, _, url in sorted(ranked)))
+    return entry
+
+def parse_metalink(content: bytes, base_url: str = '') -> List[MetalinkFile]:
+    """Parse a Metalink 4 or 3 document into the files it describes"""
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError as e:
+        raise ValueError(f"Invalid Metalink XML: {e}") from e
+    namespace, name = _tag(root)
+    if name != 'metalink' or namespace not in (METALINK4_NS, METALINK3_NS):
+        raise ValueError(f"Not a Metalink document: {root.tag}")
+
+    if namespace == METALINK4_NS:
+        elements = _children(root, 'file')
+    else:
+        elements = [file for files in _children(root, 'files') for file in _children(files, 'file')]
+    return [_parse_file(element, 4 if namespace == METALINK4_NS else 3, base_url) for element in elements]
+
+def read_body(response: Any, limit: int) -> bytes:
+    """Read at most limit bytes of a response body"""
+    stream = body_stream(response)
+    content = bytearray()
+    buffer = bytearray(64 * 1024)
+    while len(content) < limit:
+        count = stream.readinto(buffer)
+        if not count:
+            break
+        content += buffer[:count]
+    return bytes(content[:limit])
+
+def fetch_metalink(url: str, filename: str, session: Any = None) -> Optional[MetalinkFile]:
+    """Download a Metalink and pick the entry for filename (or its only entry)"""
+    http = transport_for(url, session)
+    try:
+        response = http.get(url, stream=True, timeout=request_timeout(http))
+        try:
+            response.raise_for_status()
+            content = read_body(response, MAX_METALINK_SIZE + 1)
+        finally:
+            response.close()
+        if len(content) > MAX_METALINK_SIZE:
+            raise ValueError("Metalink is too large")
+        files = parse_metalink(content, url)
+    except (requests.exceptions.RequestException, IOError, ValueError) as e:
+        logger.warning(f"Could not load Metalink {url}: {e}")
+        return None
+
+    for entry in files:
+        if entry.name == filename or entry.name.rsplit('/', 1)[-1] == filename:
+            return entry
+    if len(files) == 1:
+        return files[0]
+    logger.warning(f"Metalink {url} does not describe {filename}")
+    return None
@@ -0,0 +1,192 @@
+"""
+Fastest-mirror ranking for Linux Distro Downloader
+
+The URL first listed for an edition is rarely the best one from every
+location. Before a download with several mirrors, each candidate is
+probed concurrently: a HEAD request opens (and keeps alive) a connection,
+then a small range request on it measures the round trip and a short burst
+of throughput. Probing is bounded by a deadline and a worker count, so a
+dead mirror costs at most the deadline. Rankings are cached on disk per
+network location (the local address used to reach the Internet) with a
+TTL, so the same network probes again only after it expires, and a laptop
+moving between networks is ranked for each.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from utils.atomic import write_json
+from utils.downloader import body_stream, transport_for
+from utils.http_client import close_response
+
+logger = logging.getLogger(__name__)
+
+PROBE_BYTES = 256 * 1024  # Enough to see past the first round trips without costing much
+PROBE_DEADLINE = 4.0  # Seconds for probing all mirrors; slower ones are ranked unmeasured
+PROBE_WORKERS = 8
+REFERENCE_SIZE = 64 * 1024 * 1024  # Mirrors are ranked by their estimated time to fetch this much
+RANKING_TTL = 6 * 3600
+FAILED_PROBE_TTL = 300.0  # A mirror that failed its probe is tried again sooner
+CACHE_VERSION = 1
+DEFAULT_CACHE_FILE = (Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache')
+                      / 'linux-distro-downloader' / 'mirrors.json')
+ROUTE_PROBE_ADDRESS = ('192.0.2.1', 9)  # TEST-NET-1; connecting a UDP socket sends nothing
+
+def network_id() -> str:
+    """Identify the network by the local address of the default route"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(ROUTE_PROBE_ADDRESS)
+            return sock.getsockname()[0]
+    except OSError:
+        return 'offline'
+
+def content_size(response: Any) -> int:
+    """Get the full file size from a range response, or from the length of a whole one"""
+    content_range = response.headers.get('Content-Range', '')
+    total = content_range.rpartition('/')[2]
+    if total.isdigit():
+        return int(total)
+    length = response.headers.get('Content-Length', '')
+    return int(length) if response.status_code == 200 and length.isdigit() else 0
+
+def probe_mirror(url: str, session: Any = None, probe_bytes: int = PROBE_BYTES,
+                 timeout: float = PROBE_DEADLINE) -> Dict[str, Any]:
+    """Measure the round trip and short-burst throughput of one mirror"""
+    result: Dict[str, Any] = {'url': url, 'ok': False, 'rtt': None, 'throughput': 0.0, 'size': 0, 'error': None}
+    http = transport_for(url, session)
+    deadline = time.monotonic() + timeout
+    try:
+        # Connection setup happens here, so the timed request below sees one round trip
+        http.head(url, allow_redirects=True, timeout=timeout).close()
+        started = time.monotonic()
+        response = http.get(url, stream=True, timeout=timeout, headers={'Range': f'bytes=0-{probe_bytes - 1}'})
+        try:
+            response.raise_for_status()
+            first_byte = time.monotonic()
+            stream = body_stream(response)
+            buffer = bytearray(64 * 1024)
+            received = 0
+            while received < probe_bytes and time.monotonic() < deadline:
+                count = stream.readinto(buffer)
+                if not count:
+                    break
+                received += count
+            elapsed = time.monotonic() - first_byte
+            result['size'] = content_size(response)
+        finally:
+            close_response(response)
+        result['rtt'] = first_byte - started
+        result['throughput'] = received / max(elapsed, 1e-6)
+        result['ok'] = received > 0
+    except (requests.exceptions.RequestException, IOError) as e:
+        result['error'] = str(e)
+    return result
+
+def estimated_time(probe: Dict[str, Any]) -> float:
+    """Seconds a mirror would take to deliver REFERENCE_SIZE, from its probe"""
+    return probe['rtt'] + REFERENCE_SIZE / probe['throughput'] if probe['throughput'] else float('inf')
+
+class MirrorRanker:
+    """Rank mirrors by probing them, caching results per network location"""
+
+    def __init__(self, cache_file: Optional[str] = None, ttl: float = RANKING_TTL,
+                 deadline: float = PROBE_DEADLINE, workers: int = PROBE_WORKERS, session: Any = None,
+                 probe: Optional[Callable[[str], Dict[str, Any]]] = None,
+                 network: Optional[Callable[[], str]] = None):
+        self.cache_file = Path(cache_file) if cache_file else DEFAULT_CACHE_FILE
+        self.ttl = ttl
+        self.deadline = deadline
+        self.workers = workers
+        self.probe = probe or (lambda url: probe_mirror(url, session, timeout=deadline))
+        self.network = network or network_id
+        self.networks: Dict[str, Dict[str, Dict[str, Any]]] = {}  # network -> url -> probe result
+        self._lock = threading.Lock()
+        self.load_cache()
+
+    def load_cache(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == CACHE_VERSION:
+                self.networks = data.get('networks', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable mirror ranking cache {self.cache_file}: {e}")
+
+    def save_cache(self):
+        with self._lock:
+            data = {'version': CACHE_VERSION, 'networks': {network: dict(probes)
+                                                           for network, probes in self.networks.items()}}
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            write_json(self.cache_file, data)
+        except OSError as e:
+            logger.warning(f"Could not save mirror ranking cache {self.cache_file}: {e}")
+
+    def cached(self, urls: List[str], network: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Get the probes of urls made on this network within the TTL"""
+        now = time.time()
+        with self._lock:
+            probes = self.networks.get(network or self.network(), {})
+            return {url: probes[url] for url in urls if url in probes
+                    and now - probes[url]['checked'] < (self.ttl if probes[url]['ok'] else FAILED_PROBE_TTL)}
+
+    def probe_all(self, urls: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Probe mirrors concurrently, giving up on those not done by the deadline"""
+        if not urls:
+            return {}
+        executor = ThreadPoolExecutor(max_workers=min(self.workers, len(urls)), thread_name_prefix='mirror-probe')
+        futures = {executor.submit(self.probe, url): url for url in urls}
+        done, pending = wait(futures, timeout=self.deadline)
+        # Probes still running end on their own timeout; nobody waits for them
+        executor.shutdown(wait=False, cancel_futures=True)
+        for future in pending:
+            logger.info(f"Mirror {futures[future]} did not answer within {self.deadline:.1f}s")
+        return {futures[future]: future.result() for future in done}
+
+    def rank(self, urls: List[str], refresh: bool = False) -> List[str]:
+        """Order mirrors fastest first
+
+        Only mirrors without a fresh probe on this network are probed.
+        Mirrors reporting a different file size than most, failing or not
+        answering in time go last, in their original order.
+        """
+        urls = list(dict.fromkeys(urls))
+        if len(urls) < 2:
+            return urls
+        network = self.network()
+        probes = {} if refresh else self.cached(urls, network)
+        stale = [url for url in urls if url not in probes]
+        if stale:
+            started = time.monotonic()
+            fresh = self.probe_all(stale)
+            now = time.time()
+            with self._lock:
+                stored = self.networks.setdefault(network, {})
+                for url, probe in fresh.items():
+                    stored[url] = dict(probe, checked=now)
+            probes.update(self.cached(list(fresh), network))
+            self.save_cache()
+            logger.info(f"Probed {len(stale)} mirrors in {time.monotonic() - started:.2f}s on network {network}")
+
+        sizes = [probe['size'] for probe in probes.values() if probe['ok'] and probe['size']]
+        size = max(set(sizes), key=sizes.count) if sizes else 0
+        usable = [url for url in urls if url in probes and probes[url]['ok']
+                  and (not size or probes[url]['size'] in (0, size))]
+        usable.sort(key=lambda url: estimated_time(probes[url]))
+        return usable + [url for url in urls if url not in usable]
+
+    def describe(self, url: str) -> Optional[Dict[str, Any]]:
+        """Get the latest probe of a mirror on this network, if any"""
+        return self.cached([url]).get(url)
@@ -0,0 +1,371 @@
+"""
+LAN mirror server for Linux Distro Downloader
+
+Serves the verified ISOs of the local store over HTTP so other instances
+on the network can use this one as their preferred mirror, and fetch each
+ISO through the WAN only once. Objects are addressed by their SHA-256
+(``/sha256/<checksum>/<filename>``, the file name being informational),
+which doubles as a strong ETag, so Range and If-Range requests resume
+safely. Bodies are sent with ``sendfile`` where the platform has it.
+
+The server is a read-through cache: a request for an ISO that is in the
+catalog but not in the store starts one upstream download, and every
+client asking for it meanwhile is served from that download as it
+arrives. The final byte is held back until the ISO has verified, so a
+client never completes a corrupt transfer; if the fill fails its clients'
+connections are closed and they fail over to their other mirrors.
+"""
+
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+from utils.data_manager import DistroDataManager
+from utils.downloader import RETRY_BUDGET, DownloadJob, RetryPolicy
+from utils.iso_store import ISOStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BIND = '0.0.0.0'
+DEFAULT_PORT = 8780
+OBJECT_PATH = re.compile(r'/sha256/([0-9a-fA-F]{64})(?:/[^/]*)?$')
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+FILL_WAIT_TIMEOUT = 60.0  # Seconds a client waits for an upstream fill to learn the file size
+FILL_POLL_INTERVAL = 0.25  # Clients of a fill also wake up this often without progress
+
+def mirror_url(base: str, checksum: str, filename: str = '') -> str:
+    """Get the URL of an ISO on a mirror server"""
+    url = f"{base.rstrip('/')}/sha256/{checksum.lower()}"
+    return f"{url}/{quote(filename)}" if filename else url
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Get the inclusive byte range a Range header asks for
+
+    Returns None for the whole file (no header, several ranges or a syntax
+    the server may ignore) and raises ValueError if the range lies beyond
+    the end of the file.
+    """
+    match = RANGE_PATTERN.match(header or '')
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    else:
+        start, end = max(0, size - int(match.group(2))), size - 1
+    if start > end:
+        raise ValueError(f"Range {header} is not satisfiable for {size} bytes")
+    return start, end
+
+def catalog_sources(manager: DistroDataManager) -> Dict[str, Dict[str, Any]]:
+    """Map the checksum of every edition to its file name and upstream URLs"""
+    sources = {}
+    for distro in manager.get_distributions():
+        for edition in manager.get_editions(distro):
+            info = manager.get_download_info(distro, edition)
+            sources.setdefault(info['checksum'].lower(), {'filename': info['filename'], 'urls': info['mirrors'],
+                                                          'distro': distro, 'edition': edition})
+    return sources
+
+class FillAborted(IOError):
+    """The upstream download a client was served from failed or started over"""
+
+class CacheFill:
+    """A cache miss being downloaded upstream, readable by every client while it arrives
+
+    Upstream URLs are tried in turn, each over a single connection so the
+    file grows from the start and clients can follow it. Starting over on
+    another URL bumps ``attempt``, which ends the transfers of clients
+    reading the previous one.
+    """
+
+    def __init__(self, checksum: str, urls: List[str], path: str, retries: int = RETRY_BUDGET,
+                 transport: Any = None):
+        self.checksum = checksum
+        self.urls = urls
+        self.path = path
+        self.retries = retries
+        self.transport = transport
+        self.job: Optional[DownloadJob] = None
+        self.attempt = 0
+        self.size = 0
+        self.done = False
+        self.ok = False
+        self.error = ''
+        self._changed = threading.Condition()
+
+    @property
+    def available(self) -> int:
+        """Bytes of the current attempt on disk, from the start of the file"""
+        return self.job.progress.downloaded if self.job else 0
+
+    def _progress(self, job: DownloadJob):
+        with self._changed:
+            if job is self.job:
+                self.size = job.progress.total_size
+            self._changed.notify_all()
+
+    def run(self, store: ISOStore) -> bool:
+        """Download, verify and add the ISO to the store"""
+        for url in self.urls:
+            job = DownloadJob(url, self.path, checksum=self.checksum, transport=self.transport,
+                              retry_policy=RetryPolicy(budget=self.retries), on_progress=self._progress)
+            with self._changed:
+                self.job = job
+                self.attempt += 1
+                self.size = 0
+                self._changed.notify_all()
+            if job.run():
+                break
+            self.error = job.error or "Download failed"
+            logger.warning(f"Could not fill {self.checksum} from {url}: {self.error}")
+            # A file that failed its checksum is never served
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        else:
+            with self._changed:
+                self.done = True
+                self._changed.notify_all()
+            return False
+
+        if store.add(self.path, self.checksum):
+            os.remove(self.path)
+            self.path = str(store.object_path(self.checksum))
+        else:
+            logger.warning(f"Could not add {self.checksum} to the ISO store, serving it from {self.path}")
+        with self._changed:
+            self.size = os.path.getsize(self.path)
+            self.done = self.ok = True
+            self._changed.notify_all()
+        return True
+
+    def wait_for_size(self, timeout: float = FILL_WAIT_TIMEOUT) -> int:
+        """Wait until the size of the file is known, returning 0 if the fill failed or took too long"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while not self.size and not self.done and time.monotonic() < deadline:
+                self._changed.wait(min(FILL_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+            return self.size
+
+    def open(self) -> Tuple[BinaryIO, int]:
+        """Open the file as it is being written, with the attempt it belongs to"""
+        with self._changed:
+            attempt, path = self.attempt, self.path
+        # The partial is renamed into place, then moved to the store, while clients read it
+        for candidate in (path + '.part', path, self.path):
+            try:
+                return open(candidate, 'rb'), attempt
+            except FileNotFoundError:
+                continue
+        raise FillAborted(f"Fill of {self.checksum} has no file to read")
+
+    def wait_for(self, position: int, attempt: int) -> int:
+        """Wait until bytes beyond position are readable, returning where they end
+
+        The last byte becomes readable only once the file has verified.
+        Raises FillAborted if the fill failed or started over.
+        """
+        with self._changed:
+            while True:
+                if self.attempt != attempt or (self.done and not self.ok):
+                    raise FillAborted(self.error or f"Fill of {self.checksum} started over")
+                limit = self.size if self.ok else min(self.available, self.size - 1)
+                if limit > position:
+                    return limit
+                self._changed.wait(FILL_POLL_INTERVAL)
+
+class MirrorRequestHandler(BaseHTTPRequestHandler):
+    """Serve store objects and in-flight fills with GET/HEAD and byte ranges"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'LinuxDistroDownloader'
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def send_empty(self, status: int, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def handle_request(self, send_body: bool):
+        match = OBJECT_PATH.match(urlparse(self.path).path)
+        if not match:
+            self.send_empty(404)
+            return
+        checksum = match.group(1).lower()
+        etag = f'"{checksum}"'
+        if self.headers.get('If-None-Match') in (etag, '*'):
+            self.send_empty(304, {'ETag': etag})
+            return
+
+        server: MirrorServer = self.server
+        source, fill, size = server.open_object(checksum), None, 0
+        if source is None:
+            fill = server.fill(checksum)
+            if fill is None:
+                self.send_empty(404)
+                return
+            size = fill.wait_for_size()
+            if not size:
+                self.send_empty(502 if fill.done else 504)
+                return
+            if fill.ok:
+                source, fill = server.open_object(checksum) or open(fill.path, 'rb'), None
+
+        try:
+            if source is not None:
+                size = os.fstat(source.fileno()).st_size
+            # Content-addressed, so the ETag is the only validator a client needs
+            range_header = self.headers.get('Range')
+            if self.headers.get('If-Range', etag) != etag:
+                range_header = None
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.send_empty(416, {'Content-Range': f'bytes */{size}', 'ETag': etag})
+                return
+            start, end = byte_range or (0, size - 1)
+
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            if not send_body:
+                return
+
+            sent = 0
+            try:
+                if source is not None:
+                    sent = self.connection.sendfile(source, start, end - start + 1)
+                else:
+                    sent = self.send_fill(fill, start, end)
+            except FillAborted as e:
+                logger.warning(f"Ending transfer of {checksum} to {self.address_string()}: {e}")
+                self.close_connection = True
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+            server.emit('served', client=self.client_address[0], checksum=checksum, bytes=sent,
+                        status=206 if byte_range else 200, cached=fill is None)
+        finally:
+            if source is not None:
+                source.close()
+
+    def send_fill(self, fill: CacheFill, start: int, end: int) -> int:
+        """Send a range of an in-flight fill as its bytes arrive"""
+        f, attempt = fill.open()
+        position = start
+        with f:
+            while position <= end:
+                limit = min(fill.wait_for(position, attempt), end + 1)
+                position += self.connection.sendfile(f, position, limit - position)
+        return position - start
+
+class MirrorServer(ThreadingHTTPServer):
+    """Serve the ISO store over HTTP, fetching catalog ISOs it lacks from upstream once
+
+    Without a ``manager`` only ISOs already in the store are served.
+    ``on_event`` gets fills starting and ending, and every transfer, as an
+    event name and its fields.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, store: ISOStore, manager: Optional[DistroDataManager] = None,
+                 address: Tuple[str, int] = (DEFAULT_BIND, DEFAULT_PORT), retries: int = RETRY_BUDGET,
+                 transport: Any = None, on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        super().__init__(address, MirrorRequestHandler)
+        self.store = store
+        self.sources = catalog_sources(manager) if manager else {}
+        self.retries = retries
+        self.transport = transport
+        self.on_event = on_event
+        self.incoming = store.root / 'incoming'  # Next to the objects, so filled ISOs are hardlinked in
+        self._fills: Dict[str, CacheFill] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL other instances use as their mirror server"""
+        host, port = self.server_address[:2]
+        if host in ('0.0.0.0', '::', ''):
+            host = socket.gethostname()
+        return f"http://{host}:{port}"
+
+    def emit(self, event: str, **fields: Any):
+        if self.on_event:
+            try:
+                self.on_event(event, fields)
+            except Exception as e:
+                logger.warning(f"Event callback failed: {e}")
+
+    def start(self) -> 'MirrorServer':
+        """Serve requests on a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Serving {self.store.root} at {self.url}")
+        return self
+
+    def stop(self):
+        """Stop serving; fills still running finish in the background"""
+        self.shutdown()
+        self.server_close()
+
+    def open_object(self, checksum: str) -> Optional[BinaryIO]:
+        """Open an ISO in the store, counting it as used"""
+        try:
+            f = open(self.store.object_path(checksum), 'rb')
+        except FileNotFoundError:
+            return None
+        self.store.touch(checksum)
+        return f
+
+    def fill(self, checksum: str) -> Optional[CacheFill]:
+        """Get the running fill of a catalog ISO, starting one if needed"""
+        source = self.sources.get(checksum)
+        if source is None:
+            return None
+        with self._lock:
+            fill = self._fills.get(checksum)
+            if fill is not None and not fill.done:
+                return fill
+            self.incoming.mkdir(parents=True, exist_ok=True)
+            fill = CacheFill(checksum, source['urls'], str(self.incoming / checksum), self.retries, self.transport)
+            self._fills[checksum] = fill
+        threading.Thread(target=self._run_fill, args=(fill, source), daemon=True).start()
+        return fill
+
+    def _run_fill(self, fill: CacheFill, source: Dict[str, Any]):
+        started = time.monotonic()
+        self.emit('fill_started', checksum=fill.checksum, distro=source['distro'], edition=source['edition'],
+                  url=fill.urls[0])
+        ok = fill.run(self.store)
+        seconds = round(time.monotonic() - started, 3)
+        if ok:
+            logger.info(f"Filled {source['filename']} ({fill.size} bytes) in {seconds}s")
+            self.emit('fill_completed', checksum=fill.checksum, file=source['filename'], bytes=fill.size,
+                      seconds=seconds)
+        else:
+            self.emit('fill_failed', checksum=fill.checksum, file=source['filename'], error=fill.error)
+        with self._lock:
+            if self._fills.get(fill.checksum) is fill:
+                del self._fills[fill.checksum]
@@ -0,0 +1,358 @@
+"""
+Multi-mirror download support for Linux Distro Downloader
+
+Downloads different byte ranges of the same file from several mirrors at
+once. Each mirror's throughput is measured continuously and idle fast
+mirrors steal the remaining part of ranges held by slower ones. A range
+whose mirror fails or stalls goes back to the queue for the others while
+the failed mirror backs off.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import requests
+
+from utils.downloader import (ByteRange, DownloadProgress, JobControl, StreamingHasher, TransferPaused,
+                              copy_stream, finish_part, preallocate, probe_download, request_timeout,
+                              transport_for)
+from utils.http_client import close_response
+from utils.part_state import PartState
+
+logger = logging.getLogger(__name__)
+
+RANGE_SIZE = 8 * 1024 * 1024  # Initial work unit handed to a mirror
+MIN_STEAL_SIZE = 1024 * 1024  # Ranges smaller than this are not split
+MAX_MIRROR_FAILURES = 3
+THROUGHPUT_ALPHA = 0.3  # Weight of the newest sample in the throughput EWMA
+SAMPLE_INTERVAL = 0.5
+
+class MirrorStats:
+    """Throughput statistics for a single mirror"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.bytes_downloaded = 0
+        self.throughput = 0.0  # Bytes per second, exponentially weighted
+        self.failures = 0
+        self.active = True
+        self._sample_bytes = 0
+        self._sample_start = time.monotonic()
+
+    def record(self, bytes_count: int):
+        """Record downloaded bytes and refresh the throughput estimate"""
+        self.bytes_downloaded += bytes_count
+        self._sample_bytes += bytes_count
+        now = time.monotonic()
+        elapsed = now - self._sample_start
+        if elapsed >= SAMPLE_INTERVAL:
+            sample = self._sample_bytes / elapsed
+            if self.throughput:
+                self.throughput = THROUGHPUT_ALPHA * sample + (1 - THROUGHPUT_ALPHA) * self.throughput
+            else:
+                self.throughput = sample
+            self._sample_bytes = 0
+            self._sample_start = now
+
+    def restart_sample(self):
+        """Start a new measurement window, e.g. after a new request"""
+        self._sample_bytes = 0
+        self._sample_start = time.monotonic()
+
+    def to_dict(self) -> Dict[str, object]:
+        """Summarise the statistics for logging and reporting"""
+        return {
+            'url': self.url,
+            'bytes': self.bytes_downloaded,
+            'throughput_mbps': self.throughput / (1024 * 1024),
+            'failures': self.failures,
+            'active': self.active
+        }
+
+class RangeScheduler:
+    """Hand out byte ranges to mirrors and rebalance them by throughput"""
+
+    def __init__(self, total_size: int, range_size: int = RANGE_SIZE,
+                 missing: Optional[List[Tuple[int, int]]] = None):
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.pending: Deque[ByteRange] = deque()
+        self.active: List[ByteRange] = []
+        self.closed = False
+
+        # Only the given inclusive ranges are fetched when resuming
+        for first, last in ([(0, total_size - 1)] if missing is None else missing):
+            for start in range(first, last + 1, range_size):
+                self.pending.append(ByteRange(start, min(start + range_size - 1, last), self.lock))
+
+    def next_range(self, mirror: MirrorStats) -> Optional[ByteRange]:
+        """Get the next range for a mirror, blocking until work or completion"""
+        with self.condition:
+            while not self.closed:
+                if self.pending:
+                    byte_range = self.pending.popleft()
+                elif not self.active:
+                    return None
+                else:
+                    byte_range = self._steal(mirror)
+
+                if byte_range:
+                    byte_range.owner = mirror
+                    self.active.append(byte_range)
+                    return byte_range
+
+                self.condition.wait(SAMPLE_INTERVAL)
+            return None
+
+    def _steal(self, thief: MirrorStats) -> Optional[ByteRange]:
+        """Split off the tail of the slowest active range held by a slower mirror"""
+        best = None
+        best_eta = 0.0
+        for byte_range in self.active:
+            owner = byte_range.owner
+            if owner is thief or byte_range.unfetched < MIN_STEAL_SIZE:
+                continue
+            if owner.throughput and thief.throughput <= owner.throughput:
+                continue
+            eta = byte_range.unfetched / owner.throughput if owner.throughput else float('inf')
+            if eta > best_eta:
+                best, best_eta = byte_range, eta
+
+        if best is None:
+            return None
+
+        # Give the thief a share of the unread bytes proportional to its speed
+        owner_speed = best.owner.throughput
+        share = thief.throughput / (thief.throughput + owner_speed) if owner_speed else 0.5
+        # The owner keeps enough that its read in progress is not wasted
+        stolen = max(MIN_STEAL_SIZE // 2, int(best.unfetched * share))
+        stolen = min(stolen, best.unfetched - MIN_STEAL_SIZE // 2)
+        split = best.end - stolen + 1
+
+        stolen_range = ByteRange(split, best.end, self.lock)
+        best.end = split - 1
+        logger.debug(f"{thief.url} stole bytes {split}-{stolen_range.end} from {best.owner.url}")
+        return stolen_range
+
+    def complete(self, byte_range: ByteRange):
+        """Mark a range as finished"""
+        with self.condition:
+            self.active.remove(byte_range)
+            self.condition.notify_all()
+
+    def release(self, byte_range: ByteRange):
+        """Return the unfinished part of a failed range to the queue"""
+        with self.condition:
+            self.active.remove(byte_range)
+            if byte_range.remaining:
+                retry = ByteRange(byte_range.pos, byte_range.end, self.lock)
+                self.pending.appendleft(retry)
+            self.condition.notify_all()
+
+    def close(self):
+        """Wake up and stop all waiting workers"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def completed_prefix(self, total_size: int) -> int:
+        """Get the length of the fully written prefix of the file"""
+        with self.lock:
+            starts = [r.pos for r in self.active] + [r.start for r in self.pending]
+            return min(starts) if starts else total_size
+
+    @property
+    def finished(self) -> bool:
+        with self.lock:
+            return not self.pending and not self.active
+
+class MultiMirrorDownloader:
+    """Download a file from several mirrors concurrently"""
+
+    def __init__(self, mirrors: List[str], filepath: str,
+                 connections_per_mirror: int = 1,
+                 control: Optional[JobControl] = None,
+                 progress: Optional[DownloadProgress] = None,
+                 session: Any = None,
+                 hasher: Optional[StreamingHasher] = None,
+                 state: Optional[PartState] = None):
+        self.mirrors = list(dict.fromkeys(mirrors))
+        self.filepath = filepath
+        self.part_path = filepath + ".part"
+        self.connections_per_mirror = max(1, connections_per_mirror)
+        self.control = control or JobControl()
+        self.session = session
+        self.hasher = hasher
+        self.stats: Dict[str, MirrorStats] = {}
+        self.progress = progress or DownloadProgress()
+        self.scheduler: Optional[RangeScheduler] = None
+        self.probes: Dict[str, Dict] = {}
+        self.state = state
+
+    def select_mirrors(self) -> int:
+        """Probe all mirrors and keep those serving the same file with ranges
+
+        Returns the file size, or 0 if no usable mirror was found.
+        """
+        with ThreadPoolExecutor(max_workers=len(self.mirrors) or 1) as executor:
+            probes = dict(zip(self.mirrors, executor.map(
+                lambda url: probe_download(url, self.session), self.mirrors)))
+
+        sizes = [info['size'] for info in probes.values() if info['accepts_ranges'] and info['size']]
+        if not sizes:
+            return 0
+        self.probes = probes
+
+        # Trust the size reported by most mirrors
+        total_size = max(set(sizes), key=sizes.count)
+        for url, info in probes.items():
+            if info['accepts_ranges'] and info['size'] == total_size:
+                self.stats[url] = MirrorStats(url)
+            else:
+                logger.warning(f"Skipping mirror {url}: size {info['size']}, ranges {info['accepts_ranges']}")
+        return total_size
+
+    def run(self) -> bool:
+        """Download the file, returning True on success
+
+        A given resume state limits the download to its missing ranges; on
+        failure the completed ranges are saved for the next attempt.
+        """
+        total_size = self.select_mirrors()
+        if not total_size:
+            logger.error("No mirror supports range requests for this file")
+            return False
+
+        primary = self.probes[self.mirrors[0]]
+        if self.state and not self.state.same_file(self.mirrors[0], total_size, primary['etag'],
+                                                   primary['last_modified']):
+            logger.warning("The file changed upstream since the partial download, starting over")
+            self.state = None
+        if self.state is None:
+            self.state = PartState(self.mirrors[0], total_size, primary['etag'], primary['last_modified'])
+        state = self.state
+
+        self.progress.reset(total_size, state.completed_bytes)
+        self.scheduler = RangeScheduler(total_size, missing=state.missing())
+        logger.info(f"Downloading from {len(self.stats)} mirrors: {', '.join(self.stats)}")
+
+        # The sidecar comes first: a full-size .part file without one would look complete
+        state.save(self.part_path)
+        preallocate(self.part_path, total_size)
+
+        def written_ranges() -> List[Tuple[int, int]]:
+            with self.scheduler.lock:
+                return [(r.start, r.pos) for r in self.scheduler.active]
+
+        stop = threading.Event()
+        checkpoint = threading.Thread(target=state.checkpoint, args=(self.part_path, written_ranges, stop),
+                                      daemon=True)
+        checkpoint.start()
+        if self.hasher:
+            follower = threading.Thread(
+                target=self.hasher.follow,
+                args=(self.part_path, lambda: self.scheduler.completed_prefix(total_size), stop),
+                daemon=True
+            )
+            follower.start()
+
+        workers = [mirror for mirror in self.stats.values() for _ in range(self.connections_per_mirror)]
+        try:
+            with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+                list(executor.map(self._worker, workers, range(len(workers))))
+        finally:
+            stop.set()
+            checkpoint.join()
+            if self.hasher:
+                follower.join()
+            for start, end in written_ranges():
+                state.add_range(start, end)
+
+        for mirror in self.stats.values():
+            logger.info(f"Mirror stats: {mirror.to_dict()}")
+
+        if self.control.is_cancelled() or not self.scheduler.finished:
+            # Keep what was downloaded so the next attempt only fetches the rest
+            state.save(self.part_path)
+            return False
+
+        finish_part(self.filepath)
+        return True
+
+    def _worker(self, mirror: MirrorStats, slot: int):
+        """Keep fetching ranges for one mirror connection until done"""
+        while mirror.active and not self.control.is_cancelled():
+            byte_range = self.scheduler.next_range(mirror)
+            if byte_range is None:
+                break
+
+            try:
+                if self._fetch(mirror, byte_range, slot):
+                    self.state.add_range(byte_range.start, byte_range.pos)
+                    self.scheduler.complete(byte_range)
+                    continue
+                error = "incomplete response"
+            except (requests.exceptions.RequestException, IOError) as e:
+                error = str(e)
+
+            self.state.add_range(byte_range.start, byte_range.pos)
+            self.scheduler.release(byte_range)
+            if self.control.is_cancelled():
+                break
+            mirror.failures += 1
+            logger.warning(f"Mirror {mirror.url} failed ({mirror.failures}): {error}")
+            self.control.emit('mirror_failed', url=mirror.url, failures=mirror.failures, error=error)
+            if mirror.failures >= MAX_MIRROR_FAILURES:
+                mirror.active = False
+                logger.warning(f"Disabling mirror {mirror.url}")
+                self.control.emit('mirror_disabled', url=mirror.url)
+            # The released range goes to another mirror meanwhile
+            elif not self.control.sleep(self.control.retry_policy.delay(mirror.failures - 1)):
+                break
+
+        # The last active mirror giving up must not leave others waiting forever
+        if not any(m.active for m in self.stats.values()) or self.control.is_cancelled():
+            self.scheduler.close()
+
+    def _fetch(self, mirror: MirrorStats, byte_range: ByteRange, slot: int) -> bool:
+        """Download one range, stopping early if its end is stolen
+
+        The connection is closed while the job is paused and the rest of
+        the range requested again on resume.
+        """
+        http = transport_for(mirror.url, self.session)
+
+        def written(offset: int, data: memoryview):
+            if self.hasher:
+                self.hasher.update(offset, data)
+            mirror.record(len(data))
+            self.progress.update(len(data), slot)
+
+        while self.control.wait_if_paused():
+            headers = {'Range': f'bytes={byte_range.pos}-{byte_range.end}'}
+            if_range = self.state.if_range(mirror.url)
+            if if_range:
+                headers['If-Range'] = if_range
+            response = http.get(mirror.url, stream=True, timeout=request_timeout(http), headers=headers)
+            mirror.restart_sample()
+            try:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    mirror.active = False
+                    logger.warning(f"Mirror {mirror.url} sent the whole file; it ignores ranges or the file changed")
+                    return False
+
+                # Unbuffered so the hash follower can read back completed bytes
+                with open(self.part_path, 'r+b', buffering=0) as f:
+                    if not copy_stream(response, f, byte_range, self.control, written):
+                        return False
+                return byte_range.remaining == 0
+            except TransferPaused:
+                pass
+            finally:
+                close_response(response)
+        return False
@@ -0,0 +1,239 @@
+"""
+Resume state for partial downloads
+
+Every ``.part`` file gets a JSON sidecar recording where it came from (URL,
+ETag, Last-Modified and size) and which byte ranges are already on disk,
+so an interrupted download can be resumed safely, even after the
+application has been restarted. Single-stream, segmented and multi-mirror
+downloads all use this one format.
+
+Completed bytes are stored as a bitmap of PART_BLOCK_SIZE blocks, which
+stays the same size however fragmented the download gets, plus the few
+fragments of blocks that are only partly written (at most two per range
+in flight), so nothing already on disk is fetched again.
+"""
+
+import base64
+import json
+import logging
+import os
+import threading
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from utils.atomic import write_json
+
+logger = logging.getLogger(__name__)
+
+STATE_SUFFIX = '.json'
+STATE_VERSION = 2  # Version 1 stored a list of ranges; those sidecars are still read
+PART_BLOCK_SIZE = 64 * 1024  # A 4 GB ISO needs an 8 KB bitmap, a few dozen bytes once compressed
+CHECKPOINT_INTERVAL = 2.0  # Seconds between sidecar saves during a transfer
+
+def state_path(part_path: str) -> str:
+    """Get the sidecar path for a ``.part`` file"""
+    return part_path + STATE_SUFFIX
+
+def response_validators(headers: Mapping[str, str]) -> Tuple[Optional[str], Optional[str]]:
+    """Get the ETag and Last-Modified validators from response headers"""
+    return headers.get('etag') or None, headers.get('last-modified') or None
+
+def merge_ranges(ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Sort and merge half-open byte ranges, dropping empty ones"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(r for r in ranges if r[1] > r[0]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def set_bits(bits: bytearray, first: int, last: int):
+    """Set bits [first, last) of a most-significant-bit-first bitmap, growing it as needed"""
+    needed = (last + 7) // 8
+    if len(bits) < needed:
+        bits.extend(bytes(needed - len(bits)))
+    while first < last and first % 8:
+        bits[first >> 3] |= 0x80 >> (first & 7)
+        first += 1
+    whole = (last - first) // 8
+    if whole > 0:
+        bits[first >> 3:(first >> 3) + whole] = b'\xff' * whole
+        first += whole * 8
+    while first < last:
+        bits[first >> 3] |= 0x80 >> (first & 7)
+        first += 1
+
+def encode_ranges(ranges: Iterable[Tuple[int, int]], size: int,
+                  block_size: int = PART_BLOCK_SIZE) -> Tuple[str, List[List[int]]]:
+    """Encode completed byte ranges as a bitmap of whole blocks and the leftover fragments
+
+    Bit i is set once block i is complete; the last block of a file of known
+    size is complete once written up to the end. The bitmap is compressed
+    with zlib and base64-encoded.
+    """
+    bits = bytearray()
+    fragments = []
+    blocks = (size + block_size - 1) // block_size
+    for start, end in merge_ranges(ranges):
+        first = -(-start // block_size)
+        last = blocks if size and end >= size else end // block_size
+        if first >= last:
+            fragments.append([start, end])
+            continue
+        if start < first * block_size:
+            fragments.append([start, first * block_size])
+        if end > last * block_size:
+            fragments.append([last * block_size, end])
+        set_bits(bits, first, last)
+    return base64.b64encode(zlib.compress(bytes(bits))).decode('ascii'), fragments
+
+def decode_ranges(bitmap: str, fragments: Iterable[Iterable[int]], size: int,
+                  block_size: int = PART_BLOCK_SIZE) -> List[Tuple[int, int]]:
+    """Get the completed byte ranges from an encoded bitmap and its fragments"""
+    runs: List[List[int]] = []
+
+    def add(first: int, last: int):
+        if runs and runs[-1][1] == first:
+            runs[-1][1] = last
+        else:
+            runs.append([first, last])
+
+    for index, byte in enumerate(zlib.decompress(base64.b64decode(bitmap))):
+        if byte == 0xFF:
+            add(index * 8, index * 8 + 8)
+        elif byte:
+            for bit in range(8):
+                if byte & (0x80 >> bit):
+                    add(index * 8 + bit, index * 8 + bit + 1)
+    ranges = [(first * block_size, min(last * block_size, size) if size else last * block_size)
+              for first, last in runs]
+    return merge_ranges(ranges + [tuple(fragment) for fragment in fragments])
+
+def remove_partial(filepath: str):
+    """Delete the ``.part`` file of a download and its sidecar"""
+    part_path = filepath + ".part"
+    for path in (part_path, state_path(part_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+class PartState:
+    """Origin and completed byte ranges of a ``.part`` file
+
+    Ranges are half-open ``(start, end)`` pairs of bytes known to be on disk.
+    The validators belong to ``url``; other mirrors of the same file are
+    only compared by size.
+    """
+
+    def __init__(self, url: str, size: int = 0, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None,
+                 ranges: Optional[Iterable[Tuple[int, int]]] = None):
+        self.url = url
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.ranges = merge_ranges(ranges or [])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, part_path: str) -> Optional['PartState']:
+        """Read the sidecar of a ``.part`` file, or None if missing or unreadable"""
+        path = state_path(part_path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            size = data.get('size', 0)
+            if data.get('version') == 1:
+                ranges = [tuple(r) for r in data.get('ranges', [])]
+            elif data.get('version') == STATE_VERSION:
+                ranges = decode_ranges(data['bitmap'], data.get('fragments', []), size, data['block_size'])
+            else:
+                logger.warning(f"Ignoring resume state with unknown version: {path}")
+                return None
+            return cls(data['url'], size, data.get('etag'), data.get('last_modified'), ranges)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, zlib.error) as e:
+            logger.warning(f"Ignoring unreadable resume state {path}: {e}")
+            return None
+
+    def save(self, part_path: str):
+        """Write the sidecar atomically"""
+        write_json(state_path(part_path), self.to_dict())
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            bitmap, fragments = encode_ranges(self.ranges, self.size)
+            return {
+                'version': STATE_VERSION,
+                'url': self.url,
+                'size': self.size,
+                'etag': self.etag,
+                'last_modified': self.last_modified,
+                'block_size': PART_BLOCK_SIZE,
+                'bitmap': bitmap,
+                'fragments': fragments
+            }
+
+    def add_range(self, start: int, end: int):
+        """Record bytes [start, end) as written"""
+        with self._lock:
+            self.ranges = merge_ranges(self.ranges + [(start, end)])
+
+    @property
+    def completed_bytes(self) -> int:
+        with self._lock:
+            return sum(end - start for start, end in self.ranges)
+
+    @property
+    def contiguous_prefix(self) -> int:
+        """Length of the completed prefix of the file"""
+        with self._lock:
+            return self.ranges[0][1] if self.ranges and self.ranges[0][0] == 0 else 0
+
+    def missing(self) -> List[Tuple[int, int]]:
+        """Get the inclusive byte ranges still to be downloaded"""
+        with self._lock:
+            gaps = []
+            position = 0
+            for start, end in self.ranges:
+                if start > position:
+                    gaps.append((position, start - 1))
+                position = max(position, end)
+            if position < self.size:
+                gaps.append((position, self.size - 1))
+            return gaps
+
+    def if_range(self, url: str) -> Optional[str]:
+        """Get an If-Range validator for a request to url, if one is known
+
+        Only strong ETags are usable; otherwise Last-Modified is sent.
+        """
+        if url != self.url:
+            return None
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def same_file(self, url: str, size: int, etag: Optional[str], last_modified: Optional[str]) -> bool:
+        """Check whether a server response still describes the partial file"""
+        if size and self.size and size != self.size:
+            return False
+        if url != self.url:
+            return True
+        if self.etag and etag:
+            return self.etag == etag
+        if self.last_modified and last_modified:
+            return self.last_modified == last_modified
+        return True
+
+    def checkpoint(self, part_path: str, written: Callable[[], Iterable[Tuple[int, int]]],
+                   stop: threading.Event, interval: float = CHECKPOINT_INTERVAL):
+        """Record in-progress ranges and save the sidecar until stop is set"""
+        while not stop.wait(interval):
+            for start, end in written():
+                self.add_range(start, end)
+            try:
+                self.save(part_path)
+            except OSError as e:
+                logger.warning(f"Could not save resume state for {part_path}: {e}")
@@ -0,0 +1,218 @@
+"""
+Piece hashes for Linux Distro Downloader
+
+A piece manifest lists the hash of every fixed-size piece of a file (as
+published in Metalink files). Pieces are checked while the download is
+hashed, so when the whole-file checksum fails only the corrupt pieces are
+fetched again instead of the entire ISO. Editions without published piece
+hashes get a manifest recorded the first time they verify (see
+utils/manifests.py).
+"""
+
+import hashlib
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from utils.downloader import ByteRange, DownloadProgress, JobControl, StreamingHasher, download_segment
+
+logger = logging.getLogger(__name__)
+
+def hash_name(hash_type: str) -> str:
+    """Map a Metalink hash type such as ``sha-256`` to its hashlib name"""
+    return hash_type.lower().replace('-', '')
+
+class PieceManifest:
+    """Hashes of the fixed-size pieces of a file
+
+    Every piece is ``piece_length`` bytes except the last. ``size`` may be
+    0 if unknown, in which case the last piece is checked at whatever
+    length it turns out to have.
+    """
+
+    def __init__(self, piece_length: int, hashes: Sequence[str], hash_type: str = 'sha-256', size: int = 0):
+        if piece_length <= 0:
+            raise ValueError(f"Invalid piece length: {piece_length}")
+        if hash_name(hash_type) not in hashlib.algorithms_available:
+            raise ValueError(f"Unsupported piece hash type: {hash_type}")
+        self.piece_length = piece_length
+        self.hashes = [digest.lower() for digest in hashes]
+        self.hash_type = hash_type
+        self.size = size
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def new_hash(self):
+        return hashlib.new(hash_name(self.hash_type))
+
+    def piece_range(self, index: int) -> Tuple[int, int]:
+        """Get the inclusive byte range of a piece"""
+        start = index * self.piece_length
+        end = start + self.piece_length - 1
+        if self.size:
+            end = min(end, self.size - 1)
+        return start, end
+
+    def piece_size(self, index: int) -> int:
+        start, end = self.piece_range(index)
+        return end - start + 1
+
+    def check_piece(self, filepath: str, index: int) -> bool:
+        """Hash one piece of a file and compare it with the manifest"""
+        start, end = self.piece_range(index)
+        piece = self.new_hash()
+        with open(filepath, 'rb') as f:
+            f.seek(start)
+            piece.update(f.read(end - start + 1))
+        return piece.hexdigest() == self.hashes[index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'piece_length': self.piece_length, 'hash_type': self.hash_type, 'size': self.size,
+                'hashes': self.hashes}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'PieceManifest':
+        return cls(data['piece_length'], data['hashes'], data.get('hash_type', 'sha-256'), data.get('size', 0))
+
+class PieceHasher(StreamingHasher):
+    """A StreamingHasher that also checks every piece against a manifest as it is hashed
+
+    The whole-file hash already sees every byte once and in order, so the
+    pieces are checked without reading anything more. ``bad_pieces`` holds
+    the indexes of pieces that did not match.
+    """
+
+    def __init__(self, manifest: PieceManifest):
+        super().__init__()
+        self.manifest = manifest
+        self.bad_pieces: List[int] = []
+        self._start_piece()
+
+    def _start_piece(self, index: int = 0):
+        self._piece_index = index
+        self._piece = self.manifest.new_hash()
+        self._piece_filled = 0
+
+    def reset(self):
+        super().reset()
+        with self._lock:
+            self.bad_pieces = []
+            self._start_piece()
+
+    def _consume(self, data: bytes):
+        super()._consume(data)
+        view = memoryview(data)
+        while view and self._piece_index < len(self.manifest):
+            take = min(len(view), self.manifest.piece_length - self._piece_filled)
+            self._piece.update(view[:take])
+            self._piece_filled += take
+            view = view[take:]
+            if self._piece_filled == self.manifest.piece_length:
+                self._finish_piece()
+
+    def _finish_piece(self):
+        index = self._piece_index
+        if self._piece.hexdigest() != self.manifest.hashes[index]:
+            logger.warning(f"Piece {index} does not match its hash")
+            self.bad_pieces.append(index)
+        self._start_piece(index + 1)
+
+    def finish(self) -> List[int]:
+        """Check the last, shorter piece once the whole file is hashed, and get the bad pieces"""
+        with self._lock:
+            if self._piece_filled and self._piece_index < len(self.manifest):
+                self._finish_piece()
+            # Pieces past the end of a short file are missing, so bad
+            return self.bad_pieces + list(range(self._piece_index, len(self.manifest)))
+
+class PieceRecorder(StreamingHasher):
+    """A StreamingHasher that also records the hash of every piece, to build a manifest
+
+    Used where no piece hashes are known yet: once the file has verified,
+    ``manifest()`` describes it for repairing later copies.
+    """
+
+    def __init__(self, piece_length: int, hash_type: str = 'sha-256'):
+        super().__init__()
+        self.piece_length = piece_length
+        self.hash_type = hash_type
+        self.hashes: List[str] = []
+        self._piece = hashlib.new(hash_name(hash_type))
+        self._piece_filled = 0
+
+    def reset(self):
+        super().reset()
+        with self._lock:
+            self.hashes = []
+            self._piece = hashlib.new(hash_name(self.hash_type))
+            self._piece_filled = 0
+
+    def _consume(self, data: bytes):
+        super()._consume(data)
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.piece_length - self._piece_filled)
+            self._piece.update(view[:take])
+            self._piece_filled += take
+            view = view[take:]
+            if self._piece_filled == self.piece_length:
+                self.hashes.append(self._piece.hexdigest())
+                self._piece = hashlib.new(hash_name(self.hash_type))
+                self._piece_filled = 0
+
+    def manifest(self) -> PieceManifest:
+        """Get the manifest of everything hashed so far"""
+        with self._lock:
+            hashes = self.hashes + ([self._piece.hexdigest()] if self._piece_filled else [])
+            return PieceManifest(self.piece_length, hashes, self.hash_type, self.position)
+
+def create_manifest(filepath: str, piece_length: int, hash_type: str = 'sha-256') -> Tuple[str, PieceManifest]:
+    """Hash a file once for both its SHA-256 and a piece manifest"""
+    recorder = PieceRecorder(piece_length, hash_type)
+    recorder.advance(filepath, os.path.getsize(filepath))
+    return recorder.hexdigest(), recorder.manifest()
+
+def find_bad_pieces(filepath: str, manifest: PieceManifest) -> List[int]:
+    """Hash a whole file piece by piece and get the pieces that do not match"""
+    hasher = PieceHasher(manifest)
+    try:
+        hasher.advance(filepath, os.path.getsize(filepath))
+    except OSError as e:
+        logger.error(f"Could not check pieces of {filepath}: {e}")
+        return list(range(len(manifest)))
+    return hasher.finish()
+
+def repair_pieces(filepath: str, manifest: PieceManifest, bad_pieces: Sequence[int], urls: Sequence[str],
+                  control: Optional[JobControl] = None, session: Any = None,
+                  progress: Optional[DownloadProgress] = None) -> bool:
+    """Fetch corrupt pieces of a file again, in place, from the first mirror that serves them correctly
+
+    Pieces are spread across the mirrors, so one bad mirror does not
+    corrupt them all again. Returns True once every piece matches.
+    """
+    control = control or JobControl()
+    progress = progress or DownloadProgress()
+    progress.reset(sum(manifest.piece_size(index) for index in bad_pieces))
+    for count, index in enumerate(bad_pieces):
+        start, end = manifest.piece_range(index)
+        candidates = list(urls[count % len(urls):]) + list(urls[:count % len(urls)])
+        for url in candidates:
+            if control.is_cancelled():
+                return False
+            try:
+                ok = download_segment(url, filepath, ByteRange(start, end), progress, control, session)
+            except (requests.exceptions.RequestException, IOError) as e:
+                logger.warning(f"Could not fetch piece {index} from {url}: {e}")
+                continue
+            if ok and manifest.check_piece(filepath, index):
+                logger.info(f"Repaired piece {index} (bytes {start}-{end}) from {url}")
+                control.emit('piece_repaired', piece=index, url=url, bytes=end - start + 1)
+                break
+            logger.warning(f"Piece {index} from {url} is still corrupt")
+        else:
+            logger.error(f"No mirror served a good copy of piece {index}")
+            return False
+    return True
@@ -0,0 +1,79 @@
+"""
+Connection warm-up and metadata prefetch for Linux Distro Downloader
+
+When an edition is selected its download server is probed in the
+background over the shared client. The HEAD request resolves the host,
+leaves a kept-alive connection in the pool and learns the file size,
+byte-range support and validators. The metadata is cached briefly, so a
+download started soon after skips both the handshake and the probe, and
+the size and free disk space can be shown before anything is fetched.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.downloader import probe_download
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_TTL = 120.0  # Short, so a download never trusts stale size or validators for long
+PREFETCH_WORKERS = 2
+
+class MetadataPrefetcher:
+    """Probe download URLs ahead of time and cache what the server reports"""
+
+    def __init__(self, ttl: float = PREFETCH_TTL, workers: int = PREFETCH_WORKERS,
+                 probe: Optional[Callable[[str], Dict[str, Any]]] = None):
+        self.ttl = ttl
+        self.probe = probe or probe_download
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._cache: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def cached(self, url: str) -> Optional[Dict[str, Any]]:
+        """Get metadata probed within the TTL, if any"""
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry and entry[1] > time.monotonic():
+                return dict(entry[0])
+        return None
+
+    def prefetch(self, url: str, callback: Optional[Callable[[Dict[str, Any]], None]] = None
+                 ) -> Optional[Dict[str, Any]]:
+        """Warm up the connection to a URL and learn its metadata
+
+        Returns the metadata immediately when cached, otherwise None, and
+        calls back from a worker thread once the probe has finished.
+        Concurrent prefetches of one URL share a single probe.
+        """
+        info = self.cached(url)
+        if info is not None:
+            return info
+
+        with self._lock:
+            future = self._pending.get(url)
+            if future is None:
+                future = self._executor.submit(self._probe, url)
+                self._pending[url] = future
+        if callback:
+            future.add_done_callback(lambda done: callback(done.result()))
+        return None
+
+    def _probe(self, url: str) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            info = self.probe(url)
+        except Exception as e:
+            logger.warning(f"Could not prefetch {url}: {e}")
+            info = {'size': 0, 'accepts_ranges': False, 'etag': None, 'last_modified': None}
+        with self._lock:
+            # Failed probes are not cached, so the download probes again itself
+            if info['size']:
+                self._cache[url] = (info, time.monotonic() + self.ttl)
+            self._pending.pop(url, None)
+        logger.debug(f"Prefetched {url} in {time.monotonic() - started:.3f}s: {info}")
+        return info
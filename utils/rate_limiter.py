@@ -0,0 +1,198 @@
+"""
+Bandwidth limiting for Linux Distro Downloader
+
+One token bucket is shared by every transfer, so the limit holds for the
+sum of all queued downloads and all segments and mirrors of each. Reads
+take their bytes from the bucket after they arrive and only wait once the
+bucket is in debt by more than a few milliseconds of transfer, which keeps
+the limit exact at high rates without sleeping per chunk. The rate can be
+changed while downloads run and may follow a time-of-day schedule (e.g.
+capped during business hours, full speed overnight).
+"""
+
+import datetime
+import logging
+import re
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BURST_TIME = 0.1  # Seconds of transfer a limited stream may take ahead of its rate
+MIN_WAIT = 0.005  # Shorter waits are skipped; the debt carries over to the next read
+WAIT_SLICE = 0.25  # Waiting transfers recheck for cancellation this often
+MIN_LIMITED_READ = 16 * 1024
+SCHEDULE_CHECK_INTERVAL = 1.0
+
+DAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+RATE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?\s*$', re.IGNORECASE)
+WINDOW_PATTERN = re.compile(r'^\s*(?:([a-z]{3}(?:-[a-z]{3})?(?:,[a-z]{3}(?:-[a-z]{3})?)*)\s+)?'
+                            r'(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})\s*=\s*(\S+)\s*$', re.IGNORECASE)
+UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+def parse_rate(text: str) -> float:
+    """Parse a rate such as ``500K``, ``2M`` or ``1.5MB/s`` into bytes per second
+
+    ``0``, ``off``, ``none`` and ``unlimited`` mean no limit (0).
+    """
+    if text.strip().lower() in ('', 'off', 'none', 'unlimited'):
+        return 0.0
+    match = RATE_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Invalid rate: {text!r}")
+    return float(match.group(1)) * UNITS[match.group(2).lower()]
+
+def format_rate(rate: float) -> str:
+    """Format bytes per second for display"""
+    if rate <= 0:
+        return "unlimited"
+    for unit in ['B/s', 'KB/s', 'MB/s']:
+        if rate < 1024:
+            return f"{rate:.0f} {unit}"
+        rate /= 1024
+    return f"{rate:.1f} GB/s"
+
+def parse_days(text: Optional[str]) -> Tuple[int, ...]:
+    """Parse ``Mon-Fri`` or ``Sat,Sun`` into weekday numbers (Monday is 0)"""
+    if not text:
+        return tuple(range(7))
+    days = set()
+    for part in text.lower().split(','):
+        first, _, last = part.partition('-')
+        day, end = DAYS.index(first), DAYS.index(last or first)
+        days.add(day)
+        while day != end:
+            day = (day + 1) % 7
+            days.add(day)
+    return tuple(sorted(days))
+
+class Schedule:
+    """Rates for time-of-day windows, e.g. ``Mon-Fri 09:00-18:00=2M; 18:00-09:00=off``
+
+    Windows may cross midnight, in which case their days are those on which
+    they start. The first matching window wins; outside every window the
+    limiter's own rate applies.
+    """
+
+    def __init__(self, windows: List[Tuple[Tuple[int, ...], int, int, float]]):
+        self.windows = windows  # (weekdays, start minute, end minute, bytes per second)
+
+    @classmethod
+    def parse(cls, text: str) -> 'Schedule':
+        windows = []
+        for entry in re.split(r'[;\n]', text):
+            if not entry.strip():
+                continue
+            match = WINDOW_PATTERN.match(entry)
+            if not match:
+                raise ValueError(f"Invalid schedule window: {entry.strip()!r}")
+            days, start_hour, start_minute, end_hour, end_minute, rate = match.groups()
+            try:
+                weekdays = parse_days(days)
+            except ValueError:
+                raise ValueError(f"Invalid days in schedule window: {entry.strip()!r}") from None
+            windows.append((weekdays, int(start_hour) * 60 + int(start_minute),
+                            int(end_hour) * 60 + int(end_minute), parse_rate(rate)))
+        return cls(windows)
+
+    def rate_at(self, when: datetime.datetime) -> Optional[float]:
+        """Get the scheduled rate at a local time, or None outside every window"""
+        minute = when.hour * 60 + when.minute
+        weekday = when.weekday()
+        for days, start, end, rate in self.windows:
+            if start <= end:
+                if weekday in days and start <= minute < end:
+                    return rate
+            elif (weekday in days and minute >= start) or ((weekday - 1) % 7 in days and minute < end):
+                return rate
+        return None
+
+class RateLimiter:
+    """A token bucket shared by all transfers, limiting their total rate
+
+    Uses the virtual-scheduling form of the bucket: one timestamp tracks
+    when the bytes taken so far are paid for, so taking bytes is a single
+    update under a lock and waiting transfers need no bookkeeping. Changing
+    the rate forgives any debt and wakes the waiting transfers.
+    """
+
+    def __init__(self, rate: float = 0.0, schedule: Optional[Schedule] = None):
+        self.base_rate = rate
+        self.schedule = schedule
+        self.rate = rate  # The rate in force now, from the schedule or base_rate
+        self._condition = threading.Condition()
+        self._paid_until = time.monotonic()
+        self._generation = 0
+        self._next_check = 0.0
+
+    @property
+    def limited(self) -> bool:
+        return self.rate > 0 or self.schedule is not None
+
+    def set_rate(self, rate: float):
+        """Change the rate outside scheduled windows (0 for unlimited)"""
+        with self._condition:
+            self.base_rate = rate
+            self._next_check = 0.0
+            self._refresh(time.monotonic())
+        logger.info(f"Download rate limit set to {format_rate(rate)}")
+
+    def set_schedule(self, schedule: Optional[Schedule]):
+        """Follow a time-of-day schedule, or stop following one given None"""
+        with self._condition:
+            self.schedule = schedule
+            self._next_check = 0.0
+            self._refresh(time.monotonic())
+
+    def _refresh(self, now: float):
+        """Apply the rate in force now; called with the condition held"""
+        if now < self._next_check:
+            return
+        self._next_check = now + SCHEDULE_CHECK_INTERVAL
+        rate = self.schedule.rate_at(datetime.datetime.now()) if self.schedule else None
+        rate = self.base_rate if rate is None else rate
+        if rate != self.rate:
+            self.rate = rate
+            self._paid_until = now
+            self._generation += 1
+            self._condition.notify_all()
+
+    def read_size(self, size: int) -> int:
+        """Cap a read so a limited transfer does not take bytes in large bursts"""
+        rate = self.rate
+        if rate <= 0:
+            return size
+        return min(size, max(MIN_LIMITED_READ, int(rate * BURST_TIME)))
+
+    def consume(self, count: int, control: Any = None) -> float:
+        """Take count bytes just read, waiting while the transfers are ahead of the rate
+
+        Returns the seconds waited. A control with ``is_cancelled()`` ends
+        the wait early.
+        """
+        if not self.limited:
+            return 0.0
+        with self._condition:
+            now = time.monotonic()
+            self._refresh(now)
+            if self.rate <= 0:
+                return 0.0
+            self._paid_until = max(self._paid_until, now) + count / self.rate
+            deadline = self._paid_until - BURST_TIME
+            if deadline - now < MIN_WAIT:
+                return 0.0
+            generation = self._generation
+            while generation == self._generation:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (control is not None and control.is_cancelled()):
+                    break
+                self._condition.wait(min(remaining, WAIT_SLICE))
+                self._refresh(time.monotonic())
+            return time.monotonic() - now
+
+_limiter = RateLimiter()
+
+def get_limiter() -> RateLimiter:
+    """Get the application-wide limiter shared by all downloads"""
+    return _limiter
@@ -0,0 +1,205 @@
+"""
+Server information lookups for Linux Distro Downloader
+
+Resolves download hosts on a background pool with a TTL cache and maps
+their addresses to countries with an offline IP range table, so showing
+where an ISO comes from never blocks the UI or repeats network traffic.
+
+The table is a compact little-endian binary file (see
+``scripts/build_geoip.py``) holding sorted range starts and ends as
+integer arrays. It is memory-mapped and searched with bisect.
+"""
+
+import bisect
+import ipaddress
+import json
+import logging
+import mmap
+import socket
+import struct
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TABLE_PATH = Path(__file__).parent.parent / 'data' / 'geoip.bin'
+TABLE_MAGIC = b'LDDGEO\x00\x01'
+HEADER = struct.Struct('<8sIII4x')  # magic, IPv4 ranges, IPv6 ranges, names length
+DNS_TTL = 300.0  # getaddrinfo does not expose record TTLs, so cache for a fixed time
+DNS_FAILURE_TTL = 30.0
+DNS_WORKERS = 4
+
+def country_flag(code: Optional[str]) -> str:
+    """Get the flag emoji for a two-letter country code"""
+    if not code or len(code) != 2 or not code.isalpha():
+        return '🏳️'
+    return ''.join(chr(0x1F1E6 + ord(letter) - ord('A')) for letter in code.upper())
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+def write_table(path: str, ipv4: Sequence[Tuple[int, int, str]], ipv6: Sequence[Tuple[int, int, str]],
+                names: Optional[Dict[str, str]] = None):
+    """Write sorted (start, end, country) ranges as a binary table
+
+    IPv6 ranges are stored by their upper 64 bits, which is the granularity
+    registries allocate at.
+    """
+    names_blob = json.dumps(names or {}, ensure_ascii=False).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(TABLE_MAGIC, len(ipv4), len(ipv6), len(names_blob)))
+        for ranges, code in ((ipv4, '<I'), (ipv6, '<Q')):
+            for column in (0, 1):
+                f.write(b''.join(struct.pack(code, r[column]) for r in ranges))
+                f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+            f.write(b''.join(r[2].upper().encode('ascii')[:2].ljust(2) for r in ranges))
+            f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+        f.write(names_blob)
+
+class GeoIPTable:
+    """Memory-mapped IP range to country table"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        magic, v4_count, v6_count, names_length = HEADER.unpack_from(view)
+        if magic != TABLE_MAGIC:
+            raise ValueError(f"Not an IP country table: {path}")
+
+        offset = HEADER.size
+        self.ipv4, offset = self._section(view, offset, v4_count, 'I', 4)
+        self.ipv6, offset = self._section(view, offset, v6_count, 'Q', 8)
+        self.names: Dict[str, str] = json.loads(bytes(view[offset:offset + names_length]).decode('utf-8'))
+
+    @staticmethod
+    def _section(view: memoryview, offset: int, count: int, code: str, width: int):
+        columns: List[Sequence[int]] = []
+        for _ in range(2):
+            column = view[offset:offset + count * width].cast(code)
+            if sys.byteorder != 'little':
+                column = array(code, column)
+                column.byteswap()
+            columns.append(column)
+            offset = _aligned(offset + count * width)
+        countries = view[offset:offset + count * 2]
+        return (columns[0], columns[1], countries), _aligned(offset + count * 2)
+
+    def lookup(self, ip: str) -> Optional[str]:
+        """Get the two-letter country code of an address, if known"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 4:
+            (starts, ends, countries), key = self.ipv4, int(address)
+        else:
+            (starts, ends, countries), key = self.ipv6, int(address) >> 64
+
+        index = bisect.bisect_right(starts, key) - 1
+        if index < 0 or key > ends[index]:
+            return None
+        return bytes(countries[index * 2:index * 2 + 2]).decode('ascii')
+
+    def country_name(self, code: Optional[str]) -> str:
+        if not code:
+            return 'Unknown'
+        return self.names.get(code, code)
+
+class DNSCache:
+    """Resolve host names on a thread pool, caching answers for a TTL"""
+
+    def __init__(self, ttl: float = DNS_TTL, workers: int = DNS_WORKERS,
+                 resolver: Optional[Callable[[str], str]] = None):
+        self.ttl = ttl
+        self.resolver = resolver or self._getaddrinfo
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dns')
+        self._cache: Dict[str, Tuple[Optional[str], float]] = {}
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _getaddrinfo(host: str) -> str:
+        return socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)[0][4][0]
+
+    def cached(self, host: str) -> Tuple[bool, Optional[str]]:
+        """Get (hit, address) from the cache; failed lookups are cached as None"""
+        with self._lock:
+            entry = self._cache.get(host)
+            if entry and entry[1] > time.monotonic():
+                return True, entry[0]
+        return False, None
+
+    def resolve(self, host: str) -> 'Future[Optional[str]]':
+        """Resolve a host in the background; concurrent calls share one lookup"""
+        hit, address = self.cached(host)
+        if hit:
+            future: Future = Future()
+            future.set_result(address)
+            return future
+
+        with self._lock:
+            if host in self._pending:
+                return self._pending[host]
+            future = self._executor.submit(self._resolve, host)
+            self._pending[host] = future
+            return future
+
+    def _resolve(self, host: str) -> Optional[str]:
+        try:
+            address, ttl = self.resolver(host), self.ttl
+        except OSError as e:
+            logger.warning(f"Could not resolve {host}: {e}")
+            address, ttl = None, DNS_FAILURE_TTL
+        with self._lock:
+            self._cache[host] = (address, time.monotonic() + ttl)
+            self._pending.pop(host, None)
+        return address
+
+class ServerInfoLookup:
+    """Domain, address and country of download servers, without blocking"""
+
+    def __init__(self, table_path: Optional[str] = None, dns: Optional[DNSCache] = None):
+        self.dns = dns or DNSCache()
+        self.table: Optional[GeoIPTable] = None
+        path = Path(table_path) if table_path else DEFAULT_TABLE_PATH
+        try:
+            self.table = GeoIPTable(str(path))
+        except (OSError, ValueError) as e:
+            logger.info(f"IP country table unavailable ({e}); countries will show as unknown")
+
+    def describe(self, domain: str, ip: Optional[str]) -> Dict[str, str]:
+        code = self.table.lookup(ip) if self.table and ip else None
+        return {
+            'domain': domain,
+            'ip': ip or 'Unknown',
+            'country_code': code or '',
+            'country_name': self.table.country_name(code) if self.table else 'Unknown',
+            'flag': country_flag(code)
+        }
+
+    def cached(self, url: str) -> Optional[Dict[str, str]]:
+        """Get server information straight away if the host is already resolved"""
+        domain = urlparse(url).hostname or ''
+        hit, ip = self.dns.cached(domain)
+        return self.describe(domain, ip) if hit else None
+
+    def lookup(self, url: str, callback: Callable[[Dict[str, str]], None]) -> Optional[Dict[str, str]]:
+        """Get server information, calling back from a worker thread if a lookup is needed
+
+        Returns the information immediately when cached, otherwise None.
+        """
+        info = self.cached(url)
+        if info is not None:
+            return info
+
+        domain = urlparse(url).hostname or ''
+        future = self.dns.resolve(domain)
+        future.add_done_callback(lambda done: callback(self.describe(domain, done.result())))
+        return None
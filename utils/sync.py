@@ -0,0 +1,262 @@
+"""
+Directory sync for Linux Distro Downloader
+
+Keeps a directory holding the current ISO of every edition in the catalog.
+The directory is compared with the catalog by filename, size and a cached
+checksum, giving a plan of files to fetch, keep, re-verify and (optionally)
+prune that can be shown without changing anything. Executing the plan
+downloads into a staging directory next to the files and renames each ISO
+into place only once it has verified, so the directory never holds a
+partial or unverified file. The checksum cache is keyed by size and
+modification time, so a rerun with nothing changed only stats the files.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.atomic import write_json
+from utils.data_manager import DistroDataManager
+from utils.download_queue import COMPLETED, DEFAULT_PER_HOST_LIMIT, DownloadQueue, QueueItem
+from utils.iso_store import ISOStore
+from utils.library import IMAGE_EXTENSIONS, create_pool, hash_file
+from utils.part_state import remove_partial
+
+logger = logging.getLogger(__name__)
+
+FETCH = 'fetch'
+KEEP = 'keep'
+VERIFY = 'verify'
+PRUNE = 'prune'
+
+SYNC_STATE_FILE = '.distro-sync.json'
+SYNC_STATE_VERSION = 1
+STAGING_DIR = '.distro-sync'  # Same file system as the ISOs, so moving them into place is a rename
+DEFAULT_SYNC_WORKERS = 2
+
+class SyncState:
+    """Checksums of the files in a synced directory, valid while their size and mtime are unchanged"""
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, SYNC_STATE_FILE)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == SYNC_STATE_VERSION:
+                self.files = data.get('files', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable sync state {self.path}: {e}")
+
+    def cached(self, filename: str, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+        """Get the cached entry of a file if it has not changed since it was hashed"""
+        entry = self.files.get(filename)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry
+        return None
+
+    def record(self, filename: str, path: str, checksum: str):
+        stat = os.stat(path)
+        self.files[filename] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                'sha256': checksum.lower(), 'checked': time.time()}
+
+    def save(self):
+        """Write the state atomically"""
+        try:
+            write_json(self.path, {'version': SYNC_STATE_VERSION, 'files': self.files})
+        except OSError as e:
+            logger.warning(f"Could not save sync state {self.path}: {e}")
+
+class SyncPlan:
+    """Actions that bring a directory in line with the catalog, and their results once executed"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.actions: List[Dict[str, Any]] = []
+        self.elapsed = 0.0
+
+    def add(self, action: str, filename: str, reason: str, **fields: Any) -> Dict[str, Any]:
+        entry = {'action': action, 'filename': filename, 'path': os.path.join(self.directory, filename),
+                 'reason': reason, 'status': None}
+        entry.update(fields)
+        self.actions.append(entry)
+        return entry
+
+    def of(self, action: str) -> List[Dict[str, Any]]:
+        return [entry for entry in self.actions if entry['action'] == action]
+
+    @property
+    def changes(self) -> bool:
+        """Whether executing the plan would change or hash anything"""
+        return any(entry['action'] != KEEP for entry in self.actions)
+
+    @property
+    def ok(self) -> bool:
+        return all(entry['status'] in (None, 'ok') for entry in self.actions)
+
+    def to_dict(self) -> Dict[str, Any]:
+        counts = {action: len(self.of(action)) for action in (FETCH, KEEP, VERIFY, PRUNE)}
+        return dict(counts, directory=self.directory,
+                    failed=sum(entry['status'] == 'failed' for entry in self.actions),
+                    seconds=round(self.elapsed, 3))
+
+def plan_sync(directory: str, manager: DistroDataManager, state: Optional[SyncState] = None,
+              prune: bool = False, reverify_after: Optional[float] = None) -> SyncPlan:
+    """Compare a directory with the catalog without changing anything
+
+    Editions whose file is missing or holds another checksum are fetched;
+    files whose cached checksum matches are kept; files never hashed, or
+    changed since, are re-verified, as are all files checked longer than
+    ``reverify_after`` seconds ago. With ``prune``, disk images that belong
+    to no edition are removed.
+    """
+    state = state or SyncState(directory)
+    plan = SyncPlan(directory)
+    now = time.time()
+    wanted: Dict[str, Dict[str, Any]] = {}
+    for distro in manager.get_distributions():
+        for edition in manager.get_editions(distro):
+            info = manager.get_download_info(distro, edition)
+            if info['filename'] in wanted:
+                logger.warning(f"{distro} {edition} shares the file name {info['filename']} "
+                               f"with another edition, syncing only the first")
+                continue
+            wanted[info['filename']] = dict(info, distro=distro, edition=edition)
+
+    for filename, info in wanted.items():
+        fields = {'distro': info['distro'], 'edition': info['edition'], 'checksum': info['checksum'].lower()}
+        try:
+            stat = os.stat(os.path.join(directory, filename))
+        except FileNotFoundError:
+            plan.add(FETCH, filename, 'missing', **fields)
+            continue
+        entry = state.cached(filename, stat)
+        if entry is None:
+            plan.add(VERIFY, filename, 'unhashed' if filename not in state.files else 'changed', **fields)
+        elif entry['sha256'] != fields['checksum']:
+            plan.add(FETCH, filename, 'outdated', **fields)
+        elif reverify_after is not None and now - entry.get('checked', 0) > reverify_after:
+            plan.add(VERIFY, filename, 'stale', **fields)
+        else:
+            plan.add(KEEP, filename, 'current', **fields)
+
+    if prune and os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename not in wanted and filename.lower().endswith(IMAGE_EXTENSIONS) \
+                    and os.path.isfile(os.path.join(directory, filename)):
+                plan.add(PRUNE, filename, 'not in catalog')
+    return plan
+
+def execute_sync(plan: SyncPlan, manager: DistroDataManager, state: Optional[SyncState] = None,
+                 store: Optional[ISOStore] = None, workers: int = DEFAULT_SYNC_WORKERS,
+                 connections: int = 1, per_host_limit: Optional[int] = None,
+                 on_item: Optional[Callable[[QueueItem], None]] = None,
+                 on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> SyncPlan:
+    """Carry out a sync plan, reporting each action as it finishes
+
+    Files to re-verify are hashed in a process pool; those that do not
+    match are fetched. Up to ``workers`` downloads run at once, each into
+    the staging directory and renamed into place once verified (or
+    provided from the store without downloading). ``on_item`` may set up
+    each download, e.g. its retry policy. Files are pruned only if every
+    fetch succeeded.
+    """
+    directory = plan.directory
+    state = state or SyncState(directory)
+    started = time.monotonic()
+
+    def finish(entry: Dict[str, Any], status: str, **fields: Any):
+        entry.update(fields, status=status)
+        if on_result:
+            on_result(entry)
+
+    for entry in plan.of(KEEP):
+        finish(entry, 'ok')
+
+    to_verify = plan.of(VERIFY)
+    if to_verify:
+        with create_pool(max(1, min(workers, len(to_verify)))) as pool:
+            futures = [(entry, pool.submit(hash_file, entry['path'])) for entry in to_verify]
+            for entry, future in futures:
+                try:
+                    _, digest, seconds, _ = future.result()
+                except (OSError, BrokenProcessPool) as e:
+                    # A worker killed mid-file breaks the pool; the files it still had fail too
+                    logger.error(f"Could not hash {entry['path']}: {e}")
+                    finish(entry, 'failed', error=str(e) or type(e).__name__)
+                    continue
+                if digest == entry['checksum']:
+                    state.record(entry['filename'], entry['path'], digest)
+                    finish(entry, 'ok', seconds=round(seconds, 3))
+                else:
+                    # Fetched into staging and swapped in, so the old file stays until then
+                    logger.warning(f"{entry['path']} does not match its checksum, fetching it again")
+                    entry.update(action=FETCH, reason='mismatch')
+        state.save()
+
+    staging = os.path.join(directory, STAGING_DIR)
+
+    def run(item: QueueItem) -> bool:
+        # Provided or downloaded next to the files, then swapped in by one rename
+        item.method = store.provision(item.filepath, item.checksum) if store else None
+        if not item.method:
+            if on_item:
+                on_item(item)
+            hasher = item.prepare()
+            if not item.download(hasher):
+                item.error = item.error or "Download failed"
+                return False
+            if not item.verify(hasher):
+                item.error = "Checksum verification failed"
+                return False
+            item.method = 'download'
+        target = os.path.join(directory, item.filename)
+        os.replace(item.filepath, target)
+        if store and item.method == 'download':
+            store.add(target, item.checksum)
+        return True
+
+    to_fetch = plan.of(FETCH)
+    if to_fetch:
+        os.makedirs(staging, exist_ok=True)
+        queue = DownloadQueue(run, max_concurrent=workers, per_host_limit=per_host_limit or DEFAULT_PER_HOST_LIMIT)
+        items = []
+        for entry in to_fetch:
+            info = manager.get_download_info(entry['distro'], entry['edition'])
+            items.append((entry, queue.add(entry['distro'], entry['edition'], staging, info, connections)))
+        queue.wait()
+        for entry, item in items:
+            if item.state == COMPLETED:
+                state.record(entry['filename'], entry['path'], entry['checksum'])
+                finish(entry, 'ok', method=getattr(item, 'method', None))
+            else:
+                finish(entry, 'failed', error=item.error or item.state)
+        state.save()
+        if all(item.state == COMPLETED for _, item in items):
+            shutil.rmtree(staging, ignore_errors=True)
+
+    to_prune = plan.of(PRUNE)
+    fetched = all(entry['status'] == 'ok' for entry in plan.of(FETCH))
+    for entry in to_prune:
+        if not fetched:
+            finish(entry, 'skipped', error="Not pruning while fetches failed")
+            continue
+        try:
+            os.remove(entry['path'])
+            remove_partial(entry['path'])
+            state.files.pop(entry['filename'], None)
+            finish(entry, 'ok')
+        except OSError as e:
+            finish(entry, 'failed', error=str(e))
+    if to_prune:
+        state.save()
+
+    plan.elapsed = time.monotonic() - started
+    logger.info(f"Synced {directory}: {plan.to_dict()}")
+    return plan
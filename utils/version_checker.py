@@ -0,0 +1,194 @@
+"""
+Latest version checking for Linux Distro Downloader
+
+Queries every distribution's release source concurrently over the shared
+keep-alive client. Results are kept in an on-disk cache: within its TTL they are
+returned without any network call, and after it expires sources are asked
+again with ETag/If-Modified-Since so unchanged pages cost a 304.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from utils.atomic import write_json
+from utils.http_client import get_client
+from utils.part_state import response_validators
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_TTL = 6 * 3600
+SOURCE_TIMEOUT = 10  # Seconds per source, so one slow site cannot hold up the rest
+MAX_WORKERS = 8
+CACHE_VERSION = 1
+DEFAULT_CACHE_FILE = (Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache')
+                      / 'linux-distro-downloader' / 'versions.json')
+
+def parse_ubuntu(response: requests.Response) -> Dict[str, str]:
+    """Newest current stable series from the Launchpad API"""
+    series = response.json()['entries']
+    current = [s for s in series if s['status'] == 'Current Stable Release'] or \
+              [s for s in series if s['status'] == 'Supported']
+    latest = max(current, key=lambda s: [int(part) for part in s['version'].split('.')])
+    return {'version': latest['version'], 'name': f"{latest['version']} ({latest['displayname']})",
+            'status': latest['status']}
+
+def parse_fedora(response: requests.Response) -> Dict[str, str]:
+    """Newest current Fedora release from the Bodhi API"""
+    releases = [r for r in response.json()['releases']
+                if r.get('id_prefix') == 'FEDORA' and r['version'].isdigit()]
+    latest = max(releases, key=lambda r: int(r['version']))
+    return {'version': latest['version'], 'name': f"Fedora {latest['version']}", 'status': latest['state']}
+
+def parse_mint(response: requests.Response) -> Dict[str, str]:
+    """Newest release named on the Linux Mint download page"""
+    releases = re.findall(r'Linux Mint (\d+(?:\.\d+)?) "(\w+)"', response.text)
+    version, codename = max(releases, key=lambda r: [int(part) for part in r[0].split('.')])
+    return {'version': version, 'name': f'{version} "{codename}"', 'status': 'stable'}
+
+def parse_release_file(response: requests.Response) -> Dict[str, str]:
+    """Version and codename from a Debian-style Release file"""
+    fields = dict(re.findall(r'^(\w+): (.*)$', response.text, re.MULTILINE))
+    return {'version': fields['Version'], 'name': f"{fields['Version']} ({fields['Codename']})",
+            'status': fields.get('Suite', 'stable')}
+
+def latest_directory(pattern: str, status: str, name: str) -> Callable[[requests.Response], Dict[str, str]]:
+    """Build a parser picking the highest version directory in a mirror listing"""
+    def parse(response: requests.Response) -> Dict[str, str]:
+        versions = set(re.findall(pattern, response.text))
+        version = max(versions, key=lambda v: [int(part) for part in v.split('.')])
+        return {'version': version, 'name': name.format(version=version), 'status': status}
+    return parse
+
+def parse_arch(response: requests.Response) -> Dict[str, str]:
+    """Latest monthly ISO from the Arch Linux release engineering API"""
+    version = response.json()['latest_version']
+    return {'version': version, 'name': version, 'status': 'rolling'}
+
+SOURCES: Dict[str, Tuple[str, Callable[[requests.Response], Dict[str, str]]]] = {
+    'Ubuntu': ('https://api.launchpad.net/devel/ubuntu/series', parse_ubuntu),
+    'Linux Mint': ('https://linuxmint.com/download.php', parse_mint),
+    'Fedora': ('https://bodhi.fedoraproject.org/releases/?state=current&rows_per_page=50', parse_fedora),
+    'Debian': ('https://deb.debian.org/debian/dists/stable/Release', parse_release_file),
+    'Kali Linux': ('https://http.kali.org/kali/dists/kali-rolling/Release', parse_release_file),
+    'CentOS Stream': ('https://mirror.stream.centos.org/',
+                      latest_directory(r'href="(\d+)-stream/"', 'current', 'Stream {version}')),
+    'openSUSE': ('https://download.opensuse.org/distribution/leap/',
+                 latest_directory(r'href="(?:\./)?(\d+\.\d+)/"', 'stable', 'Leap {version}')),
+    'Arch Linux': ('https://archlinux.org/releng/releases/json/', parse_arch),
+}
+
+class VersionChecker:
+    """Check the latest version of every distribution, with an on-disk cache"""
+
+    def __init__(self, cache_file: Optional[str] = None, ttl: float = VERSION_CACHE_TTL,
+                 session: Optional[requests.Session] = None,
+                 sources: Optional[Dict[str, Tuple[str, Callable]]] = None):
+        self.cache_file = Path(cache_file) if cache_file else DEFAULT_CACHE_FILE
+        self.ttl = ttl
+        self.session = session
+        self.sources = sources if sources is not None else SOURCES
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.load_cache()
+
+    def load_cache(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == CACHE_VERSION:
+                self.entries = data.get('entries', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable version cache {self.cache_file}: {e}")
+
+    def save_cache(self):
+        with self._lock:
+            data = {'version': CACHE_VERSION, 'entries': dict(self.entries)}
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            write_json(self.cache_file, data)
+        except OSError as e:
+            logger.warning(f"Could not save version cache {self.cache_file}: {e}")
+
+    def cached(self, include_stale: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Get cached results (only those within the TTL unless include_stale)"""
+        now = time.time()
+        with self._lock:
+            return {distro: entry['info'] for distro, entry in self.entries.items()
+                    if distro in self.sources and (include_stale or now - entry['checked'] < self.ttl)}
+
+    def check_all(self, distros: Optional[List[str]] = None, force: bool = False,
+                  on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Dict[str, Any]]:
+        """Get the latest version of each distribution, querying expired sources concurrently"""
+        distros = [d for d in (distros or list(self.sources)) if d in self.sources]
+        results = {} if force else {d: info for d, info in self.cached().items() if d in distros}
+        for distro, info in results.items():
+            if on_result:
+                on_result(distro, info)
+
+        pending = [d for d in distros if d not in results]
+        if not pending:
+            return results
+
+        session = self.session or get_client()
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(pending))) as executor:
+            futures = {executor.submit(self.check, distro, session): distro for distro in pending}
+            for future in as_completed(futures):
+                distro = futures[future]
+                info = future.result()
+                if info:
+                    results[distro] = info
+                    if on_result:
+                        on_result(distro, info)
+
+        self.save_cache()
+        return results
+
+    def check(self, distro: str, session: requests.Session) -> Optional[Dict[str, Any]]:
+        """Query one source, revalidating the cached answer where possible
+
+        On failure the last known (stale) result is returned, if any.
+        """
+        url, parse = self.sources[distro]
+        with self._lock:
+            entry = self.entries.get(distro)
+
+        headers = {}
+        if entry and entry.get('url') == url:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = session.get(url, headers=headers, timeout=SOURCE_TIMEOUT)
+            if response.status_code == 304 and entry:
+                logger.debug(f"{distro} version unchanged")
+                info = entry['info']
+            else:
+                response.raise_for_status()
+                info = dict(parse(response), checked=time.time())
+            etag, last_modified = response_validators(response.headers)
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Version check for {distro} failed: {e}")
+            return entry['info'] if entry else None
+
+        with self._lock:
+            self.entries[distro] = {
+                'url': url,
+                'info': info,
+                'checked': time.time(),
+                'etag': etag or (entry or {}).get('etag'),
+                'last_modified': last_modified or (entry or {}).get('last_modified')
+            }
+        return info